@@ -1,6 +1,6 @@
 # agents/agent_search.py
 from .base import Agent
-from pipelines.hybrid_retrieval import hybrid_search
+from pipelines.hybrid_retrieval import ahybrid_search
 
 MIN_CONFIDENCE = 1.2  # Ajuste ce seuil aprÃ¨s test terrain, 1.2/1.5/2 selon le modÃ¨le
 
@@ -12,7 +12,8 @@ class SearchAgent(Agent):
 
     async def run(self, question: str, context: dict) -> dict:
         top_k = context.get("top_k", 7)
-        search_results = hybrid_search(question, top_k=top_k)
+        # Recherches sémantique et mots-clés en parallèle, sans bloquer la boucle asyncio
+        search_results, timings = await ahybrid_search(question, top_k=top_k, filters=context.get("filters"))
 
         # Ajoute les scores arrondis pour l'UI
         for res in search_results:
@@ -26,7 +27,8 @@ class SearchAgent(Agent):
             return {
                 "answer": "Aucun passage rÃ©ellement pertinent nâ€™a Ã©tÃ© trouvÃ© dans vos documents.",
                 "sources": [],
-                "entities": {}
+                "entities": {},
+                "timings": timings
             }
 
         # Sinon, push dans le contexte pour extraction dâ€™entitÃ©s, synthÃ¨se, etc.
@@ -35,7 +37,8 @@ class SearchAgent(Agent):
         return {
             "answer": "RÃ©sultats rerankÃ©s et pertinents (mode SearchAgent)",
             "sources": search_results,
-            "entities": {}
+            "entities": {},
+            "timings": timings
         }
 
 
@@ -14,7 +14,7 @@ class SynthesisAgent(Agent):
         # top_k / user peuvent venir du context
         top_k = context.get("top_k", 5)
         user = context.get("user")
-        result = answer_with_rag(question, top_k=top_k, user=user)
+        result = answer_with_rag(question, top_k=top_k, user=user, filters=context.get("filters"))
         # MAJ context avec les sources pour exploitation par ExtractionAgent
         context["sources"] = result.get("sources", [])
         return result
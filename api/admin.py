@@ -1,7 +1,9 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 import csv
 import os
 
+from pipelines.model_registry import registry
+
 router = APIRouter()
 
 @router.get("/admin/feedback")
@@ -26,5 +28,14 @@ def get_auto_eval():
                 rows.append(row)
     return {"auto_eval": rows}
 
+@router.get("/admin/models")
+def get_models():
+    return {"models": registry.stats()}
 
-
+@router.post("/admin/models/{name}/unload")
+def unload_model(name: str):
+    try:
+        unloaded = registry.unload(name)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"model": name, "unloaded": unloaded}
@@ -0,0 +1,81 @@
+# api/documents.py
+import os
+import shutil
+import uuid
+from typing import List, Optional
+
+import aiofiles
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+
+from core.file_parser import SUPPORTED_FORMATS, get_extension
+from pipelines.ingest_jobs import job_manager
+
+router = APIRouter()
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(os.path.dirname(__file__), "../uploads"))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 200 * 1024 * 1024))
+
+
+async def _save_upload(upload: UploadFile, dest: str) -> int:
+    """Copie l'upload sur disque par blocs de 1 Mo (jamais le corps entier en mémoire)."""
+    size = 0
+    async with aiofiles.open(dest, "wb") as out:
+        while True:
+            block = await upload.read(UPLOAD_CHUNK_SIZE)
+            if not block:
+                break
+            size += len(block)
+            if size > MAX_UPLOAD_BYTES:
+                raise HTTPException(status_code=413, detail=f"{upload.filename} dépasse {MAX_UPLOAD_BYTES} octets")
+            await out.write(block)
+    return size
+
+
+@router.post("/api/documents", status_code=202)
+async def upload_documents(files: List[UploadFile] = File(...), doc_ids: Optional[List[str]] = Form(None)):
+    """
+    ``doc_ids`` (optionnel, un par fichier) : identifiants des documents. À
+    défaut, un document est identifié par son nom et un nouvel envoi du même
+    nom remplace le précédent.
+    """
+    for upload in files:
+        if get_extension(upload.filename or "") not in SUPPORTED_FORMATS:
+            raise HTTPException(status_code=415, detail=f"Format non supporté : {upload.filename}")
+    if doc_ids is not None and len(doc_ids) != len(files):
+        raise HTTPException(status_code=422, detail="doc_ids doit contenir un identifiant par fichier")
+    keys = doc_ids or [f"uploads/{os.path.basename(upload.filename)}" for upload in files]
+    if len(set(keys)) != len(keys):
+        raise HTTPException(status_code=422, detail="Deux fichiers de la requête portent le même identifiant")
+
+    workdir = os.path.join(UPLOAD_DIR, uuid.uuid4().hex)
+    os.makedirs(workdir, exist_ok=True)
+    saved = []
+    try:
+        for idx, upload in enumerate(files):
+            filename = os.path.basename(upload.filename)
+            # Préfixe d'index : deux uploads homonymes dans la même requête ne s'écrasent pas
+            dest = os.path.join(workdir, f"{idx}_{filename}")
+            size = await _save_upload(upload, dest)
+            saved.append({"path": dest, "filename": filename, "size": size, "doc_id": keys[idx]})
+    except Exception:
+        shutil.rmtree(workdir, ignore_errors=True)
+        raise
+    finally:
+        for upload in files:
+            await upload.close()
+
+    job_id = job_manager.submit(saved, workdir=workdir)
+    return {
+        "job_id": job_id,
+        "status_url": f"/api/documents/jobs/{job_id}",
+        "files": [{"filename": f["filename"], "size": f["size"], "doc_id": f["doc_id"]} for f in saved],
+    }
+
+
+@router.get("/api/documents/jobs/{job_id}")
+async def get_ingestion_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job inconnu")
+    return job
@@ -1,19 +1,32 @@
 from fastapi import FastAPI, HTTPException, Request
 from api.debug import router as debug_router
 from api.admin import router as admin_router       # <--- ADMIN
+from api.documents import router as documents_router
 from pydantic import BaseModel
 from orchestrator.orchestrator import Orchestrator
-from typing import Optional
+from typing import Any, Dict, Optional
 from core.logging import log_endpoint
 import time
 import asyncio
 from pathlib import Path
 from fastapi.responses import StreamingResponse, HTMLResponse
 from core import event_stream
+from pipelines.model_registry import MODEL_IDLE_UNLOAD_SEC, MODEL_WARMUP, registry
+from pipelines.keyword_search import get_keyword_searcher
+from pipelines.query_cache import query_cache
+from pipelines.rerank_service import get_rerank_service
+from pipelines.search_filters import normalize_filters
 
 app = FastAPI(title="SMA-RAG Ultimate")
 orch = Orchestrator()
 
+# ---------- Modèles (chargement anticipé + déchargement des inactifs) ----------
+@app.on_event("startup")
+async def warmup_models():
+    if MODEL_WARMUP:
+        await asyncio.to_thread(registry.warmup, MODEL_WARMUP)
+    registry.start_idle_reaper(MODEL_IDLE_UNLOAD_SEC)
+
 # ---------- METRICS (middleware + endpoint) ----------
 REQ_COUNT = 0
 REQ_ERRORS = 0
@@ -37,13 +50,18 @@ def get_metrics():
     return {
         "requests": REQ_COUNT,
         "errors": REQ_ERRORS,
-        "avg_time_sec": (TOTAL_TIME / REQ_COUNT) if REQ_COUNT else 0
+        "avg_time_sec": (TOTAL_TIME / REQ_COUNT) if REQ_COUNT else 0,
+        "query_embedding_cache": query_cache.stats(),
+        "keyword_search": get_keyword_searcher().stats(),
+        "reranker": get_rerank_service().stats(),
     }
 
 # ---------- Standard Query ----------
 class QueryRequest(BaseModel):
     question: str
     session_id: Optional[str] = "default"
+    # ex. {"ext": "pdf", "filename": ["a.pdf", "b.pdf"], "page": {"gte": 3}}
+    filters: Optional[Dict[str, Any]] = None
 
 @app.post("/api/query")
 @log_endpoint
@@ -52,9 +70,13 @@ async def query_endpoint(payload: QueryRequest):
         raise HTTPException(status_code=422, detail="La question ne peut pas Ãªtre vide")
 
     session_id = payload.session_id or "default"
+    try:
+        filters = normalize_filters(payload.filters)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
 
     # ----- AUTO-EVAL -----
-    result = await orch.handle(payload.question, session_id)
+    result = await orch.handle(payload.question, session_id, filters=filters)
     try:
         from pipelines.auto_eval import auto_eval_llm
         eval_result = auto_eval_llm(payload.question, result.get("answer", ""), result.get("sources", []))
@@ -97,7 +119,8 @@ def health():
 
 # ---------- Admin & Debug ----------
 app.include_router(debug_router)
-app.include_router(admin_router)     # /admin/feedback et /admin/auto_eval
+app.include_router(admin_router)     # /admin/feedback, /admin/auto_eval et /admin/models
+app.include_router(documents_router) # /api/documents (upload + jobs d'ingestion)
 
 
 # ---------- Event streaming ----------
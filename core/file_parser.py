@@ -1,7 +1,14 @@
 import os
 import io
+import time
+import atexit
 import logging
-from typing import Tuple, Dict, Optional
+import threading
+import multiprocessing.util
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Tuple, Dict, Iterator, Iterable, Optional
 
 import pdfplumber
 import docx
@@ -11,6 +18,8 @@ import xlrd
 import pytesseract
 from PIL import Image
 
+from core.ocr_cache import get_ocr_cache, image_cache_key
+
 try:
     import chardet  # Optionnel, mais conseillé !
     HAS_CHARDET = True
@@ -21,28 +30,60 @@ SUPPORTED_FORMATS = [
     "pdf", "docx", "doc", "txt", "xlsx", "xls", "png", "jpg", "jpeg"
 ]
 
+# Taille cible (en caractères) des blocs émis par iter_document_pages pour les
+# formats sans notion de page (txt, docx, doc...)
+TEXT_BLOCK_CHARS = int(os.getenv("PARSER_TEXT_BLOCK_CHARS", 8000))
+# Taille cible des blocs de lignes de tableur (en-tête répété inclus) ; chaque
+# bloc devient un chunk autonome
+SHEET_BLOCK_CHARS = int(os.getenv("PARSER_SHEET_BLOCK_CHARS", 500))
+
+# OCR des PDF scannés : rendu des pages et parallélisme
+OCR_DPI = int(os.getenv("OCR_DPI", 200))
+OCR_GRAYSCALE = os.getenv("OCR_GRAYSCALE", "1") == "1"
+OCR_LANG = os.getenv("OCR_LANG") or None  # None = langue par défaut de Tesseract
+OCR_CONFIG = os.getenv("OCR_CONFIG", "")
+# Pool OCR d'un document isolé (upload API, watcher) : 0 (défaut) = autant de
+# workers que de coeurs disponibles, 1 = OCR dans le processus courant.
+# L'ingestion par lots le plafonne, son pool de parsing occupant déjà les coeurs
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", 0))
+
 # Configure logging (toujours UTF-8)
 logging.basicConfig(level=logging.INFO, encoding='utf-8')
 
 def get_extension(filename):
     return filename.split(".")[-1].lower()
 
-def extract_text_and_metadata(filename: str, content: bytes) -> Tuple[Optional[str], Dict]:
+def extract_text_and_metadata(filename: str, content: bytes, ocr_workers: Optional[int] = None) -> Tuple[Optional[str], Dict]:
     ext = get_extension(filename)
     text, meta = None, {}
 
     try:
         if ext == "pdf":
-            with pdfplumber.open(io.BytesIO(content)) as pdf:
-                pages_text = [page.extract_text() or "" for page in pdf.pages]
-                text = "\n".join(pages_text)
-                meta = {"nb_pages": len(pdf.pages)}
-            # Fallback OCR si PDF scanné
-            if not text.strip():
-                from pdf2image import convert_from_bytes
-                pages = convert_from_bytes(content)
-                text = "\n".join([pytesseract.image_to_string(p.convert("RGB")) for p in pages])
+            # OCR sélectif et parallèle : seules les pages sans couche texte
+            # passent par Tesseract (cf. _iter_pdf_pages)
+            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+                tmp.write(content)
+            try:
+                pages_text, ocr_timings = [], []
+                for page_text, page_meta in _iter_pdf_pages(tmp.name, {}, ocr_workers=ocr_workers):
+                    pages_text.append(page_text)
+                    meta["nb_pages"] = page_meta["nb_pages"]
+                    if page_meta.get("ocr"):
+                        ocr_timings.append({
+                            "page": page_meta["page"],
+                            "seconds": page_meta["ocr_seconds"],
+                            "cache_hit": page_meta["ocr_cache_hit"],
+                        })
+            finally:
+                os.remove(tmp.name)
+            text = "\n".join(pages_text)
+            meta.setdefault("nb_pages", 0)
+            if ocr_timings:
                 meta["ocr"] = True
+                meta["ocr_pages"] = len(ocr_timings)
+                meta["ocr_timings"] = ocr_timings
+                meta["ocr_total_seconds"] = round(sum(t["seconds"] for t in ocr_timings), 3)
+                meta["ocr_cache_hits"] = sum(1 for t in ocr_timings if t["cache_hit"])
 
         elif ext == "docx":
             doc = docx.Document(io.BytesIO(content))
@@ -50,10 +91,13 @@ def extract_text_and_metadata(filename: str, content: bytes) -> Tuple[Optional[s
             meta["nb_paragraphs"] = len(doc.paragraphs)
 
         elif ext == "doc":
-            with open("temp_doc.doc", "wb") as f:
-                f.write(content)
-            text = docx2txt.process("temp_doc.doc")
-            os.remove("temp_doc.doc")
+            # Fichier temporaire unique : plusieurs parsings peuvent tourner en parallèle
+            with tempfile.NamedTemporaryFile(suffix=".doc", delete=False) as tmp:
+                tmp.write(content)
+            try:
+                text = docx2txt.process(tmp.name)
+            finally:
+                os.remove(tmp.name)
             meta["legacy_doc"] = True
 
         elif ext == "txt":
@@ -79,29 +123,20 @@ def extract_text_and_metadata(filename: str, content: bytes) -> Tuple[Optional[s
                         text = content.decode("utf-8", errors="replace")
                         meta["encoding_fallback"] = "utf-8-replace"
 
-        elif ext == "xlsx":
-            wb = openpyxl.load_workbook(io.BytesIO(content))
-            text = ""
-            for sheet in wb.worksheets:
-                for row in sheet.iter_rows(values_only=True):
-                    row_str = " ".join([str(cell) for cell in row if cell is not None])
-                    if row_str.strip():
-                        text += row_str + "\n"
-            meta["nb_sheets"] = len(wb.worksheets)
-
-        elif ext == "xls":
-            wb = xlrd.open_workbook(file_contents=content)
-            text = ""
-            for sheet in wb.sheets():
-                for row_idx in range(sheet.nrows):
-                    row_str = " ".join([str(cell) for cell in sheet.row_values(row_idx) if cell is not None])
-                    if row_str.strip():
-                        text += row_str + "\n"
-            meta["nb_sheets"] = len(wb.sheets())
+        elif ext in ("xlsx", "xls"):
+            # Lecture en flux (read-only / on_demand) et join final : linéaire
+            sheet_names, rows = _iter_sheet_rows(io.BytesIO(content) if ext == "xlsx" else content, ext)
+            lines = []
+            for _, _, row in rows:
+                row_str = " ".join([str(cell) for cell in row if cell is not None])
+                if row_str.strip():
+                    lines.append(row_str + "\n")
+            text = "".join(lines)
+            meta["nb_sheets"] = len(sheet_names)
 
         elif ext in ["jpg", "jpeg", "png"]:
             image = Image.open(io.BytesIO(content)).convert("RGB")
-            text = pytesseract.image_to_string(image)
+            text, meta["ocr_cache_hit"] = ocr_image(image)
             meta["img_size"] = image.size
 
         else:
@@ -115,3 +150,304 @@ def extract_text_and_metadata(filename: str, content: bytes) -> Tuple[Optional[s
     meta["filename"] = filename
     meta["ext"] = ext
     return text, meta
+
+
+# ---------------------------------------------------------------------------
+# API streaming : une page (PDF) ou un bloc de texte à la fois
+# ---------------------------------------------------------------------------
+
+def _iter_line_blocks(lines: Iterable[str], max_chars: int = TEXT_BLOCK_CHARS) -> Iterator[str]:
+    """Regroupe des lignes en blocs d'environ ``max_chars``, coupés de préférence entre deux paragraphes."""
+    block, size = [], 0
+    for line in lines:
+        line = line.rstrip("\r\n")
+        at_boundary = not line.strip()
+        if block and size >= max_chars and (at_boundary or size >= 2 * max_chars):
+            yield "\n".join(block)
+            block, size = [], 0
+            if at_boundary:
+                continue
+        block.append(line)
+        size += len(line) + 1
+    if block and "".join(block).strip():
+        yield "\n".join(block)
+
+
+def _detect_file_encoding(path: str, sample_size: int = 64 * 1024) -> str:
+    with open(path, "rb") as f:
+        sample = f.read(sample_size)
+    if HAS_CHARDET:
+        return chardet.detect(sample)["encoding"] or "utf-8"
+    try:
+        sample.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError as e:
+        # Un caractère multi-octets coupé en fin d'échantillon n'est pas une vraie erreur
+        return "utf-8" if e.start >= len(sample) - 3 else "latin-1"
+
+
+def ocr_image(image) -> Tuple[str, bool]:
+    """
+    OCR Tesseract d'une image PIL, via le cache disque (cf. :mod:`core.ocr_cache`).
+    Retourne ``(texte, hit)``.
+    """
+    cache = get_ocr_cache()
+    if cache is None:
+        return pytesseract.image_to_string(image, lang=OCR_LANG, config=OCR_CONFIG), False
+    key = image_cache_key(image, OCR_LANG, OCR_CONFIG)
+    text = cache.get(key)
+    if text is not None:
+        return text, True
+    text = pytesseract.image_to_string(image, lang=OCR_LANG, config=OCR_CONFIG)
+    cache.put(key, text)
+    return text, False
+
+
+def _iter_sheet_rows(source, ext: str):
+    """
+    Ouvre un classeur en mode flux et renvoie ``(noms_des_feuilles, lignes)``,
+    ``lignes`` étant un générateur de ``(feuille, numéro_de_ligne, valeurs)``.
+    ``source`` : chemin, ou contenu (``BytesIO`` pour xlsx, ``bytes`` pour xls).
+    """
+    if ext == "xlsx":
+        wb = openpyxl.load_workbook(source, read_only=True, data_only=True)
+        sheet_names = list(wb.sheetnames)
+
+        def rows():
+            try:
+                for sheet in wb.worksheets:
+                    for row_idx, row in enumerate(sheet.iter_rows(values_only=True), start=1):
+                        yield sheet.title, row_idx, row
+            finally:
+                wb.close()
+    else:
+        if isinstance(source, (bytes, bytearray)):
+            wb = xlrd.open_workbook(file_contents=source, on_demand=True)
+        else:
+            wb = xlrd.open_workbook(source, on_demand=True)
+        sheet_names = wb.sheet_names()
+
+        def rows():
+            try:
+                for name in sheet_names:
+                    sheet = wb.sheet_by_name(name)
+                    for row_idx in range(sheet.nrows):
+                        yield name, row_idx + 1, sheet.row_values(row_idx)
+                    wb.unload_sheet(name)
+            finally:
+                wb.release_resources()
+
+    return sheet_names, rows()
+
+
+def _format_row(row) -> str:
+    cells = ["" if cell is None else str(cell).strip() for cell in row]
+    while cells and not cells[-1]:
+        cells.pop()
+    return " | ".join(cells)
+
+
+def iter_spreadsheet_blocks(path: str, base_meta: Dict, max_chars: int = SHEET_BLOCK_CHARS) -> Iterator[Tuple[str, Dict]]:
+    """
+    Lit un classeur xlsx/xls en flux et produit des blocs de lignes d'environ
+    ``max_chars`` caractères. La première ligne non vide de chaque feuille sert
+    d'en-tête et est répétée en tête de chaque bloc, pour que chaque chunk
+    reste lisible isolément.
+    """
+    sheet_names, rows = _iter_sheet_rows(path, base_meta["ext"])
+    current_sheet, header = None, None
+    block, size, row_start, row_end = [], 0, None, None
+
+    def emit():
+        meta = {
+            **base_meta,
+            "block_type": "table",
+            "sheet": current_sheet,
+            "row_start": row_start,
+            "row_end": row_end,
+            "nb_sheets": len(sheet_names),
+        }
+        return "\n".join([header] + block), meta
+
+    for sheet, row_idx, row in rows:
+        if sheet != current_sheet:
+            if block:
+                yield emit()
+            current_sheet, header, block, size = sheet, None, [], 0
+        line = _format_row(row)
+        if not line.replace("|", "").strip():
+            continue
+        if header is None:
+            header = line
+            continue
+        if block and size + len(line) + len(header) >= max_chars:
+            yield emit()
+            block, size = [], 0
+        if not block:
+            row_start = row_idx
+        block.append(line)
+        size += len(line) + 1
+        row_end = row_idx
+    if block:
+        yield emit()
+
+
+def available_cpus() -> int:
+    """Coeurs réellement utilisables par le processus (affinité CPU comprise)."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+_OCR_POOLS: Dict[int, ProcessPoolExecutor] = {}
+_OCR_POOLS_LOCK = threading.Lock()
+
+
+def _get_ocr_pool(workers: int) -> ProcessPoolExecutor:
+    with _OCR_POOLS_LOCK:
+        if workers not in _OCR_POOLS:
+            _OCR_POOLS[workers] = ProcessPoolExecutor(max_workers=workers)
+        return _OCR_POOLS[workers]
+
+
+@atexit.register
+def shutdown_ocr_pools() -> None:
+    """Arrête les pools OCR (appelé à la sortie du processus ; le prochain OCR les recrée)."""
+    with _OCR_POOLS_LOCK:
+        pools = list(_OCR_POOLS.values())
+        _OCR_POOLS.clear()
+    for pool in pools:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+# Les workers multiprocessing (pool "parse" de l'ingestion) ne lancent pas les
+# handlers atexit à leur sortie, mais bien les finaliseurs de multiprocessing
+multiprocessing.util.Finalize(None, shutdown_ocr_pools, exitpriority=10)
+
+
+def _ocr_pdf_page(path: str, page_number: int, dpi: int = OCR_DPI, grayscale: bool = OCR_GRAYSCALE) -> Tuple[str, float, bool]:
+    """
+    Rend une seule page (``dpi``, niveaux de gris optionnels) puis l'OCRise.
+    Retourne ``(texte, secondes, hit_cache)``. Exécutable dans un worker du pool OCR.
+    """
+    from pdf2image import convert_from_path
+    t0 = time.perf_counter()
+    images = convert_from_path(
+        path, dpi=dpi, first_page=page_number, last_page=page_number,
+        grayscale=grayscale, thread_count=1,
+    )
+    try:
+        texts, all_hits = [], True
+        for img in images:
+            if not grayscale:
+                img = img.convert("RGB")
+            text, hit = ocr_image(img)
+            texts.append(text)
+            all_hits = all_hits and hit
+        return "\n".join(texts), time.perf_counter() - t0, all_hits
+    finally:
+        for img in images:
+            img.close()
+
+
+def _iter_pdf_pages(path: str, base_meta: Dict, ocr_workers: Optional[int] = None) -> Iterator[Tuple[str, Dict]]:
+    """
+    Pages d'un PDF dans l'ordre. Les pages sans couche texte sont OCRisées dans
+    un pool de processus ; une fenêtre glissante garde au plus ``2 * workers``
+    pages en vol pour que la mémoire reste bornée.
+    """
+    workers = ocr_workers if ocr_workers is not None else OCR_WORKERS
+    workers = workers or available_cpus()
+    pool = _get_ocr_pool(workers) if workers > 1 else None
+    window = deque()  # [texte, meta, future|None]
+
+    def resolve(entry):
+        text, meta, future = entry
+        if future is not None:
+            text, seconds, hit = future.result()
+            meta["ocr_seconds"] = round(seconds, 3)
+            meta["ocr_cache_hit"] = hit
+        return text, meta
+
+    with pdfplumber.open(path) as pdf:
+        nb_pages = len(pdf.pages)
+        for page_number, page in enumerate(pdf.pages, start=1):
+            text = page.extract_text() or ""
+            # Libère les objets parsés de la page (chars, layout...) avant la suivante
+            if hasattr(page, "close"):
+                page.close()
+            else:
+                page.flush_cache()
+            meta = {**base_meta, "page": page_number, "nb_pages": nb_pages}
+            future = None
+            if not text.strip():
+                # Page scannée : OCR de cette page uniquement
+                meta["ocr"] = True
+                if pool is None:
+                    text, seconds, hit = _ocr_pdf_page(path, page_number)
+                    meta["ocr_seconds"] = round(seconds, 3)
+                    meta["ocr_cache_hit"] = hit
+                else:
+                    future = pool.submit(_ocr_pdf_page, path, page_number, OCR_DPI, OCR_GRAYSCALE)
+            window.append((text, meta, future))
+            while window and (window[0][2] is None or window[0][2].done() or len(window) > 2 * workers):
+                yield resolve(window.popleft())
+        while window:
+            yield resolve(window.popleft())
+
+
+def iter_document_pages(path: str, filename: Optional[str] = None, ocr_workers: Optional[int] = None) -> Iterator[Tuple[str, Dict]]:
+    """
+    Parse ``path`` de façon incrémentale et produit des couples ``(texte, meta)`` :
+    une page pour les PDF (``meta["page"]``), un bloc de paragraphes pour les
+    formats texte (``meta["block"]``).  La mémoire utilisée est bornée par une
+    page/un bloc, pas par le document entier.
+
+    ``ocr_workers`` borne le pool OCR des PDF scannés (défaut : ``OCR_WORKERS``,
+    soit tous les coeurs disponibles). Contrairement à :func:`extract_text_and_metadata`,
+    les erreurs sont levées.
+    """
+    filename = filename or os.path.basename(path)
+    ext = get_extension(filename)
+    base_meta = {"filename": filename, "ext": ext}
+
+    if ext == "pdf":
+        yield from _iter_pdf_pages(path, base_meta, ocr_workers=ocr_workers)
+        return
+
+    if ext == "txt":
+        enc = _detect_file_encoding(path)
+        with open(path, encoding=enc, errors="replace") as f:
+            blocks = _iter_line_blocks(f)
+            for idx, block in enumerate(blocks):
+                yield block, {**base_meta, "block": idx, "encoding_used": enc}
+        return
+
+    if ext == "docx":
+        doc = docx.Document(path)
+        lines = (p.text for p in doc.paragraphs if p.text.strip())
+        for idx, block in enumerate(_iter_line_blocks(lines)):
+            yield block, {**base_meta, "block": idx, "nb_paragraphs": len(doc.paragraphs)}
+        return
+
+    if ext == "doc":
+        text = docx2txt.process(path)
+        for idx, block in enumerate(_iter_line_blocks(text.splitlines())):
+            yield block, {**base_meta, "block": idx, "legacy_doc": True}
+        return
+
+    if ext in ("xlsx", "xls"):
+        for idx, (block, meta) in enumerate(iter_spreadsheet_blocks(path, base_meta)):
+            yield block, {**meta, "block": idx}
+        return
+
+    if ext in SUPPORTED_FORMATS:
+        # Images : pas de découpage natif, un seul bloc
+        with open(path, "rb") as f:
+            text, meta = extract_text_and_metadata(filename, f.read())
+        if text is None:
+            raise ValueError(meta.get("error", "Extraction impossible"))
+        yield text, {**meta, "block": 0}
+        return
+
+    raise ValueError(f"Format non supporté : {filename}")
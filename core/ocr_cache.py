@@ -0,0 +1,181 @@
+# core/ocr_cache.py
+
+"""Persistent cache of OCR results.
+
+Scanned letterheads, annexes and signature pages recur across thousands of
+documents.  ``OCRCache`` stores Tesseract output on disk, keyed by a hash of
+the rendered image (mode, size and pixel bytes) plus the OCR language and
+config, so an identical page is only OCRed once across ingests and reindexes.
+
+The cache is a SQLite file shared by every process (OCR runs in process
+pools).  Its total text size is capped: when a write exceeds the cap, the
+least recently used entries are evicted.  Lookups do not write: access times
+are buffered in memory and applied with the next write, and hit/miss/eviction
+counters are those of the process.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+OCR_CACHE_ENABLED = os.getenv("OCR_CACHE_ENABLED", "1") == "1"
+OCR_CACHE_PATH = os.getenv(
+    "OCR_CACHE_PATH",
+    os.path.join(os.path.dirname(__file__), "../ocr_cache.db"),
+)
+OCR_CACHE_MAX_BYTES = int(os.getenv("OCR_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+# Dates d'accès gardées en mémoire avant d'être écrites (sinon à la prochaine écriture)
+OCR_CACHE_TOUCH_BATCH = 256
+
+
+def image_cache_key(image, lang: Optional[str] = None, config: str = "") -> str:
+    """Hash of the rendered image pixels and of the OCR parameters."""
+    h = hashlib.sha256()
+    h.update(f"{image.mode}|{image.size[0]}x{image.size[1]}|{lang or ''}|{config}|".encode("utf-8"))
+    h.update(image.tobytes())
+    return h.hexdigest()
+
+
+class OCRCache:
+    """On-disk LRU cache ``image hash -> OCR text``."""
+
+    def __init__(self, path: str = OCR_CACHE_PATH, max_bytes: int = OCR_CACHE_MAX_BYTES) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0}
+        self._touched: Dict[str, float] = {}
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS ocr (
+                key TEXT PRIMARY KEY,
+                text TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ocr_last_access ON ocr (last_access)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+        )
+        # Taille totale des textes, tenue à jour dans la transaction de chaque écriture
+        self._conn.execute(
+            "INSERT OR IGNORE INTO stats (name, value) SELECT 'bytes', COALESCE(SUM(size), 0) FROM ocr"
+        )
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT text FROM ocr WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._counters["misses"] += 1
+                return None
+            self._counters["hits"] += 1
+            self._touched[key] = time.time()
+            if len(self._touched) >= OCR_CACHE_TOUCH_BATCH:
+                self._write(self._flush_touched)
+        return row[0]
+
+    def put(self, key: str, text: str) -> None:
+        size = len(text.encode("utf-8"))
+
+        def insert():
+            self._flush_touched()
+            # Delta calculé en SQL, dans la même transaction que l'insertion
+            self._conn.execute(
+                "UPDATE stats SET value = value + ? - COALESCE((SELECT size FROM ocr WHERE key = ?), 0) "
+                "WHERE name = 'bytes'",
+                (size, key),
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ocr (key, text, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, text, size, time.time()),
+            )
+            self._evict()
+
+        with self._lock:
+            self._write(insert)
+
+    def _write(self, apply) -> None:
+        """Exécute ``apply`` dans une transaction d'écriture (verrou SQLite pris d'emblée)."""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            apply()
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def _flush_touched(self) -> None:
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE ocr SET last_access = MAX(last_access, ?) WHERE key = ?",
+                [(t, key) for key, t in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def _add_bytes(self, delta: int) -> None:
+        self._conn.execute("UPDATE stats SET value = value + ? WHERE name = 'bytes'", (delta,))
+
+    def _evict(self) -> None:
+        # Taille totale tenue à jour incrémentalement : pas de SUM() à chaque écriture
+        total = self._conn.execute("SELECT value FROM stats WHERE name = 'bytes'").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # On redescend à 90 % du plafond pour ne pas évincer à chaque écriture
+        target = total - int(self.max_bytes * 0.9)
+        freed, evicted = 0, []
+        cursor = self._conn.execute("SELECT key, size FROM ocr ORDER BY last_access ASC")
+        for key, size in cursor:
+            if freed >= target:
+                break
+            evicted.append((key,))
+            freed += size
+        cursor.close()
+        self._conn.executemany("DELETE FROM ocr WHERE key = ?", evicted)
+        self._add_bytes(-freed)
+        self._counters["evictions"] += len(evicted)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self._conn.execute("SELECT value FROM stats WHERE name = 'bytes'").fetchone()[0]
+            entries = self._conn.execute("SELECT COUNT(*) FROM ocr").fetchone()[0]
+            counters = dict(self._counters)
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            "entries": entries,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "hits": counters["hits"],
+            "misses": counters["misses"],
+            "evictions": counters["evictions"],
+            "hit_rate": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM ocr")
+            self._conn.execute("UPDATE stats SET value = 0")
+            self._touched.clear()
+            self._counters = dict.fromkeys(self._counters, 0)
+
+
+_CACHES: Dict[int, OCRCache] = {}
+
+
+def get_ocr_cache() -> Optional[OCRCache]:
+    """Per-process cache instance (SQLite connections must not cross a fork)."""
+    if not OCR_CACHE_ENABLED:
+        return None
+    pid = os.getpid()
+    if pid not in _CACHES:
+        _CACHES[pid] = OCRCache()
+    return _CACHES[pid]
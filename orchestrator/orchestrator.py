@@ -44,12 +44,15 @@ class Orchestrator:
 
         return sorted(all_agents, key=agent_priority)
 
-    async def handle(self, question: str, session_id: str = "default", context_override: dict | None = None) -> dict:
+    async def handle(self, question: str, session_id: str = "default", context_override: dict | None = None,
+                     filters: dict | None = None) -> dict:
         sid = session_id or "default"
         if context_override is not None:
             ctx = context_override.copy()
         else:
             ctx = self.context.get(sid, question)
+        # Filtres de métadonnées propres à cette question (pas hérités de la session)
+        ctx["filters"] = filters or None
 
         intention = detect_intention(question)
         ctx["intention"] = intention
@@ -0,0 +1,419 @@
+# pipelines/bm25.py
+
+"""Compact BM25 keyword engine on NumPy arrays.
+
+Whoosh is pure Python and its query-time cost grows with the corpus.  This
+engine keeps the inverted index in a few flat arrays and scores a query with
+vectorized NumPy operations:
+
+* **Analyzer** -- lowercase, ``\\w+`` tokens, French/English stop words,
+  Snowball stemming (NLTK) in the language detected from stop words
+  (``BM25_LANG`` when undecided), then accent folding of the stem so that
+  ``"résiliation"`` and ``"resiliation"`` meet.  Queries are too short for
+  that detection, so each query word is expanded to both its French and its
+  English stem.
+* **Postings** -- CSR layout: ``indptr[t]:indptr[t + 1]`` delimits the
+  ``doc_ids`` / ``tfs`` of term ``t``; plus ``doc_len``.  All are ``.npy``
+  files opened with ``mmap_mode="r"``, so loading is instant and the OS page
+  cache is shared between processes.
+* **Scoring** -- Okapi BM25 (``BM25_K1``, ``BM25_B``) accumulated in a dense
+  ``float32`` score vector, top-k by ``argpartition``.
+* **Documents** -- point ID and payload per row in SQLite, with the metadata
+  filters of :mod:`pipelines.search_filters` (expression indexes).
+
+The index is a snapshot of the collection built from the same chunks as the
+Whoosh index (``python -m pipelines.bm25 build``), written to a temporary
+directory and swapped in; :class:`pipelines.keyword_search.BM25Searcher`
+reloads it when ``meta.json`` changes.  Unlike the Whoosh query parser
+(implicit AND), query terms are ORed and ranked, as usual for BM25.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core.logging import get_logger
+from pipelines.search_filters import FILTER_FIELDS, normalize_filters, sql_column, to_sql_where
+
+logger = get_logger(__name__)
+
+BM25_INDEX_DIR = os.getenv(
+    "BM25_INDEX_DIR",
+    os.path.join(os.path.dirname(__file__), "../bm25_index"),
+)
+BM25_K1 = float(os.getenv("BM25_K1", 1.2))
+BM25_B = float(os.getenv("BM25_B", 0.75))
+# Langue de racinisation quand la détection par mots vides est indécise
+BM25_LANG = os.getenv("BM25_LANG", "fr")
+_FORMAT_VERSION = 1
+
+_WORD = re.compile(r"\w+")
+_LIGATURES = str.maketrans({"œ": "oe", "æ": "ae", "ß": "ss"})
+
+STOPWORDS = {
+    "fr": set(
+        "a au aux avec ce ces cet cette dans de des du elle en et eux il ils je la le les leur leurs lui ma mais "
+        "me meme mes moi mon ne nos notre nous on ou par pas pour qu que qui sa se ses son sont sur ta te tes "
+        "toi ton tu un une vos votre vous c d j l m n s t y ete etre est sont ont avait aussi comme plus "
+        "tout tous toute toutes cela ceci dont donc ni si".split()
+    ),
+    "en": set(
+        "a an and are as at be been but by for from had has have he her his i if in into is it its me my no "
+        "not of on or our she so such that the their them then there these they this to was we were what "
+        "when where which who will with you your".split()
+    ),
+}
+_ALL_STOPWORDS = STOPWORDS["fr"] | STOPWORDS["en"]
+
+
+def fold(text: str) -> str:
+    """Minuscules sans accents ni ligatures (``"Œuvre été"`` -> ``"oeuvre ete"``)."""
+    decomposed = unicodedata.normalize("NFKD", text.lower().translate(_LIGATURES))
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+class Analyzer:
+    """Texte -> termes (racines sans accents), mots vides retirés."""
+
+    # Au-delà, le cache mot -> terme n'est plus alimenté (mémoire bornée)
+    CACHE_SIZE = 500_000
+
+    def __init__(self, default_lang: str = BM25_LANG) -> None:
+        from nltk.stem.snowball import SnowballStemmer
+
+        self.default_lang = default_lang
+        self._stemmers = {"fr": SnowballStemmer("french"), "en": SnowballStemmer("english")}
+        self._cache: Dict[Tuple[str, str], str] = {}
+
+    def detect_language(self, words: Sequence[str]) -> str:
+        fr = sum(1 for w in words if w in STOPWORDS["fr"])
+        en = sum(1 for w in words if w in STOPWORDS["en"])
+        if en > fr:
+            return "en"
+        if fr > en:
+            return "fr"
+        return self.default_lang
+
+    def _term(self, lang: str, word: str) -> str:
+        key = (lang, word)
+        term = self._cache.get(key)
+        if term is None:
+            folded = fold(word)
+            if folded in _ALL_STOPWORDS or (len(folded) < 2 and not folded.isdigit()):
+                term = ""
+            elif folded.isdigit():
+                term = folded
+            else:
+                term = fold(self._stemmers[lang].stem(word))
+            if len(self._cache) < self.CACHE_SIZE:
+                self._cache[key] = term
+        return term
+
+    def __call__(self, text: str, lang: Optional[str] = None) -> List[str]:
+        words = _WORD.findall(text.lower())
+        lang = lang or self.detect_language([fold(w) for w in words[:200]])
+        terms = []
+        for word in words:
+            term = self._term(lang, word)
+            if term:
+                terms.append(term)
+        return terms
+
+    def query_terms(self, text: str) -> List[str]:
+        """
+        Termes d'une requête : racine française et racine anglaise de chaque
+        mot, le passage pouvant avoir été indexé dans l'une ou l'autre langue.
+        """
+        terms = []
+        for word in _WORD.findall(text.lower()):
+            for lang in ("fr", "en"):
+                term = self._term(lang, word)
+                if term and term not in terms:
+                    terms.append(term)
+        return terms
+
+
+_analyzer: Optional[Analyzer] = None
+_analyzer_lock = threading.Lock()
+
+
+def get_analyzer() -> Analyzer:
+    global _analyzer
+    with _analyzer_lock:
+        if _analyzer is None:
+            _analyzer = Analyzer()
+        return _analyzer
+
+
+# ---------------------------------------------------------------------------
+# Construction
+# ---------------------------------------------------------------------------
+
+# Champs portés par une colonne dédiée de la table ``docs``
+_DOC_COLUMNS = {"doc_id": "doc_id", "chunk_index": "chunk_index"}
+
+
+def _create_docs_db(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS docs (
+            row INTEGER PRIMARY KEY,
+            id TEXT NOT NULL,
+            doc_id TEXT,
+            chunk_index INTEGER,
+            payload TEXT NOT NULL
+        )
+        """
+    )
+    return conn
+
+
+class BM25Builder:
+    """
+    Construit un index dans ``<index_dir>.tmp`` puis le substitue à
+    ``index_dir`` (:meth:`finish`). Les postings sont accumulés dans des
+    ``array`` compacts, pas dans des listes d'objets Python.
+    """
+
+    def __init__(self, index_dir: str = BM25_INDEX_DIR, analyzer: Optional[Analyzer] = None) -> None:
+        self.index_dir = os.path.abspath(index_dir)
+        self.tmp_dir = self.index_dir + ".tmp"
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        os.makedirs(self.tmp_dir)
+        self.analyzer = analyzer or get_analyzer()
+        self.terms: Dict[str, int] = {}
+        self._post_term = array("i")
+        self._post_doc = array("i")
+        self._post_tf = array("i")
+        self._doc_len = array("i")
+        self._conn = _create_docs_db(os.path.join(self.tmp_dir, "docs.db"))
+        self._pending: List[Tuple[Any, ...]] = []
+
+    @property
+    def n_docs(self) -> int:
+        return len(self._doc_len)
+
+    def add(self, point_id: str, text: str, metadata: Optional[Dict[str, Any]] = None) -> None:
+        metadata = metadata or {}
+        row = len(self._doc_len)
+        counts: Dict[int, int] = {}
+        terms = self.analyzer(text)
+        for term in terms:
+            tid = self.terms.get(term)
+            if tid is None:
+                tid = self.terms[term] = len(self.terms)
+            counts[tid] = counts.get(tid, 0) + 1
+        self._post_term.extend(counts.keys())
+        self._post_doc.extend([row] * len(counts))
+        self._post_tf.extend(counts.values())
+        self._doc_len.append(len(terms))
+        self._pending.append((
+            row, point_id, metadata.get("doc_id"), metadata.get("chunk_index"),
+            json.dumps({"page_content": text, "metadata": metadata}, ensure_ascii=False, default=str),
+        ))
+        if len(self._pending) >= 1000:
+            self._flush_docs()
+
+    def _flush_docs(self) -> None:
+        self._conn.executemany(
+            "INSERT INTO docs (row, id, doc_id, chunk_index, payload) VALUES (?, ?, ?, ?, ?)", self._pending
+        )
+        self._pending = []
+
+    def finish(self, k1: float = BM25_K1, b: float = BM25_B) -> Dict[str, Any]:
+        """Écrit les tableaux, les index SQLite et ``meta.json``, puis publie l'index."""
+        self._flush_docs()
+        for field in FILTER_FIELDS:
+            if field not in _DOC_COLUMNS:
+                self._conn.execute(f"CREATE INDEX docs_{field} ON docs ({sql_column(field)})")
+        self._conn.execute("CREATE INDEX docs_doc ON docs (doc_id, chunk_index)")
+        self._conn.commit()
+        self._conn.close()
+
+        post_term = np.frombuffer(self._post_term, dtype=np.int32)
+        # Tri stable par terme : les documents restent croissants dans chaque liste
+        order = np.argsort(post_term, kind="stable")
+        indptr = np.zeros(len(self.terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(post_term, minlength=len(self.terms)), out=indptr[1:])
+        doc_len = np.frombuffer(self._doc_len, dtype=np.int32)
+        np.save(os.path.join(self.tmp_dir, "indptr.npy"), indptr)
+        np.save(os.path.join(self.tmp_dir, "doc_ids.npy"), np.frombuffer(self._post_doc, dtype=np.int32)[order])
+        np.save(os.path.join(self.tmp_dir, "tfs.npy"), np.frombuffer(self._post_tf, dtype=np.int32)[order].astype(np.float32))
+        np.save(os.path.join(self.tmp_dir, "doc_len.npy"), doc_len.astype(np.float32))
+        with open(os.path.join(self.tmp_dir, "terms.json"), "w", encoding="utf-8") as f:
+            json.dump(sorted(self.terms, key=self.terms.get), f, ensure_ascii=False)
+        meta = {
+            "version": _FORMAT_VERSION,
+            "n_docs": self.n_docs,
+            "n_terms": len(self.terms),
+            "n_postings": len(post_term),
+            "avgdl": float(doc_len.mean()) if self.n_docs else 0.0,
+            "k1": k1,
+            "b": b,
+            "built_at": time.time(),
+        }
+        with open(os.path.join(self.tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+        # Publication : l'ancien index reste lisible par les processus qui l'ont ouvert
+        old_dir = self.index_dir + ".old"
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(self.index_dir):
+            os.replace(self.index_dir, old_dir)
+        os.replace(self.tmp_dir, self.index_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+        return meta
+
+
+def build_from_points(points: Iterable[Dict[str, Any]], index_dir: str = BM25_INDEX_DIR) -> Dict[str, Any]:
+    """Index des points ``{"id", "payload"}`` (cf. ``VectorStore.scroll``)."""
+    builder = BM25Builder(index_dir)
+    for point in points:
+        payload = point["payload"]
+        builder.add(point["id"], payload.get("page_content", ""), payload.get("metadata", {}))
+    return builder.finish()
+
+
+def iter_store_points(store, page_size: int = 512) -> Iterable[Dict[str, Any]]:
+    offset = None
+    while True:
+        points, offset = store.scroll(limit=page_size, offset=offset)
+        yield from points
+        if offset is None:
+            return
+
+
+# ---------------------------------------------------------------------------
+# Recherche
+# ---------------------------------------------------------------------------
+
+class BM25Index:
+    """Index BM25 en lecture seule (tableaux memmappés), thread-safe."""
+
+    def __init__(self, index_dir: str = BM25_INDEX_DIR, analyzer: Optional[Analyzer] = None) -> None:
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != _FORMAT_VERSION:
+            raise ValueError(f"Index BM25 au format {self.meta.get('version')} (attendu {_FORMAT_VERSION}) : reconstruire")
+        with open(os.path.join(index_dir, "terms.json"), encoding="utf-8") as f:
+            self.terms = {term: tid for tid, term in enumerate(json.load(f))}
+        self.indptr = np.load(os.path.join(index_dir, "indptr.npy"), mmap_mode="r")
+        self.doc_ids = np.load(os.path.join(index_dir, "doc_ids.npy"), mmap_mode="r")
+        self.tfs = np.load(os.path.join(index_dir, "tfs.npy"), mmap_mode="r")
+        self.n_docs = self.meta["n_docs"]
+        self.k1, self.b = self.meta["k1"], self.meta["b"]
+        doc_len = np.load(os.path.join(index_dir, "doc_len.npy"))
+        avgdl = self.meta["avgdl"] or 1.0
+        # Partie du dénominateur BM25 propre au document, calculée une fois
+        self._norm = (self.k1 * (1 - self.b + self.b * doc_len / avgdl)).astype(np.float32)
+        self.analyzer = analyzer or get_analyzer()
+        self._conn = sqlite3.connect(os.path.join(index_dir, "docs.db"), check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def score(self, terms: Sequence[str]) -> np.ndarray:
+        """Scores BM25 de tous les documents (0 pour ceux sans terme commun)."""
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for term in set(terms):
+            tid = self.terms.get(term)
+            if tid is None:
+                continue
+            start, end = int(self.indptr[tid]), int(self.indptr[tid + 1])
+            docs = self.doc_ids[start:end]
+            tf = self.tfs[start:end]
+            df = end - start
+            idf = math.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+            # Un document n'apparaît qu'une fois par liste : += vectorisé sans collision
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + self._norm[docs])
+        return scores
+
+    def _filter_rows(self, filters: Dict[str, Any]) -> np.ndarray:
+        where, params = to_sql_where(filters, _DOC_COLUMNS)
+        with self._lock:
+            rows = self._conn.execute(f"SELECT row FROM docs WHERE {where}", params)
+            return np.fromiter((r for (r,) in rows), dtype=np.int64)
+
+    def search(self, query: str, top_k: int = 10, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        filters = normalize_filters(filters)
+        if not self.n_docs:
+            return []
+        scores = self.score(self.analyzer.query_terms(query))
+        if filters:
+            rows = self._filter_rows(filters)
+            candidates = rows[scores[rows] > 0]
+        else:
+            candidates = np.flatnonzero(scores)
+        k = min(top_k, len(candidates))
+        if k <= 0:
+            return []
+        best = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        with self._lock:
+            by_row = {
+                row: (pid, payload) for row, pid, payload in self._conn.execute(
+                    f"SELECT row, id, payload FROM docs WHERE row IN ({','.join('?' * len(best))})",
+                    [int(r) for r in best],
+                )
+            }
+        results = []
+        for row in best:
+            pid, payload = by_row[int(row)]
+            payload = json.loads(payload)
+            results.append({
+                "id": pid,
+                "text": payload.get("page_content", ""),
+                "metadata": payload.get("metadata", {}),
+                "score": float(scores[row]),
+                "source": "keyword",
+            })
+        return results
+
+    def close(self) -> None:
+        """Ferme la base des documents et libère les tableaux memmappés."""
+        with self._lock:
+            self._conn.close()
+            self.indptr = self.doc_ids = self.tfs = None
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Index BM25 (NumPy) de la collection")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    build = sub.add_parser("build", help="Reconstruit l'index depuis le stockage vectoriel")
+    build.add_argument("--index-dir", default=BM25_INDEX_DIR)
+    search = sub.add_parser("search", help="Recherche de test")
+    search.add_argument("query")
+    search.add_argument("--index-dir", default=BM25_INDEX_DIR)
+    search.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    if args.cmd == "build":
+        from pipelines.vector_store import get_vector_store
+
+        t0 = time.perf_counter()
+        meta = build_from_points(iter_store_points(get_vector_store()), args.index_dir)
+        logger.info(
+            "Index BM25 construit en %.1fs : %d passages, %d termes, %d postings",
+            time.perf_counter() - t0, meta["n_docs"], meta["n_terms"], meta["n_postings"],
+        )
+    else:
+        index = BM25Index(args.index_dir)
+        for hit in index.search(args.query, top_k=args.top_k):
+            logger.info("%.3f  %s  %r", hit["score"], hit["id"], hit["text"][:100])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+# pipelines/chunking.py
+
+"""Token-aware text chunking shared by every ingestion path.
+
+Chunks used to be cut by ``RecursiveCharacterTextSplitter`` at 400
+characters, a size unrelated to the embedding model's input limit: dense
+passages were silently truncated by the model and short ones wasted capacity.
+``TokenChunker`` sizes chunks in tokens of the embedding model's own
+tokenizer:
+
+* the text is tokenized once (fast tokenizer, character offsets), so splitting
+  is linear in the text length, including multi-megabyte blocks;
+* each chunk holds at most ``CHUNK_MAX_TOKENS`` tokens (special tokens
+  excluded) and is cut at the strongest boundary found in its second half:
+  paragraph break, then line break, then end of sentence, then word;
+* consecutive chunks of a same paragraph overlap by ``CHUNK_OVERLAP_TOKENS``;
+* chunks never span two parser pages/blocks (the caller splits each one
+  separately) and carry their ``[char_start, char_end)`` offsets in it;
+* spreadsheet blocks are cut between rows instead, with their header row
+  repeated in every chunk (:meth:`TokenChunker.split_table`).
+
+If the tokenizer cannot be loaded (offline machine without the model), a
+word/punctuation regex stands in for it and a warning is logged.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import threading
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+from core.logging import get_logger
+from pipelines.model_registry import EMBEDDING_MODEL
+
+logger = get_logger(__name__)
+
+# Longueur maximale d'entrée du modèle d'embedding (max_seq_length : 128 pour
+# le MiniLM multilingue par défaut) ; au-delà le modèle tronque le chunk
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", 128))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", 16))
+
+# Force d'une coupure avant un token, selon l'espace qui le précède
+_PARAGRAPH, _LINE, _SENTENCE, _WORD, _NONE = 4, 3, 2, 1, 0
+_SENTENCE_END = re.compile(r"[.!?;:…][\"')\]»]*$")
+_REGEX_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+class Chunk(NamedTuple):
+    text: str
+    char_start: int
+    char_end: int
+    nb_tokens: int
+
+
+class _RegexTokenizer:
+    """Substitut sans dépendance : un token par mot ou signe de ponctuation."""
+
+    def offsets(self, text: str) -> List[Tuple[int, int]]:
+        return [m.span() for m in _REGEX_TOKEN.finditer(text)]
+
+    def num_special_tokens(self) -> int:
+        return 2
+
+
+class _HFTokenizer:
+    def __init__(self, model_name: str) -> None:
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True)
+
+    def offsets(self, text: str) -> List[Tuple[int, int]]:
+        encoded = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False)
+        return [(s, e) for s, e in encoded["offset_mapping"] if e > s]
+
+    def num_special_tokens(self) -> int:
+        return self.tokenizer.num_special_tokens_to_add()
+
+
+def load_tokenizer(model_name: str = EMBEDDING_MODEL):
+    try:
+        return _HFTokenizer(model_name)
+    except Exception as e:
+        logger.warning("Tokenizer '%s' indisponible (%s) : découpage approximatif par mots", model_name, e)
+        return _RegexTokenizer()
+
+
+class TokenChunker:
+    """Découpe un texte en chunks d'au plus ``max_tokens`` tokens du modèle."""
+
+    def __init__(self, max_tokens: int = CHUNK_MAX_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+                 tokenizer=None) -> None:
+        self.tokenizer = tokenizer or load_tokenizer()
+        self.max_tokens = max(8, max_tokens - self.tokenizer.num_special_tokens())
+        self.overlap_tokens = min(overlap_tokens, self.max_tokens // 4)
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.tokenizer.offsets(text))
+
+    @staticmethod
+    def _boundaries(text: str, offsets: Sequence[Tuple[int, int]]) -> List[int]:
+        """Force de la coupure avant chaque token (``strength[0]`` inutilisé)."""
+        strength = [_PARAGRAPH] * len(offsets)
+        for t in range(1, len(offsets)):
+            prev_end, start = offsets[t - 1][1], offsets[t][0]
+            gap = text[prev_end:start]
+            if not gap:
+                # Sous-mot ou ponctuation collée au token précédent
+                strength[t] = _NONE
+            elif gap.count("\n") > 1:
+                strength[t] = _PARAGRAPH
+            elif "\n" in gap:
+                strength[t] = _LINE
+            elif _SENTENCE_END.search(text[offsets[t - 1][0]:prev_end]):
+                strength[t] = _SENTENCE
+            else:
+                strength[t] = _WORD
+        return strength
+
+    def split(self, text: str) -> List[Chunk]:
+        offsets = self.tokenizer.offsets(text)
+        n = len(offsets)
+        if not n:
+            return []
+        strength = self._boundaries(text, offsets)
+        chunks: List[Chunk] = []
+        start = 0
+        while start < n:
+            end = start + self.max_tokens
+            if end >= n:
+                end = n
+            else:
+                # Meilleure coupure dans la seconde moitié de la fenêtre (la
+                # plus tardive à force égale) ; parcours borné par max_tokens
+                best, best_strength = end, strength[end]
+                for t in range(end - 1, start + self.max_tokens // 2, -1):
+                    if best_strength == _PARAGRAPH:
+                        break
+                    if strength[t] > best_strength:
+                        best, best_strength = t, strength[t]
+                end = best
+            char_start, char_end = offsets[start][0], offsets[end - 1][1]
+            chunks.append(Chunk(text[char_start:char_end], char_start, char_end, end - start))
+            if end >= n:
+                break
+            next_start = end
+            if self.overlap_tokens and strength[end] < _PARAGRAPH:
+                # Recouvrement, recalé sur un début de mot
+                next_start = max(end - self.overlap_tokens, start + 1)
+                while next_start < end and strength[next_start] < _WORD:
+                    next_start += 1
+            start = next_start
+        return chunks
+
+    def split_table(self, text: str) -> List[Chunk]:
+        """
+        Découpe un bloc de tableur (en-tête puis une rangée par ligne) en
+        chunks d'au plus ``max_tokens`` tokens, coupés entre deux rangées, l'en-
+        tête répété en tête de chacun. ``char_start`` / ``char_end`` couvrent
+        les rangées du chunk ; une rangée trop longue à elle seule est découpée
+        comme du texte, sans en-tête.
+        """
+        nb_tokens = self.count_tokens(text)
+        if nb_tokens <= self.max_tokens:
+            return [Chunk(text, 0, len(text), nb_tokens)] if nb_tokens else []
+        header = text.split("\n", 1)[0]
+        header_tokens = self.count_tokens(header)
+        budget = self.max_tokens - header_tokens
+        if budget < self.max_tokens // 2:
+            # En-tête trop long pour être répété
+            return self.split(text)
+        chunks: List[Chunk] = []
+        rows: List[str] = []
+        size, row_start, row_end = 0, 0, 0
+
+        def flush():
+            chunks.append(Chunk("\n".join([header] + rows), row_start, row_end, header_tokens + size))
+
+        pos = len(header) + 1
+        for line in text[pos:].split("\n"):
+            start, pos = pos, pos + len(line) + 1
+            line_tokens = self.count_tokens(line)
+            if not line_tokens:
+                continue
+            if rows and (size + line_tokens > budget or line_tokens > budget):
+                flush()
+                rows, size = [], 0
+            if line_tokens > budget:
+                chunks.extend(
+                    Chunk(c.text, start + c.char_start, start + c.char_end, c.nb_tokens) for c in self.split(line)
+                )
+                continue
+            if not rows:
+                row_start = start
+            rows.append(line)
+            size += line_tokens
+            row_end = start + len(line)
+        if rows:
+            flush()
+        return chunks
+
+
+_chunker: Optional[TokenChunker] = None
+_chunker_lock = threading.Lock()
+
+
+def get_chunker() -> TokenChunker:
+    """Chunker partagé du processus (le tokenizer n'est chargé qu'une fois)."""
+    global _chunker
+    with _chunker_lock:
+        if _chunker is None:
+            _chunker = TokenChunker()
+        return _chunker
@@ -0,0 +1,280 @@
+# pipelines/embedding_cache.py
+
+"""Persistent, content-addressed cache of chunk embeddings.
+
+Boilerplate clauses, repeated headers and re-ingested files mean that many
+chunks sent to the embedding model have been embedded before.
+``EmbeddingCache`` keeps every computed vector on disk, keyed by a hash of the
+model identity and of the chunk text, so a full reindex or a move to a fresh
+collection mostly skips model inference.
+
+Storage is compact: one memory-mapped ``float16`` matrix per model
+(``<model>.f16``, one row per distinct text) plus a SQLite index
+``key -> row``.  Rows are reserved inside a SQLite write transaction and
+written before the keys are committed, so several processes can share the
+cache and a reader never sees a key whose vector is not on disk yet.
+
+The total vector size is capped (``EMBED_CACHE_MAX_BYTES``): when a write
+exceeds the cap, the oldest entries are evicted and their rows reused by the
+next writes, so the files stop growing.  Vectors computed by the model are
+rounded through ``float16`` (:func:`round_vectors`) so that a hit and a miss
+return the same values.  Hit/miss/eviction counters are those of the process.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE_ENABLED", "1") == "1"
+EMBED_CACHE_DIR = os.getenv(
+    "EMBED_CACHE_DIR",
+    os.path.join(os.path.dirname(__file__), "../embedding_cache"),
+)
+EMBED_CACHE_MAX_BYTES = int(os.getenv("EMBED_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+_DTYPE = np.float16
+
+
+def text_key(model_key: str, text: str) -> str:
+    h = hashlib.sha256()
+    h.update(model_key.encode("utf-8"))
+    h.update(b"\0")
+    h.update(text.encode("utf-8"))
+    return h.hexdigest()
+
+
+def round_vectors(vectors: Sequence[Sequence[float]]) -> np.ndarray:
+    """Vecteurs tels que relus depuis le cache (``float16`` -> ``float32``)."""
+    return np.asarray(vectors, dtype=_DTYPE).astype(np.float32)
+
+
+def embedding_model_key(embeddings) -> Optional[str]:
+    """
+    Identité du modèle pour les clés du cache (nom + backend). ``None`` pour
+    un embedder sans nom de modèle : pas de cache.
+    """
+    name = getattr(embeddings, "model_name", None)
+    if not name:
+        return None
+    key = f"{name}|{type(embeddings).__name__}"
+    if getattr(embeddings, "quantize", False):
+        key += "|int8"
+    return key
+
+
+class EmbeddingCache:
+    """Vecteurs ``float16`` memmappés + index SQLite ``(model, key) -> row``."""
+
+    def __init__(self, cache_dir: str = EMBED_CACHE_DIR, max_bytes: int = EMBED_CACHE_MAX_BYTES) -> None:
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._maps: Dict[str, np.memmap] = {}
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0}
+        self._conn = sqlite3.connect(os.path.join(cache_dir, "index.db"), timeout=30,
+                                     check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS models (model TEXT PRIMARY KEY, dim INTEGER NOT NULL, rows INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS vectors (
+                model TEXT NOT NULL,
+                key TEXT NOT NULL,
+                row INTEGER NOT NULL,
+                PRIMARY KEY (model, key)
+            )
+            """
+        )
+        # Lignes libérées par une éviction, réutilisées par les écritures suivantes
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS free_rows (model TEXT NOT NULL, row INTEGER NOT NULL, PRIMARY KEY (model, row))"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        # Taille totale des vecteurs, tenue à jour à chaque écriture et éviction
+        self._conn.execute(
+            f"""
+            INSERT OR IGNORE INTO stats (name, value)
+            SELECT 'bytes', COALESCE(SUM(m.dim), 0) * {np.dtype(_DTYPE).itemsize}
+            FROM vectors v JOIN models m ON m.model = v.model
+            """
+        )
+
+    def _data_path(self, model_key: str) -> str:
+        return os.path.join(self.cache_dir, re.sub(r"[^A-Za-z0-9_.-]+", "__", model_key) + ".f16")
+
+    def _matrix(self, model_key: str, dim: int, min_rows: int) -> np.memmap:
+        """Memmap en lecture couvrant au moins ``min_rows`` lignes (re-mappé si le fichier a grossi)."""
+        current = self._maps.get(model_key)
+        if current is None or current.shape[0] < min_rows:
+            path = self._data_path(model_key)
+            rows = os.path.getsize(path) // (dim * np.dtype(_DTYPE).itemsize)
+            current = np.memmap(path, dtype=_DTYPE, mode="r", shape=(rows, dim))
+            self._maps[model_key] = current
+        return current
+
+    def get_many(self, model_key: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Vecteurs en cache (``float32``) pour ``texts``, ``None`` pour les absents."""
+        keys = [text_key(model_key, t) for t in texts]
+        with self._lock:
+            model = self._conn.execute("SELECT dim FROM models WHERE model = ?", (model_key,)).fetchone()
+            rows: Dict[str, int] = {}
+            if model is not None:
+                unique = list(set(keys))
+                for start in range(0, len(unique), 500):
+                    part = unique[start:start + 500]
+                    rows.update(self._conn.execute(
+                        f"SELECT key, row FROM vectors WHERE model = ? AND key IN ({','.join('?' * len(part))})",
+                        [model_key, *part],
+                    ).fetchall())
+            hits = sum(1 for k in keys if k in rows)
+            self._counters["hits"] += hits
+            self._counters["misses"] += len(keys) - hits
+            if not rows:
+                return [None] * len(keys)
+            matrix = self._matrix(model_key, model[0], max(rows.values()) + 1)
+            return [matrix[rows[k]].astype(np.float32) if k in rows else None for k in keys]
+
+    def put_many(self, model_key: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        if not texts:
+            return
+        data = np.asarray(vectors, dtype=_DTYPE)
+        dim = data.shape[1]
+        keys = [text_key(model_key, t) for t in texts]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                model = self._conn.execute("SELECT dim, rows FROM models WHERE model = ?", (model_key,)).fetchone()
+                if model is None:
+                    first = 0
+                    self._conn.execute("INSERT INTO models (model, dim, rows) VALUES (?, ?, 0)", (model_key, dim))
+                elif model[0] != dim:
+                    raise ValueError(f"Dimension {dim} incohérente avec le cache '{model_key}' ({model[0]})")
+                else:
+                    first = model[1]
+                # Les textes déjà présents (autre processus, doublons du lot) ne sont pas réécrits
+                seen, new = set(), []
+                for idx, key in enumerate(keys):
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    if self._conn.execute(
+                        "SELECT 1 FROM vectors WHERE model = ? AND key = ?", (model_key, key)
+                    ).fetchone() is None:
+                        new.append(idx)
+                if new:
+                    # Lignes libérées d'abord, puis ajout en fin de fichier
+                    reused = [r for (r,) in self._conn.execute(
+                        "SELECT row FROM free_rows WHERE model = ? ORDER BY row LIMIT ?", (model_key, len(new))
+                    ).fetchall()]
+                    appended = len(new) - len(reused)
+                    targets = reused + list(range(first, first + appended))
+                    path = self._data_path(model_key)
+                    if not os.path.exists(path):
+                        open(path, "wb").close()
+                    with open(path, "r+b") as f:
+                        for row, idx in zip(reused, new):
+                            f.seek(row * dim * data.itemsize)
+                            f.write(data[idx].tobytes())
+                        if appended:
+                            f.seek(first * dim * data.itemsize)
+                            f.write(data[new[len(reused):]].tobytes())
+                        f.flush()
+                        os.fsync(f.fileno())
+                    self._conn.executemany(
+                        "DELETE FROM free_rows WHERE model = ? AND row = ?", [(model_key, r) for r in reused]
+                    )
+                    self._conn.executemany(
+                        "INSERT INTO vectors (model, key, row) VALUES (?, ?, ?)",
+                        [(model_key, keys[idx], row) for row, idx in zip(targets, new)],
+                    )
+                    self._conn.execute(
+                        "UPDATE models SET rows = rows + ? WHERE model = ?", (appended, model_key)
+                    )
+                    self._add_bytes(len(new) * dim * data.itemsize)
+                    self._evict()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _add_bytes(self, delta: int) -> None:
+        self._conn.execute("UPDATE stats SET value = value + ? WHERE name = 'bytes'", (delta,))
+
+    def _evict(self) -> None:
+        """Évince les entrées les plus anciennes au-delà du plafond (dans la transaction d'écriture)."""
+        total = self._conn.execute("SELECT value FROM stats WHERE name = 'bytes'").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # On redescend à 90 % du plafond pour ne pas évincer à chaque écriture
+        target = total - int(self.max_bytes * 0.9)
+        freed, evicted = 0, []
+        cursor = self._conn.execute(
+            "SELECT v.model, v.key, v.row, m.dim FROM vectors v JOIN models m ON m.model = v.model ORDER BY v.rowid"
+        )
+        for model_key, key, row, dim in cursor:
+            if freed >= target:
+                break
+            evicted.append((model_key, key, row))
+            freed += dim * np.dtype(_DTYPE).itemsize
+        cursor.close()
+        self._conn.executemany("DELETE FROM vectors WHERE model = ? AND key = ?", [(m, k) for m, k, _ in evicted])
+        self._conn.executemany("INSERT INTO free_rows (model, row) VALUES (?, ?)", [(m, r) for m, _, r in evicted])
+        self._add_bytes(-freed)
+        self._counters["evictions"] += len(evicted)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self._conn.execute("SELECT value FROM stats WHERE name = 'bytes'").fetchone()[0]
+            entries = self._conn.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+            models = [m for (m,) in self._conn.execute("SELECT model FROM models").fetchall()]
+            counters = dict(self._counters)
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            "entries": entries,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "models": models,
+            "hits": counters["hits"],
+            "misses": counters["misses"],
+            "evictions": counters["evictions"],
+            "hit_rate": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            models = [m for (m,) in self._conn.execute("SELECT model FROM models").fetchall()]
+            self._conn.execute("DELETE FROM vectors")
+            self._conn.execute("DELETE FROM free_rows")
+            self._conn.execute("DELETE FROM models")
+            self._conn.execute("UPDATE stats SET value = 0")
+            self._counters = dict.fromkeys(self._counters, 0)
+            self._maps.clear()
+            for model_key in models:
+                try:
+                    os.remove(self._data_path(model_key))
+                except FileNotFoundError:
+                    pass
+
+
+_CACHES: Dict[int, EmbeddingCache] = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Per-process cache instance (SQLite connections must not cross a fork)."""
+    if not EMBED_CACHE_ENABLED:
+        return None
+    pid = os.getpid()
+    with _CACHES_LOCK:
+        if pid not in _CACHES:
+            _CACHES[pid] = EmbeddingCache()
+        return _CACHES[pid]
@@ -1,75 +1,248 @@
 # pipelines/hybrid_retrieval.py
-from qdrant_client import QdrantClient
-from langchain_qdrant import Qdrant
-from langchain_huggingface import HuggingFaceEmbeddings
-from whoosh.index import open_dir
-from whoosh.qparser import QueryParser
+import asyncio
+import hashlib
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from core.config import settings
-from pipelines.rerank import BGEReranker
+from core.logging import get_logger
+from pipelines.keyword_search import get_keyword_searcher
+from pipelines.model_registry import get_embedding_model
+from pipelines.query_cache import get_query_embeddings
+from pipelines.rerank_cascade import RERANK_CASCADE, get_cascade_reranker
+from pipelines.rerank_service import get_rerank_service
+from pipelines.search_filters import normalize_filters
+from pipelines.vector_store import get_vector_store
 
-# Initialise le reranker global (une seule instance)
-reranker = BGEReranker()
+logger = get_logger(__name__)
 
-# Shared embeddings and Qdrant client instances
-embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
-qdrant_client = QdrantClient(url=settings.QDRANT_URL)
+# Recherche asynchrone (ahybrid_search) : taille du pool, délais par étape
+# (secondes, 0 = aucun) et tolérance à l'échec d'une des deux recherches
+HYBRID_WORKERS = int(os.getenv("HYBRID_WORKERS", 8))
+HYBRID_SEMANTIC_TIMEOUT_SEC = float(os.getenv("HYBRID_SEMANTIC_TIMEOUT_SEC", 3.0))
+HYBRID_KEYWORD_TIMEOUT_SEC = float(os.getenv("HYBRID_KEYWORD_TIMEOUT_SEC", 2.0))
+HYBRID_PARTIAL_RESULTS = os.getenv("HYBRID_PARTIAL_RESULTS", "1") == "1"
+# Recherches abandonnées (délai dépassé) mais encore en cours dans le pool :
+# au-delà, une nouvelle recherche est refusée plutôt que mise en file
+HYBRID_MAX_ORPHAN_LEGS = int(os.getenv("HYBRID_MAX_ORPHAN_LEGS", max(1, HYBRID_WORKERS // 2)))
+# Fusion : constante k de la RRF et nombre maximal de candidats envoyés au reranker
+RRF_K = int(os.getenv("RRF_K", 60))
+RERANK_BUDGET = int(os.getenv("RERANK_BUDGET", 20))
 
-def semantic_search(query: str, top_k=10):
-    vectorstore = Qdrant(
-        client=qdrant_client,
-        collection_name=settings.QDRANT_COLLECTION,
-        embeddings=embeddings,
-    )
-    docs_and_scores = vectorstore.similarity_search_with_score(query, k=top_k)
+_executor = None
+_executor_lock = threading.Lock()
+_orphans = 0
+_orphans_lock = threading.Lock()
+
+# Les deux recherches renvoient l'ID de point du stockage vectoriel (``id``),
+# aussi clé de l'index Whoosh, et appliquent les mêmes ``filters`` (cf.
+# pipelines.search_filters) ; le rerank passe par le service de micro-lots
+# partagé (pipelines.rerank_service).
+
+def semantic_search(query: str, top_k=10, filters: dict = None):
+    store = get_vector_store(settings.QDRANT_COLLECTION)
+    hits = store.search(get_query_embeddings().embed_query(query), top_k=top_k, filters=filters)
     return [
         {
-            "text": doc.page_content,
-            "metadata": doc.metadata,
-            "score": float(score),
+            "id": hit["id"],
+            "text": hit["text"],
+            "metadata": hit["metadata"],
+            "score": hit["score"],
             "source": "semantic"
         }
-        for doc, score in docs_and_scores
+        for hit in hits
     ]
 
-def keyword_search(query: str, top_k=10):
-    ix_path = os.path.join(os.path.dirname(__file__), "../whoosh_index")
-    if not os.path.exists(ix_path):
-        return []
-    ix = open_dir(ix_path)
-    results = []
-    with ix.searcher() as searcher:
-        parser = QueryParser("content", ix.schema)
-        myquery = parser.parse(query)
-        hits = searcher.search(myquery, limit=top_k)
-        for hit in hits:
-            results.append({
-                "text": hit["content"],
-                "metadata": {"whoosh_id": hit.get("id")},
-                "score": hit.score,
-                "source": "keyword"
-            })
-    return results
-
-def hybrid_search(query: str, top_k=7):
+def keyword_search(query: str, top_k=10, filters: dict = None):
+    # Service partagé : index et searchers restent ouverts entre les requêtes
+    return get_keyword_searcher().search(query, top_k=top_k, filters=filters)
+
+def _content_key(text: str) -> str:
+    """Empreinte du texte normalisé (casse et espaces) : mêmes chunks sous deux IDs."""
+    return hashlib.sha1(" ".join(text.lower().split()).encode("utf-8")).hexdigest()
+
+def fuse_candidates(result_lists, budget: int = RERANK_BUDGET, k: int = RRF_K):
+    """
+    Fusion par rangs réciproques (RRF) des listes de résultats (chacune triée,
+    meilleur d'abord) : score ``sum(1 / (k + rang))`` sur les listes où le
+    passage apparaît. Les doublons sont fusionnés par ID de point, puis par
+    empreinte du contenu ; seuls les ``budget`` meilleurs candidats sont
+    gardés pour le rerank (coût du cross-encoder borné par requête).
+
+    Retourne ``(candidats, stats)``, ``stats`` comptant les entrées, doublons
+    et candidats écartés par le budget.
+    """
+    fused = {}
+    aliases = {}
+    total = 0
+    for results in result_lists:
+        for rank, hit in enumerate(results, start=1):
+            total += 1
+            content = _content_key(hit["text"])
+            key = aliases.get(hit.get("id")) or aliases.get(content) or hit.get("id") or content
+            if hit.get("id"):
+                aliases[hit["id"]] = key
+            aliases[content] = key
+            entry = fused.get(key)
+            if entry is None:
+                entry = fused[key] = {**hit, "rrf_score": 0.0, "sources": []}
+            entry["rrf_score"] += 1.0 / (k + rank)
+            if hit.get("source") and hit["source"] not in entry["sources"]:
+                entry["sources"].append(hit["source"])
+    ranked = sorted(fused.values(), key=lambda e: e["rrf_score"], reverse=True)
+    candidates = ranked[:budget]
+    stats = {
+        "inputs": total,
+        "duplicates": total - len(ranked),
+        "pruned": len(ranked) - len(candidates),
+        "candidates": len(candidates),
+    }
+    return candidates, stats
+
+def _log_fusion(stats) -> None:
+    logger.info(
+        "Fusion RRF : %d résultats -> %d candidats au rerank (%d doublons, %d écartés par le budget)",
+        stats["inputs"], stats["candidates"], stats["duplicates"], stats["pruned"],
+    )
+
+def hybrid_search(query: str, top_k=7, filters: dict = None):
     # 1. On rÃ©cupÃ¨re plus large pour un vrai reranking (x2 top_k)
-    semantic_results = semantic_search(query, top_k=top_k*2)
-    keyword_results = keyword_search(query, top_k=top_k*2)
-
-    # 2. Fusion & dÃ©duplication (on conserve le maximum de diversitÃ©)
-    all_results = semantic_results + keyword_results
-    seen = set()
-    unique_results = []
-    for r in all_results:
-        key = r["text"][:120].strip().lower()
-        if key not in seen:
-            seen.add(key)
-            unique_results.append(r)
-
-    # 3. Rerank avec BGE
-    reranked = reranker.rerank(query, unique_results, top_k=top_k)
+    filters = normalize_filters(filters)
+    semantic_results = semantic_search(query, top_k=top_k*2, filters=filters)
+    keyword_results = keyword_search(query, top_k=top_k*2, filters=filters)
+
+    # 2. Fusion RRF & dÃ©duplication (ID de point / contenu), bornée au budget de rerank
+    unique_results, fusion = fuse_candidates([semantic_results, keyword_results], budget=max(RERANK_BUDGET, top_k))
+    _log_fusion(fusion)
+
+    # 3. Rerank avec BGE (lots partagés entre requêtes concurrentes), en
+    # cascade avec arrêt anticipé si RERANK_CASCADE=1
+    if RERANK_CASCADE:
+        reranked, _ = get_cascade_reranker().rerank(query, unique_results, top_k=top_k)
+    else:
+        reranked = get_rerank_service().rerank(query, unique_results, top_k=top_k)
     return reranked
 
+# ---------------------------------------------------------------------------
+# Version asynchrone : les deux recherches en parallèle, hors boucle asyncio
+# ---------------------------------------------------------------------------
 
+def get_executor() -> ThreadPoolExecutor:
+    """Pool borné partagé par les deux recherches (``HYBRID_WORKERS`` threads)."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=HYBRID_WORKERS, thread_name_prefix="hybrid")
+        return _executor
 
+def _orphan_done(_future) -> None:
+    global _orphans
+    with _orphans_lock:
+        _orphans -= 1
+
+async def _run_leg(name: str, timeout: float, fn, *args, prepare=None, **kwargs):
+    """
+    Exécute ``fn`` dans le pool avec un délai maximal, décompté à partir du
+    moment où ``fn`` démarre (l'attente d'un thread libre est rapportée à part,
+    ``queue_ms``). Retourne ``(résultats ou None, {"ms", "status"})``.
+
+    Un dépassement n'interrompt pas le thread : la recherche continue, son
+    résultat est ignoré. Tant que ``HYBRID_MAX_ORPHAN_LEGS`` recherches sont
+    dans ce cas, les suivantes sont refusées (``status="saturated"``) pour ne
+    pas attendre indéfiniment un pool occupé. ``prepare`` (chargement d'un
+    modèle) est exécuté avant, hors délai ; sa durée est rapportée à part
+    (``prepare_ms``).
+    """
+    global _orphans
+    loop = asyncio.get_running_loop()
+    t0 = time.perf_counter()
+    status = "ok"
+    result = None
+    timing = {}
+    future = None
+    try:
+        if prepare is not None:
+            await loop.run_in_executor(get_executor(), prepare)
+            t1 = time.perf_counter()
+            timing["prepare_ms"] = round((t1 - t0) * 1000, 1)
+            t0 = t1
+        with _orphans_lock:
+            saturated = _orphans >= HYBRID_MAX_ORPHAN_LEGS
+        if saturated:
+            status = "saturated"
+            logger.warning("Recherche %s refusée : %d recherche(s) hors délai encore en cours", name, _orphans)
+        else:
+            started = asyncio.Event()
+
+            def run():
+                loop.call_soon_threadsafe(started.set)
+                return fn(*args, **kwargs)
+
+            future = get_executor().submit(run)
+            await started.wait()
+            t1 = time.perf_counter()
+            timing["queue_ms"] = round((t1 - t0) * 1000, 1)
+            t0 = t1
+            result = await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout if timeout > 0 else None)
+    except asyncio.TimeoutError:
+        status = "timeout"
+        logger.warning("Recherche %s : délai de %.2fs dépassé", name, timeout)
+        with _orphans_lock:
+            _orphans += 1
+        future.add_done_callback(_orphan_done)
+    except Exception as e:
+        status = "error"
+        logger.warning("Recherche %s en échec : %s", name, e)
+    return result, {"ms": round((time.perf_counter() - t0) * 1000, 1), "status": status, **timing}
+
+async def ahybrid_search(query: str, top_k=7, filters: dict = None, partial: bool = None):
+    """
+    Recherche hybride asynchrone : sémantique et mots-clés lancées en même
+    temps dans un pool borné (la latence est celle de la plus lente, pas la
+    somme), chacune avec son délai (``HYBRID_SEMANTIC_TIMEOUT_SEC`` /
+    ``HYBRID_KEYWORD_TIMEOUT_SEC``, cf. :func:`_run_leg`) ; le chargement du
+    modèle d'embedding à la première requête ne compte pas dans le délai. Avec ``partial`` (défaut
+    ``HYBRID_PARTIAL_RESULTS``), une recherche lente ou en erreur est ignorée
+    et le rerank porte sur l'autre ; sinon ``RuntimeError``.
+
+    Retourne ``(résultats rerankés, timings)`` ; ``timings`` détaille chaque
+    étape (``ms``, ``status``) et indique si le résultat est ``partial``.
+    """
+    partial = HYBRID_PARTIAL_RESULTS if partial is None else partial
+    filters = normalize_filters(filters)
+    t0 = time.perf_counter()
+    (semantic_results, semantic_timing), (keyword_results, keyword_timing) = await asyncio.gather(
+        _run_leg("sémantique", HYBRID_SEMANTIC_TIMEOUT_SEC, semantic_search, query, top_k=top_k*2, filters=filters,
+                 prepare=get_embedding_model),
+        _run_leg("mots-clés", HYBRID_KEYWORD_TIMEOUT_SEC, keyword_search, query, top_k=top_k*2, filters=filters),
+    )
+    timings = {"semantic": semantic_timing, "keyword": keyword_timing}
+    failed = [name for name, timing in timings.items() if timing["status"] != "ok"]
+    if failed and (not partial or len(failed) == len(timings)):
+        raise RuntimeError(f"Recherche hybride : étape(s) en échec ({', '.join(failed)})")
+
+    unique_results, fusion = fuse_candidates(
+        [semantic_results or [], keyword_results or []], budget=max(RERANK_BUDGET, top_k)
+    )
+    _log_fusion(fusion)
+    timings["fusion"] = fusion
+    t1 = time.perf_counter()
+    # Attente du lot sans bloquer de thread du pool
+    cascade = None
+    if RERANK_CASCADE:
+        reranked, cascade = await get_cascade_reranker().arerank(query, unique_results, top_k=top_k)
+    else:
+        reranked = await get_rerank_service().arerank(query, unique_results, top_k=top_k)
+    timings["rerank"] = {"ms": round((time.perf_counter() - t1) * 1000, 1), "status": "ok"}
+    if cascade is not None:
+        timings["rerank"]["cascade"] = cascade
+    timings["total_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    timings["partial"] = bool(failed)
+    logger.info(
+        "Recherche hybride en %.0f ms (sémantique %.0f ms %s, mots-clés %.0f ms %s, rerank %.0f ms)",
+        timings["total_ms"], semantic_timing["ms"], semantic_timing["status"],
+        keyword_timing["ms"], keyword_timing["status"], timings["rerank"]["ms"],
+    )
+    return reranked, timings
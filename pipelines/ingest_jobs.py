@@ -0,0 +1,153 @@
+# pipelines/ingest_jobs.py
+
+"""Background ingestion jobs for uploaded documents.
+
+``JobManager`` runs parsing, embedding and indexing of uploaded files on a
+thread pool so that the API can answer immediately with a job ID.  Each job
+keeps a small progress record (per-file stage, pages parsed, chunks indexed)
+that the API exposes while the job runs.  Jobs live in memory: they are
+meant for monitoring an upload, not as a durable queue (the ingestion
+manifest is the durable record of what is indexed).
+"""
+
+from __future__ import annotations
+
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from core.logging import get_logger
+from pipelines.ingest_manifest import IngestManifest, file_hash
+from pipelines.vectorize import store_document_in_qdrant
+
+logger = get_logger(__name__)
+
+INGEST_JOB_WORKERS = int(os.getenv("INGEST_JOB_WORKERS", 2))
+# Nombre de jobs terminés conservés pour consultation
+INGEST_JOB_HISTORY = int(os.getenv("INGEST_JOB_HISTORY", 500))
+
+
+class JobManager:
+    """Run ingestion jobs in the background and track their progress."""
+
+    def __init__(self, workers: int = INGEST_JOB_WORKERS, manifest: Optional[IngestManifest] = None) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest-job")
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._manifest = manifest
+        # Deux envois du même document (même doc_id) ne s'indexent pas en parallèle
+        self._doc_locks: Dict[str, threading.Lock] = {}
+
+    @property
+    def manifest(self) -> IngestManifest:
+        with self._lock:
+            if self._manifest is None:
+                self._manifest = IngestManifest()
+            return self._manifest
+
+    def submit(self, files: List[Dict[str, str]], workdir: Optional[str] = None) -> str:
+        """Enqueue ``files`` (``{"path", "filename"[, "doc_id"]}``) and return the job ID."""
+        job_id = uuid.uuid4().hex
+        job = {
+            "id": job_id,
+            "status": "queued",
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "files": [
+                {
+                    "filename": f["filename"],
+                    "path": f["path"],
+                    "status": "queued",
+                    "stage": None,
+                    "pages": 0,
+                    "nb_pages": None,
+                    "chunks": 0,
+                    "doc_id": f.get("doc_id"),
+                    "error": None,
+                }
+                for f in files
+            ],
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+            self._trim()
+        self._executor.submit(self._run, job_id, workdir)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            files = [{k: v for k, v in f.items() if k != "path"} for f in job["files"]]
+            done = sum(1 for f in files if f["status"] in ("done", "skipped", "error"))
+            return {**job, "files": files, "progress": round(done / len(files), 3) if files else 1.0}
+
+    def _trim(self) -> None:
+        finished = [j for j in self._jobs.values() if j["finished_at"] is not None]
+        excess = len(finished) - INGEST_JOB_HISTORY
+        if excess > 0:
+            for job in sorted(finished, key=lambda j: j["finished_at"])[:excess]:
+                self._jobs.pop(job["id"], None)
+
+    def _update(self, entry: Dict[str, Any], **values) -> None:
+        with self._lock:
+            entry.update(values)
+
+    def _run(self, job_id: str, workdir: Optional[str]) -> None:
+        job = self._jobs[job_id]
+        self._update(job, status="running", started_at=time.time())
+        failed = 0
+        try:
+            for entry in job["files"]:
+                if not self._ingest_file(entry):
+                    failed += 1
+        finally:
+            status = "done" if not failed else ("error" if failed == len(job["files"]) else "partial")
+            self._update(job, status=status, finished_at=time.time())
+            if workdir:
+                shutil.rmtree(workdir, ignore_errors=True)
+            logger.info("Job d'ingestion %s terminé (%s)", job_id, status)
+
+    def _ingest_file(self, entry: Dict[str, Any]) -> bool:
+        doc_id = None
+        digest = None
+
+        def progress(stage, pages, nb_pages, chunks):
+            self._update(entry, stage=stage, pages=pages, nb_pages=nb_pages, chunks=chunks)
+
+        try:
+            self._update(entry, status="running", stage="parsing")
+            # Document identifié par l'ID fourni par le client, à défaut par
+            # son nom : un nouvel envoi remplace la version précédente. Le
+            # hash sert seulement à ignorer un envoi au contenu inchangé
+            doc_id = entry["doc_id"] or f"uploads/{entry['filename']}"
+            self._update(entry, doc_id=doc_id)
+            digest = file_hash(entry["path"])
+            with self._lock:
+                doc_lock = self._doc_locks.setdefault(doc_id, threading.Lock())
+            with doc_lock:
+                if self.manifest.is_unchanged(doc_id, digest):
+                    self._update(entry, status="skipped", stage=None)
+                    return True
+                self.manifest.mark_pending(doc_id, digest)
+                nb_chunks = store_document_in_qdrant(
+                    entry["path"], doc_id=doc_id, filename=entry["filename"], progress=progress,
+                )
+                self.manifest.mark_done(doc_id, digest, nb_chunks)
+            self._update(entry, status="done", stage=None, chunks=nb_chunks)
+            return True
+        except Exception as e:
+            if digest:
+                self.manifest.mark_error(doc_id, digest, str(e))
+            logger.error("Erreur ingestion %s : %s", entry["filename"], e)
+            self._update(entry, status="error", error=str(e))
+            return False
+
+
+job_manager = JobManager()
@@ -0,0 +1,180 @@
+# pipelines/ingest_manifest.py
+
+"""Persistent ingestion manifest.
+
+The manifest remembers, for every ingested file, the content hash that was
+indexed, how many chunks it produced and whether the run completed.  The
+ingestion scripts consult it to:
+
+* skip files whose content did not change since the last successful run;
+* replace only the chunks of files that did change (point IDs are
+  deterministic, see :func:`pipelines.vectorize.chunk_point_id`);
+* resume an interrupted run: files left ``pending`` or in ``error`` are
+  simply processed again.
+
+Storage is a single SQLite file so that it survives restarts and can be
+shared by the batch script, the hotfolder watcher and ``scripts/ingest.py``.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+MANIFEST_PATH = os.getenv(
+    "INGEST_MANIFEST_PATH",
+    os.path.join(os.path.dirname(__file__), "../ingest_manifest.db"),
+)
+
+# Racine des clés du manifeste (et donc des doc_id / IDs de point) : une clé ne
+# dépend pas du répertoire de lancement
+INGEST_ROOT = os.path.abspath(os.getenv("INGEST_ROOT", os.path.join(os.path.dirname(__file__), "..")))
+
+STATUS_PENDING = "pending"
+STATUS_DONE = "done"
+STATUS_ERROR = "error"
+
+
+def normalize_path(path: str) -> str:
+    """
+    Stable manifest key for a file path: relative to ``INGEST_ROOT`` (absolute
+    outside of it), forward slashes, whatever the working directory.
+    """
+    full = os.path.abspath(path)
+    try:
+        key = os.path.relpath(full, INGEST_ROOT)
+    except ValueError:
+        # Autre lecteur (Windows)
+        key = full
+    if key == os.pardir or key.startswith(os.pardir + os.sep):
+        key = full
+    return key.replace("\\", "/")
+
+
+def key_path(key: str) -> str:
+    """File path of a manifest key (inverse of :func:`normalize_path`)."""
+    return os.path.join(INGEST_ROOT, key)
+
+
+def file_hash(path: str, block_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class IngestManifest:
+    """SQLite-backed record of what has been indexed."""
+
+    def __init__(self, path: str = MANIFEST_PATH) -> None:
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                size INTEGER,
+                mtime REAL,
+                nb_chunks INTEGER,
+                status TEXT NOT NULL,
+                error TEXT,
+                updated_at TEXT
+            )
+            """
+        )
+        self._conn.commit()
+
+    def get(self, path: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT path, content_hash, size, mtime, nb_chunks, status, error, updated_at "
+                "FROM files WHERE path = ?",
+                (path,),
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ("path", "content_hash", "size", "mtime", "nb_chunks", "status", "error", "updated_at")
+        return dict(zip(keys, row))
+
+    def check_file(self, path: str, key: Optional[str] = None):
+        """Return ``(unchanged, content_hash)`` for a file on disk.
+
+        Size and mtime are compared first so that an unchanged corpus is
+        skipped without reading it; the file is hashed only when they differ.
+        """
+        key = key or normalize_path(path)
+        st = os.stat(path)
+        entry = self.get(key)
+        if entry and entry["status"] == STATUS_DONE and entry["size"] == st.st_size and entry["mtime"] == st.st_mtime:
+            return True, entry["content_hash"]
+        digest = file_hash(path)
+        if entry and entry["status"] == STATUS_DONE and entry["content_hash"] == digest:
+            # Fichier "touché" mais contenu identique : on rafraîchit juste mtime
+            self._upsert(key, digest, st.st_size, st.st_mtime, entry["nb_chunks"], STATUS_DONE, None)
+            return True, digest
+        return False, digest
+
+    def is_unchanged(self, key: str, content_hash: str) -> bool:
+        entry = self.get(key)
+        return bool(entry and entry["status"] == STATUS_DONE and entry["content_hash"] == content_hash)
+
+    def mark_pending(self, key: str, content_hash: str, size: Optional[int] = None, mtime: Optional[float] = None) -> None:
+        entry = self.get(key)
+        nb_chunks = entry["nb_chunks"] if entry else None
+        self._upsert(key, content_hash, size, mtime, nb_chunks, STATUS_PENDING, None)
+
+    def mark_done(self, key: str, content_hash: str, nb_chunks: int, size: Optional[int] = None, mtime: Optional[float] = None) -> None:
+        if size is None:
+            # Reprend size/mtime enregistrés au passage en "pending"
+            entry = self.get(key) or {}
+            size, mtime = entry.get("size"), entry.get("mtime")
+        self._upsert(key, content_hash, size, mtime, nb_chunks, STATUS_DONE, None)
+
+    def mark_error(self, key: str, content_hash: str, error: str) -> None:
+        entry = self.get(key)
+        nb_chunks = entry["nb_chunks"] if entry else None
+        self._upsert(key, content_hash, None, None, nb_chunks, STATUS_ERROR, error)
+
+    def unfinished(self) -> List[str]:
+        """Files whose last run did not complete (checkpoint for resume)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path FROM files WHERE status != ?", (STATUS_DONE,)
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def _upsert(self, key, content_hash, size, mtime, nb_chunks, status, error) -> None:
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO files (path, content_hash, size, mtime, nb_chunks, status, error, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(path) DO UPDATE SET
+                    content_hash = excluded.content_hash,
+                    size = excluded.size,
+                    mtime = excluded.mtime,
+                    nb_chunks = excluded.nb_chunks,
+                    status = excluded.status,
+                    error = excluded.error,
+                    updated_at = excluded.updated_at
+                """,
+                (key, content_hash, size, mtime, nb_chunks, status, error, datetime.now().isoformat()),
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
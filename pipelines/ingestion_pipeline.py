@@ -0,0 +1,437 @@
+# pipelines/ingestion_pipeline.py
+
+"""Pipelined, multi-stage ingestion engine.
+
+The batch scripts used to parse, chunk, embed and upsert one file at a time,
+so CPU-bound parsing/OCR, model inference and Qdrant writes never overlapped.
+``IngestionPipeline`` runs those steps as four stages connected by bounded
+queues:
+
+``parse``
+    ``iter_document_pages`` in a process pool (CPU bound, OCR).  Pages are
+    spilled one by one to a temporary file instead of being returned as a
+    list, so neither the worker nor the main process holds a whole document.
+``chunk``
+    Pages are read back one at a time and split; chunks go downstream in
+    batches of ``chunk_batch_size``.
+``embed``
+    Chunks from several files are grouped into large batches for the model.
+``upsert``
+    Batches are written to Qdrant by a pool of writer threads.
+
+Every queue has a maximum size: when a downstream stage falls behind, the
+upstream ``put`` blocks, which bounds memory whatever the corpus size.  Each
+stage keeps a ``StageStats`` record; ``IngestionPipeline.report()`` turns them
+into a per-stage throughput report.
+
+When an :class:`~pipelines.ingest_manifest.IngestManifest` is given, unchanged
+files are skipped before parsing, chunks get deterministic point IDs and a
+file is marked ``done`` only once all its chunks are upserted, so an
+interrupted run resumes where it stopped.
+"""
+
+from __future__ import annotations
+
+import os
+import pickle
+import queue
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Dict, Iterable, List, Optional
+
+from core.file_parser import iter_document_pages
+from core.logging import get_logger
+from core.ocr_cache import get_ocr_cache
+from pipelines.embedding_cache import get_embedding_cache
+from pipelines.ingest_manifest import IngestManifest, normalize_path
+from pipelines.vector_store import VectorStore, get_vector_store
+from pipelines.vectorize import chunk_pages, embed_chunks, get_embeddings
+
+logger = get_logger(__name__)
+
+_DONE = object()
+
+
+def _parse_file(path: str, ocr_workers: int = 1):
+    """
+    Process-pool entry point: parse a single file and spill its non-empty
+    ``(text, meta)`` pages to a temporary file, one pickle per page.
+    Returns ``(path, spill_path, nb_pages)``.
+    """
+    fd, spill_path = tempfile.mkstemp(prefix="ingest_pages_", suffix=".pkl")
+    nb_pages = 0
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for text, meta in iter_document_pages(path, ocr_workers=ocr_workers):
+                if text.strip():
+                    pickle.dump((text, meta), f, protocol=pickle.HIGHEST_PROTOCOL)
+                    nb_pages += 1
+    except BaseException:
+        os.remove(spill_path)
+        raise
+    return path, spill_path, nb_pages
+
+
+def _read_pages(spill_path: str):
+    """Relit les pages écrites par :func:`_parse_file`, une à la fois."""
+    with open(spill_path, "rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+class StageStats:
+    """Counters for one pipeline stage."""
+
+    def __init__(self, name: str, workers: int) -> None:
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.chunks = 0
+        self.errors = 0
+        self.busy_time = 0.0
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, items: int = 1, chunks: int = 0, error: bool = False) -> None:
+        with self._lock:
+            now = time.perf_counter()
+            if self.started is None:
+                self.started = now - seconds
+            self.finished = now
+            self.items += items
+            self.chunks += chunks
+            self.busy_time += seconds
+            if error:
+                self.errors += 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        wall = (self.finished - self.started) if self.started is not None else 0.0
+        return {
+            "stage": self.name,
+            "workers": self.workers,
+            "items": self.items,
+            "chunks": self.chunks,
+            "errors": self.errors,
+            "busy_sec": round(self.busy_time, 3),
+            "wall_sec": round(wall, 3),
+            "items_per_sec": round(self.items / wall, 2) if wall else 0.0,
+            "chunks_per_sec": round(self.chunks / wall, 2) if wall else 0.0,
+            # > 1 : le stage est le goulot d'étranglement
+            "utilization": round(self.busy_time / (wall * self.workers), 2) if wall else 0.0,
+        }
+
+
+class IngestionPipeline:
+    """Parse → chunk → embed → upsert with bounded queues between stages."""
+
+    def __init__(
+        self,
+        parse_workers: int = max(1, (os.cpu_count() or 2) - 1),
+        chunk_workers: int = 1,
+        embed_workers: int = 1,
+        upsert_workers: int = 2,
+        embed_batch_size: int = 256,
+        chunk_batch_size: int = 64,
+        queue_size: int = 64,
+        ocr_workers: int = 1,
+        embeddings=None,
+        store: Optional[VectorStore] = None,
+        manifest: Optional[IngestManifest] = None,
+        upsert_wait: bool = True,
+        defer_indexing: bool = False,
+    ) -> None:
+        self.parse_workers = parse_workers
+        self.chunk_workers = chunk_workers
+        self.embed_workers = embed_workers
+        self.upsert_workers = upsert_workers
+        self.embed_batch_size = embed_batch_size
+        # Chunks d'un document envoyés par lots : la mémoire ne croît pas avec sa taille
+        self.chunk_batch_size = max(1, chunk_batch_size)
+        self.queue_size = queue_size
+        # Le parallélisme vient déjà du pool "parse" : 1 = pas de pool OCR imbriqué
+        self.ocr_workers = ocr_workers
+        self.embeddings = embeddings
+        self.store = store
+        self.manifest = manifest
+        # wait=False : upserts acquittés dès l'écriture WAL, barrière en fin de run
+        self.upsert_wait = upsert_wait
+        # Backfill : pas de construction HNSW pendant le chargement, une seule à la fin
+        self.defer_indexing = defer_indexing
+
+        self.stats = {
+            "parse": StageStats("parse", parse_workers),
+            "chunk": StageStats("chunk", chunk_workers),
+            "embed": StageStats("embed", embed_workers),
+            "upsert": StageStats("upsert", upsert_workers),
+        }
+        self.errors: List[Dict[str, str]] = []
+        self._errors_lock = threading.Lock()
+        self.skipped = 0
+        # doc_id -> {"hash", "remaining", "nb_chunks", "chunked", "failed"}
+        self._docs: Dict[str, Dict[str, Any]] = {}
+        self._docs_lock = threading.Lock()
+        self.elapsed = 0.0
+
+    # ------------------------------------------------------------------
+    def _fail(self, path: str, stage: str, exc: Exception) -> None:
+        logger.error("FAIL [%s] %s : %s", stage, path, exc)
+        with self._errors_lock:
+            self.errors.append({"file": path, "stage": stage, "error": str(exc)})
+        doc_id = normalize_path(path)
+        with self._docs_lock:
+            doc = self._docs.get(doc_id)
+            if doc is None or doc["failed"]:
+                return
+            doc["failed"] = True
+        if self.manifest is not None:
+            self.manifest.mark_error(doc_id, doc["hash"], f"[{stage}] {exc}")
+
+    def _chunks_written(self, paths: List[str]) -> None:
+        """Decrement per-file counters; checkpoint files whose chunks are all written."""
+        completed = []
+        with self._docs_lock:
+            for path in paths:
+                doc_id = normalize_path(path)
+                doc = self._docs[doc_id]
+                doc["remaining"] -= 1
+                if doc["remaining"] == 0 and doc["chunked"] and not doc["failed"]:
+                    completed.append((doc_id, doc))
+        for doc_id, doc in completed:
+            self._complete(doc_id, doc)
+
+    def _complete(self, doc_id: str, doc: Dict[str, Any]) -> None:
+        """Tous les chunks du document sont écrits : purge de l'ancienne version, checkpoint."""
+        try:
+            self.store.delete_stale(doc_id, doc["nb_chunks"], wait=self.upsert_wait)
+        except Exception as e:
+            self._fail(doc_id, "upsert", e)
+            return
+        if self.manifest is not None:
+            self.manifest.mark_done(doc_id, doc["hash"], doc["nb_chunks"])
+
+    def _feed_parser(self, paths: Iterable[str], out_q: queue.Queue) -> None:
+        """Submit files to the process pool, keeping a bounded number in flight."""
+        stats = self.stats["parse"]
+        max_inflight = self.parse_workers * 2
+        with ProcessPoolExecutor(max_workers=self.parse_workers) as pool:
+            inflight: Dict[Any, tuple] = {}
+            pending = deque()
+
+            def drain(block: bool) -> None:
+                if not inflight:
+                    return
+                done, _ = wait(list(inflight), timeout=None if block else 0, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    path, submitted = inflight.pop(fut)
+                    elapsed = time.perf_counter() - submitted
+                    try:
+                        _, spill_path, nb_pages = fut.result()
+                        if not nb_pages:
+                            os.remove(spill_path)
+                            raise ValueError("Texte vide ou extraction impossible.")
+                    except Exception as e:
+                        stats.record(elapsed, error=True)
+                        self._fail(path, "parse", e)
+                        continue
+                    stats.record(elapsed)
+                    pending.append((path, spill_path))
+                # put() bloque si le stage "chunk" est saturé (backpressure)
+                while pending:
+                    out_q.put(pending.popleft())
+
+            for path in paths:
+                doc_id = normalize_path(path)
+                digest = None
+                if self.manifest is not None:
+                    try:
+                        unchanged, digest = self.manifest.check_file(path, doc_id)
+                    except OSError as e:
+                        self._fail(path, "parse", e)
+                        continue
+                    if unchanged:
+                        self.skipped += 1
+                        continue
+                    st = os.stat(path)
+                    self.manifest.mark_pending(doc_id, digest, st.st_size, st.st_mtime)
+                with self._docs_lock:
+                    self._docs[doc_id] = {
+                        "hash": digest, "remaining": 0, "nb_chunks": 0, "chunked": False, "failed": False,
+                    }
+                while len(inflight) >= max_inflight:
+                    drain(block=True)
+                inflight[pool.submit(_parse_file, path, self.ocr_workers)] = (path, time.perf_counter())
+                drain(block=False)
+            while inflight:
+                drain(block=True)
+
+    def _chunk_worker(self, in_q: queue.Queue, out_q: queue.Queue) -> None:
+        stats = self.stats["chunk"]
+        while True:
+            item = in_q.get()
+            if item is _DONE:
+                return
+            path, spill_path = item
+            doc_id = normalize_path(path)
+            doc = self._docs[doc_id]
+            busy = 0.0
+            t0 = time.perf_counter()
+            batch: List[Dict[str, Any]] = []
+            try:
+                for chunk in chunk_pages(_read_pages(spill_path), doc_id=doc_id):
+                    batch.append(chunk)
+                    if len(batch) >= self.chunk_batch_size:
+                        busy += time.perf_counter() - t0
+                        self._send_chunks(path, doc, batch, out_q)
+                        batch = []
+                        t0 = time.perf_counter()
+                if batch:
+                    self._send_chunks(path, doc, batch, out_q)
+                if not doc["nb_chunks"]:
+                    raise ValueError("Découpage impossible ou texte trop court.")
+            except Exception as e:
+                stats.record(busy + time.perf_counter() - t0, error=True)
+                self._fail(path, "chunk", e)
+                continue
+            finally:
+                os.remove(spill_path)
+            stats.record(busy + time.perf_counter() - t0, chunks=doc["nb_chunks"])
+            with self._docs_lock:
+                doc["chunked"] = True
+                # Tous les lots déjà écrits (ou aucun) : checkpoint ici
+                completed = doc["remaining"] == 0 and not doc["failed"]
+            if completed:
+                self._complete(doc_id, doc)
+
+    def _send_chunks(self, path: str, doc: Dict[str, Any], batch: List[Dict[str, Any]], out_q: queue.Queue) -> None:
+        # Compté avant le put : l'upsert du lot peut se terminer avant le retour
+        with self._docs_lock:
+            doc["remaining"] += len(batch)
+            doc["nb_chunks"] += len(batch)
+        out_q.put((path, batch))
+
+    def _embed_worker(self, in_q: queue.Queue, out_q: queue.Queue) -> None:
+        stats = self.stats["embed"]
+        batch: List[tuple] = []  # (path, chunk)
+
+        def flush() -> None:
+            if not batch:
+                return
+            t0 = time.perf_counter()
+            try:
+                vectors = embed_chunks([c for _, c in batch], self.embeddings)
+            except Exception as e:
+                stats.record(time.perf_counter() - t0, items=0, error=True)
+                for path in {p for p, _ in batch}:
+                    self._fail(path, "embed", e)
+                batch.clear()
+                return
+            stats.record(time.perf_counter() - t0, items=1, chunks=len(batch))
+            out_q.put((list(batch), vectors))
+            batch.clear()
+
+        while True:
+            item = in_q.get()
+            if item is _DONE:
+                flush()
+                return
+            path, chunks = item
+            for chunk in chunks:
+                batch.append((path, chunk))
+                if len(batch) >= self.embed_batch_size:
+                    flush()
+
+    def _upsert_worker(self, in_q: queue.Queue) -> None:
+        stats = self.stats["upsert"]
+        while True:
+            item = in_q.get()
+            if item is _DONE:
+                return
+            batch, vectors = item
+            t0 = time.perf_counter()
+            try:
+                self.store.upsert([c for _, c in batch], vectors, wait=self.upsert_wait)
+            except Exception as e:
+                stats.record(time.perf_counter() - t0, items=0, error=True)
+                for path in {p for p, _ in batch}:
+                    self._fail(path, "upsert", e)
+                continue
+            stats.record(time.perf_counter() - t0, items=1, chunks=len(batch))
+            self._chunks_written([p for p, _ in batch])
+
+    # ------------------------------------------------------------------
+    def run(self, paths: Iterable[str]) -> Dict[str, Any]:
+        """Ingest ``paths`` and return the throughput report."""
+        self.embeddings = self.embeddings or get_embeddings()
+        self.store = self.store or get_vector_store()
+        self.store.ensure_collection()
+        if self.defer_indexing:
+            self.store.set_deferred_indexing(True)
+
+        chunk_q: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        embed_q: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        upsert_q: queue.Queue = queue.Queue(maxsize=max(2, self.upsert_workers * 2))
+
+        def start(target, args, n):
+            threads = [threading.Thread(target=target, args=args, daemon=True) for _ in range(n)]
+            for t in threads:
+                t.start()
+            return threads
+
+        t0 = time.perf_counter()
+        chunkers = start(self._chunk_worker, (chunk_q, embed_q), self.chunk_workers)
+        embedders = start(self._embed_worker, (embed_q, upsert_q), self.embed_workers)
+        writers = start(self._upsert_worker, (upsert_q,), self.upsert_workers)
+
+        try:
+            # Chaque stage se termine quand il a reçu un _DONE par worker : on
+            # ferme les stages dans l'ordre, en aval du précédent.
+            self._feed_parser(paths, chunk_q)
+            for stage_threads, next_q, next_workers in (
+                (None, chunk_q, self.chunk_workers),
+                (chunkers, embed_q, self.embed_workers),
+                (embedders, upsert_q, self.upsert_workers),
+            ):
+                for t in stage_threads or []:
+                    t.join()
+                for _ in range(next_workers):
+                    next_q.put(_DONE)
+            for t in writers:
+                t.join()
+            if not self.upsert_wait:
+                self.store.barrier()
+        finally:
+            if self.defer_indexing:
+                # Toujours réactiver l'indexation, même après une erreur
+                self.store.set_deferred_indexing(False)
+        if self.defer_indexing:
+            logger.info("Construction de l'index HNSW après chargement...")
+            if not self.store.wait_for_indexing():
+                logger.warning("Indexation HNSW toujours en cours (la collection reste interrogeable).")
+
+        self.elapsed = time.perf_counter() - t0
+        return self.report()
+
+    def report(self) -> Dict[str, Any]:
+        failed = {e["file"] for e in self.errors}
+        parsed = self.stats["parse"].items
+        ocr_cache = get_ocr_cache()
+        embedding_cache = get_embedding_cache()
+        return {
+            "elapsed_sec": round(self.elapsed, 3),
+            "files": parsed,
+            "files_skipped": self.skipped,
+            "files_failed": len(failed),
+            "chunks_indexed": self.stats["upsert"].chunks,
+            "docs_per_sec": round(parsed / self.elapsed, 2) if self.elapsed else 0.0,
+            "stages": [s.as_dict() for s in self.stats.values()],
+            "ocr_cache": ocr_cache.stats() if ocr_cache is not None else None,
+            "embedding_cache": embedding_cache.stats() if embedding_cache is not None else None,
+            "errors": self.errors,
+        }
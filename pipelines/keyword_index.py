@@ -0,0 +1,192 @@
+# pipelines/keyword_index.py
+
+"""Whoosh keyword index kept in step with the vector store.
+
+The keyword index used to be rebuilt by ``build_whoosh_index`` from a blank
+similarity search capped at 10k hits, with documents numbered ``0..n``: every
+rebuild duplicated the index and keyword hits could not be joined to vector
+hits.  ``KeywordIndex`` is keyed by the vector store point ID
+(:func:`pipelines.vectorize.chunk_id`) and written with ``update_document``:
+
+* :class:`pipelines.vector_store.VectorStore` calls :meth:`KeywordIndex.upsert`
+  / :meth:`KeywordIndex.delete_stale` right after each vector write, so
+  re-ingesting a document overwrites its keyword entries instead of adding
+  new ones;
+* :meth:`KeywordIndex.rebuild` recreates the index by scrolling the whole
+  collection page by page (any size), for a first migration or after a drift.
+
+Writes from several threads are serialized in-process; across processes the
+Whoosh write lock is awaited up to ``WHOOSH_LOCK_TIMEOUT`` seconds.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+from whoosh import query as wq
+from whoosh.fields import BOOLEAN, ID, NUMERIC, TEXT, Schema
+from whoosh.index import create_in, exists_in, open_dir
+
+from core.logging import get_logger
+from pipelines.search_filters import FILTER_FIELDS
+
+logger = get_logger(__name__)
+
+WHOOSH_INDEX_DIR = os.getenv(
+    "WHOOSH_INDEX_DIR",
+    os.path.join(os.path.dirname(__file__), "../whoosh_index"),
+)
+WHOOSH_LOCK_TIMEOUT = float(os.getenv("WHOOSH_LOCK_TIMEOUT", 60))
+# Mémoire du writer lors d'une reconstruction complète (Mo)
+WHOOSH_REBUILD_LIMITMB = int(os.getenv("WHOOSH_REBUILD_LIMITMB", 256))
+
+
+def build_schema() -> Schema:
+    # Champs filtrables stockés (cf. pipelines.search_filters) : la recherche
+    # par mots-clés applique les mêmes filtres que la recherche sémantique
+    fields = {}
+    for name, kind in FILTER_FIELDS.items():
+        if kind == "integer":
+            fields[name] = NUMERIC(stored=True)
+        elif kind == "bool":
+            fields[name] = BOOLEAN(stored=True)
+        else:
+            fields[name] = ID(stored=True)
+    return Schema(id=ID(stored=True, unique=True), content=TEXT(stored=True), **fields)
+
+
+def whoosh_fields(metadata: dict) -> dict:
+    """Valeurs des champs filtrables d'un chunk, au format du schéma Whoosh."""
+    fields = {}
+    for name, kind in FILTER_FIELDS.items():
+        value = metadata.get(name)
+        if kind == "bool":
+            fields[name] = bool(value)
+        elif value is None:
+            continue
+        elif kind == "integer":
+            fields[name] = int(value)
+        else:
+            fields[name] = str(value)
+    return fields
+
+
+class KeywordIndex:
+    """Index Whoosh ``point_id -> (contenu, champs filtrables)``."""
+
+    def __init__(self, index_dir: str = WHOOSH_INDEX_DIR, lock_timeout: float = WHOOSH_LOCK_TIMEOUT) -> None:
+        self.index_dir = index_dir
+        self.lock_timeout = lock_timeout
+        self._lock = threading.Lock()
+        self._ix = None
+
+    def is_outdated(self) -> bool:
+        """Index présent mais antérieur au schéma courant (à reconstruire, cf. :meth:`rebuild`)."""
+        if not os.path.isdir(self.index_dir) or not exists_in(self.index_dir):
+            return False
+        return set(open_dir(self.index_dir).schema.names()) != set(build_schema().names())
+
+    def open(self, recreate: bool = False):
+        """
+        Ouvre l'index, le crée s'il est absent. Un index antérieur au schéma
+        courant n'est pas effacé en silence : ``RuntimeError`` tant qu'il n'a
+        pas été reconstruit (:meth:`rebuild`, ``build_whoosh_index``).
+        """
+        schema = build_schema()
+        os.makedirs(self.index_dir, exist_ok=True)
+        ix = None if recreate or not exists_in(self.index_dir) else open_dir(self.index_dir)
+        if ix is not None and set(ix.schema.names()) != set(schema.names()):
+            raise RuntimeError(
+                f"Index Whoosh au schéma obsolète ({self.index_dir}) : "
+                "lancer python -m pipelines.build_whoosh_index"
+            )
+        if ix is None:
+            ix = create_in(self.index_dir, schema)
+        self._ix = ix
+        return ix
+
+    @property
+    def ix(self):
+        if self._ix is None:
+            self.open()
+        return self._ix
+
+    def _writer(self, **kwargs):
+        return self.ix.writer(timeout=self.lock_timeout, **kwargs)
+
+    def upsert(self, chunks: List[Dict[str, Any]], ids: Optional[List[str]] = None) -> None:
+        """Ajoute ou remplace les chunks (clé = ID de point du stockage vectoriel)."""
+        if not chunks:
+            return
+        if ids is None:
+            from pipelines.vectorize import chunk_id
+
+            ids = [chunk_id(chunk) for chunk in chunks]
+        with self._lock:
+            writer = self._writer()
+            try:
+                for pid, chunk in zip(ids, chunks):
+                    writer.update_document(
+                        id=pid, content=chunk.get("page_content", ""), **whoosh_fields(chunk.get("metadata", {}))
+                    )
+            except Exception:
+                writer.cancel()
+                raise
+            writer.commit()
+
+    def delete_stale(self, doc_id: str, nb_chunks: int) -> int:
+        """Supprime les chunks de ``doc_id`` d'index >= ``nb_chunks`` ; retourne leur nombre."""
+        with self._lock:
+            writer = self._writer()
+            try:
+                deleted = writer.delete_by_query(wq.And([
+                    wq.Term("doc_id", doc_id),
+                    wq.NumericRange("chunk_index", nb_chunks, None),
+                ]))
+            except Exception:
+                writer.cancel()
+                raise
+            writer.commit()
+        return deleted
+
+    def rebuild(self, store, page_size: int = 512) -> int:
+        """Recrée l'index à partir de tous les points de ``store`` (pagination ``scroll``)."""
+        with self._lock:
+            self.open(recreate=True)
+            writer = self._writer(limitmb=WHOOSH_REBUILD_LIMITMB)
+            total, offset = 0, None
+            try:
+                while True:
+                    points, offset = store.scroll(limit=page_size, offset=offset)
+                    for point in points:
+                        payload = point["payload"]
+                        writer.update_document(
+                            id=point["id"], content=payload.get("page_content", ""),
+                            **whoosh_fields(payload.get("metadata", {})),
+                        )
+                    total += len(points)
+                    if offset is None:
+                        break
+            except Exception:
+                writer.cancel()
+                raise
+            writer.commit(optimize=True)
+        return total
+
+    def count(self) -> int:
+        with self.ix.searcher() as searcher:
+            return searcher.doc_count()
+
+
+_INDEXES: Dict[str, KeywordIndex] = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def get_keyword_index(index_dir: str = WHOOSH_INDEX_DIR) -> KeywordIndex:
+    """Instance partagée du processus pour ``index_dir``."""
+    with _INDEXES_LOCK:
+        if index_dir not in _INDEXES:
+            _INDEXES[index_dir] = KeywordIndex(index_dir)
+        return _INDEXES[index_dir]
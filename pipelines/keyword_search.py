@@ -0,0 +1,294 @@
+# pipelines/keyword_search.py
+
+"""Long-lived keyword search service.
+
+``hybrid_retrieval.keyword_search`` used to call ``open_dir``, build a
+``QueryParser`` and open a new searcher for every query, which cost a large
+part of the request latency and churned file handles under load.
+``WhooshSearcher`` keeps them open:
+
+* the index is re-opened only when its table of contents changes (a commit by
+  the ingestion, see :mod:`pipelines.keyword_index`, or a full rebuild, which
+  restarts the generation count): the TOC file name and mtime are checked at
+  most every ``KEYWORD_REFRESH_SEC`` seconds;
+* Whoosh searchers are not meant to be shared between threads, so each thread
+  keeps its own searcher and parser and replaces them after a refresh;
+* every query is timed (parse / search / total) and the timings are exposed by
+  :meth:`KeywordSearcher.stats` (``/metrics``).
+
+``KEYWORD_BACKEND=bm25`` serves the same queries from the NumPy BM25 engine of
+:mod:`pipelines.bm25` instead (``BM25Searcher``, reloaded when the snapshot is
+rebuilt).
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from whoosh.index import exists_in, open_dir
+from whoosh.qparser import QueryParser
+
+from core.logging import get_logger
+from pipelines.bm25 import BM25_INDEX_DIR, BM25Index
+from pipelines.keyword_index import WHOOSH_INDEX_DIR
+from pipelines.search_filters import FILTER_FIELDS, normalize_filters, to_whoosh_query
+
+logger = get_logger(__name__)
+
+# whoosh (index tenu à jour à l'ingestion) ou bm25 (instantané NumPy)
+KEYWORD_BACKEND = os.getenv("KEYWORD_BACKEND", "whoosh").lower()
+KEYWORD_REFRESH_SEC = float(os.getenv("KEYWORD_REFRESH_SEC", 1.0))
+# Fenêtre des dernières durées de requête pour les percentiles
+_TIMING_WINDOW = 1000
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class KeywordSearcher(ABC):
+    """Base des services de recherche mots-clés : chronométrage et statistiques."""
+
+    backend = ""
+
+    def __init__(self, refresh_interval: float = KEYWORD_REFRESH_SEC) -> None:
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._generation = -1
+        self._checked_at = 0.0
+        self._timings: "deque[float]" = deque(maxlen=_TIMING_WINDOW)
+        self.queries = 0
+        self.refreshes = 0
+        self.last_timing: Dict[str, float] = {}
+
+    @abstractmethod
+    def search(self, query: str, top_k: int = 10, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Passages ``{"id", "text", "metadata", "score", "source"}`` les plus
+        pertinents, restreints à ceux qui correspondent à ``filters``.
+        """
+
+    def _record(self, timing: Dict[str, float], nb_results: int) -> None:
+        with self._lock:
+            self.queries += 1
+            self._timings.append(timing["total_ms"])
+            self.last_timing = timing
+        logger.debug("Recherche mots-clés %s (%d résultats) : %s", self.backend, nb_results, timing)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            timings = list(self._timings)
+            return {
+                "backend": self.backend,
+                "generation": self._generation,
+                "queries": self.queries,
+                "refreshes": self.refreshes,
+                "last_ms": self.last_timing.get("total_ms"),
+                "avg_ms": round(sum(timings) / len(timings), 3) if timings else None,
+                "p50_ms": _percentile(timings, 0.50),
+                "p95_ms": _percentile(timings, 0.95),
+            }
+
+
+class WhooshSearcher(KeywordSearcher):
+    """Recherche Whoosh avec index et searchers gardés ouverts, thread-safe."""
+
+    backend = "whoosh"
+
+    def __init__(self, index_dir: str = WHOOSH_INDEX_DIR, refresh_interval: float = KEYWORD_REFRESH_SEC) -> None:
+        super().__init__(refresh_interval)
+        self.index_dir = index_dir
+        self._local = threading.local()
+        self._ix = None
+        self._version = None
+
+    def _toc_version(self, ix):
+        """
+        ``(génération, mtime du TOC)`` : une reconstruction (``create_in``)
+        repart de la génération 0, seul le mtime la distingue de l'index remplacé.
+        """
+        generation = ix.latest_generation()
+        toc = os.path.join(self.index_dir, f"_{ix.indexname}_{generation}.toc")
+        return generation, os.stat(toc).st_mtime_ns
+
+    def _index(self):
+        """Index courant et sa version (``None`` si absent), ré-ouvert après un commit ou une reconstruction."""
+        now = time.monotonic()
+        with self._lock:
+            if self._ix is not None and now - self._checked_at < self.refresh_interval:
+                return self._ix, self._version
+            self._checked_at = now
+            if not os.path.isdir(self.index_dir) or not exists_in(self.index_dir):
+                self._ix, self._version, self._generation = None, None, -1
+                return None, None
+            try:
+                if self._ix is None:
+                    self._ix = open_dir(self.index_dir)
+                    self._version = self._toc_version(self._ix)
+                    self._generation = self._version[0]
+                    return self._ix, self._version
+                version = self._toc_version(self._ix)
+            except OSError as e:
+                # TOC remplacé entre la lecture de la génération et le stat
+                logger.debug("Index Whoosh en cours d'écriture : %s", e)
+                self._checked_at = 0.0
+                return self._ix, self._version
+            if version != self._version:
+                logger.debug("Index Whoosh : génération %d -> %d", self._generation, version[0])
+                # Ré-ouverture : le schéma a pu changer (reconstruction complète)
+                self._ix = open_dir(self.index_dir)
+                self._version = version
+                self._generation = version[0]
+                self.refreshes += 1
+            return self._ix, self._version
+
+    def _thread_state(self):
+        ix, version = self._index()
+        if ix is None:
+            return None
+        state = self._local
+        if getattr(state, "version", None) != version:
+            if getattr(state, "searcher", None) is not None:
+                state.searcher.close()
+            state.searcher = ix.searcher()
+            state.parser = QueryParser("content", ix.schema)
+            state.fields = set(ix.schema.names())
+            state.version = version
+        return state
+
+    def search(self, query: str, top_k: int = 10, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        filters = normalize_filters(filters)
+        t0 = time.perf_counter()
+        state = self._thread_state()
+        if state is None:
+            return []
+        if filters and not set(filters) <= state.fields:
+            logger.warning("Index Whoosh sans champs filtrables : relancer build_whoosh_index")
+            return []
+        parsed = state.parser.parse(query)
+        t1 = time.perf_counter()
+        hits = state.searcher.search(parsed, limit=top_k, filter=to_whoosh_query(filters))
+        t2 = time.perf_counter()
+        results = []
+        for hit in hits:
+            stored = hit.fields()
+            results.append({
+                "id": stored.get("id"),
+                "text": stored.get("content", ""),
+                "metadata": {name: stored[name] for name in FILTER_FIELDS if name in stored},
+                "score": hit.score,
+                "source": "keyword",
+            })
+        t3 = time.perf_counter()
+        timing = {
+            "parse_ms": round((t1 - t0) * 1000, 3),
+            "search_ms": round((t2 - t1) * 1000, 3),
+            "total_ms": round((t3 - t0) * 1000, 3),
+        }
+        self._record(timing, len(results))
+        return results
+
+
+class BM25Searcher(KeywordSearcher):
+    """
+    Recherche sur l'index BM25 NumPy ; l'index est rechargé quand son
+    ``meta.json`` change (reconstruction publiée), l'ancien reste utilisable
+    par les requêtes en cours et est fermé à la fin de la dernière.
+    """
+
+    backend = "bm25"
+
+    def __init__(self, index_dir: str = BM25_INDEX_DIR, refresh_interval: float = KEYWORD_REFRESH_SEC) -> None:
+        super().__init__(refresh_interval)
+        self.index_dir = index_dir
+        self._index: Optional[BM25Index] = None
+        self._mtime: Optional[int] = None
+        # Requêtes en cours par index (id) ; index remplacés encore utilisés
+        self._users: Dict[int, int] = {}
+        self._retired: Dict[int, BM25Index] = {}
+
+    def _refresh(self) -> None:
+        # Appelé sous self._lock
+        now = time.monotonic()
+        if self._index is not None and now - self._checked_at < self.refresh_interval:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.stat(os.path.join(self.index_dir, "meta.json")).st_mtime_ns
+        except FileNotFoundError:
+            if self._index is None:
+                logger.warning("Index BM25 absent (%s) : lancer python -m pipelines.bm25 build", self.index_dir)
+            return
+        if mtime == self._mtime:
+            return
+        old, self._index = self._index, BM25Index(self.index_dir)
+        self._mtime = mtime
+        self._generation += 1
+        if self._generation:
+            self.refreshes += 1
+        if old is not None:
+            if self._users.get(id(old)):
+                self._retired[id(old)] = old
+            else:
+                old.close()
+
+    def _acquire(self) -> Optional[BM25Index]:
+        """Index courant, réservé jusqu'à :meth:`_release` (pas de fermeture en cours de requête)."""
+        with self._lock:
+            self._refresh()
+            if self._index is not None:
+                self._users[id(self._index)] = self._users.get(id(self._index), 0) + 1
+            return self._index
+
+    def _release(self, index: BM25Index) -> None:
+        with self._lock:
+            key = id(index)
+            self._users[key] -= 1
+            if self._users[key]:
+                return
+            del self._users[key]
+            retired = self._retired.pop(key, None)
+        if retired is not None:
+            retired.close()
+
+    def search(self, query: str, top_k: int = 10, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        t0 = time.perf_counter()
+        index = self._acquire()
+        if index is None:
+            return []
+        try:
+            results = index.search(query, top_k=top_k, filters=filters)
+        finally:
+            self._release(index)
+        timing = {"total_ms": round((time.perf_counter() - t0) * 1000, 3)}
+        self._record(timing, len(results))
+        return results
+
+
+_searcher: Optional[KeywordSearcher] = None
+_searcher_lock = threading.Lock()
+
+
+def create_keyword_searcher(backend: str = KEYWORD_BACKEND) -> KeywordSearcher:
+    if backend == "bm25":
+        return BM25Searcher()
+    if backend == "whoosh":
+        return WhooshSearcher()
+    raise ValueError(f"Backend de recherche mots-clés inconnu : {backend}")
+
+
+def get_keyword_searcher() -> KeywordSearcher:
+    """Service de recherche mots-clés partagé du processus (backend ``KEYWORD_BACKEND``)."""
+    global _searcher
+    with _searcher_lock:
+        if _searcher is None:
+            _searcher = create_keyword_searcher()
+        return _searcher
@@ -0,0 +1,281 @@
+# pipelines/model_registry.py
+
+"""Process-wide registry of the embedding and reranker models.
+
+Models used to be instantiated at every call site (and, in ``vectorize`` and
+``rag_chain``, on every call), so each ingested file or RAG question paid a
+full model load.  ``ModelRegistry`` holds one instance per model and per
+process:
+
+* a model is loaded on first ``get()`` (or by an explicit ``warmup()``), under
+  a per-model lock so concurrent first calls load it only once;
+* each loaded model records its load time, its parameter memory and the RSS
+  growth observed while loading;
+* models unused for ``MODEL_IDLE_UNLOAD_SEC`` seconds can be unloaded by
+  ``unload_idle()`` (or the background reaper); the next ``get()`` reloads
+  them.
+
+Call sites must not keep the instance in a module global: ask the registry
+(``get_embedding_model()`` / ``get_reranker()``) each time, otherwise an idle
+unload cannot free the memory.
+"""
+
+from __future__ import annotations
+
+import gc
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from core.logging import get_logger
+
+logger = get_logger(__name__)
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "BAAI/bge-reranker-base")
+# Petit cross-encoder du premier étage du rerank en cascade (vide = scores
+# de fusion RRF ; cf. pipelines.rerank_cascade)
+RERANKER_LIGHT_MODEL = os.getenv("RERANKER_LIGHT_MODEL", "")
+# 0 = jamais de déchargement automatique
+MODEL_IDLE_UNLOAD_SEC = float(os.getenv("MODEL_IDLE_UNLOAD_SEC", 0))
+# Modèles chargés au démarrage de l'API (noms séparés par des virgules)
+MODEL_WARMUP = [m.strip() for m in os.getenv("MODEL_WARMUP", "").split(",") if m.strip()]
+
+
+def _rss_bytes() -> Optional[int]:
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+def model_memory_bytes(instance: Any) -> Optional[int]:
+    """Taille des paramètres et buffers torch portés par ``instance`` (ou ses attributs)."""
+    try:
+        import torch
+    except ImportError:
+        return None
+    if isinstance(instance, torch.nn.Module):
+        modules = [instance]
+    else:
+        # HuggingFaceEmbeddings garde le SentenceTransformer dans ``_client``,
+        # BGEReranker le modèle dans ``model``
+        candidates = list(getattr(instance, "__dict__", {}).values())
+        candidates += [getattr(instance, attr, None) for attr in ("client", "_client", "model")]
+        modules = []
+        for value in candidates:
+            if isinstance(value, torch.nn.Module) and all(value is not m for m in modules):
+                modules.append(value)
+    if not modules:
+        return None
+    seen, total = set(), 0
+    for module in modules:
+        for tensor in list(module.parameters()) + list(module.buffers()):
+            if id(tensor) not in seen:
+                seen.add(id(tensor))
+                total += tensor.numel() * tensor.element_size()
+    return total
+
+
+class _Entry:
+    def __init__(self, name: str, loader: Callable[[], Any], warmup: Optional[Callable[[Any], None]], kind: str) -> None:
+        self.name = name
+        self.loader = loader
+        self.warmup = warmup
+        self.kind = kind
+        self.instance: Any = None
+        self.lock = threading.Lock()
+        self.loaded_at: Optional[float] = None
+        self.last_used: Optional[float] = None
+        self.load_seconds: Optional[float] = None
+        self.memory_bytes: Optional[int] = None
+        self.rss_delta_bytes: Optional[int] = None
+        self.loads = 0
+        self.uses = 0
+
+
+class ModelRegistry:
+    """Lazily loaded, shared model instances with memory accounting and idle unloading."""
+
+    def __init__(self) -> None:
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def register(self, name: str, loader: Callable[[], Any], warmup: Optional[Callable[[Any], None]] = None,
+                 kind: str = "model") -> None:
+        """Déclare un modèle ; rien n'est chargé avant le premier ``get()``."""
+        with self._lock:
+            if name in self._entries:
+                raise ValueError(f"Modèle déjà enregistré : {name}")
+            self._entries[name] = _Entry(name, loader, warmup, kind)
+
+    def _entry(self, name: str) -> _Entry:
+        try:
+            return self._entries[name]
+        except KeyError:
+            raise KeyError(f"Modèle inconnu : {name} (enregistrés : {', '.join(self._entries)})") from None
+
+    def get(self, name: str) -> Any:
+        entry = self._entry(name)
+        with entry.lock:
+            if entry.instance is None:
+                self._load(entry)
+            entry.last_used = time.time()
+            entry.uses += 1
+            return entry.instance
+
+    def _load(self, entry: _Entry) -> None:
+        rss_before = _rss_bytes()
+        t0 = time.perf_counter()
+        instance = entry.loader()
+        entry.load_seconds = round(time.perf_counter() - t0, 3)
+        rss_after = _rss_bytes()
+        entry.instance = instance
+        entry.loaded_at = time.time()
+        entry.loads += 1
+        entry.memory_bytes = model_memory_bytes(instance)
+        entry.rss_delta_bytes = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+        logger.info(
+            "Modèle '%s' chargé en %.2fs (paramètres : %s Mo)", entry.name, entry.load_seconds,
+            round(entry.memory_bytes / 2**20, 1) if entry.memory_bytes is not None else "?",
+        )
+
+    def warmup(self, names: Optional[Iterable[str]] = None) -> None:
+        """Charge les modèles (tous par défaut) et exécute leur inférence de chauffe."""
+        for name in list(names) if names is not None else list(self._entries):
+            instance = self.get(name)
+            entry = self._entry(name)
+            if entry.warmup is not None:
+                t0 = time.perf_counter()
+                entry.warmup(instance)
+                logger.info("Modèle '%s' chauffé en %.2fs", name, time.perf_counter() - t0)
+
+    def unload(self, name: str) -> bool:
+        """Libère l'instance partagée ; retourne ``False`` si elle n'était pas chargée."""
+        entry = self._entry(name)
+        with entry.lock:
+            if entry.instance is None:
+                return False
+            entry.instance = None
+            entry.loaded_at = None
+            entry.memory_bytes = None
+            entry.rss_delta_bytes = None
+        gc.collect()
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
+        logger.info("Modèle '%s' déchargé", name)
+        return True
+
+    def unload_idle(self, max_idle_sec: float = MODEL_IDLE_UNLOAD_SEC) -> List[str]:
+        """Décharge les modèles inutilisés depuis plus de ``max_idle_sec`` secondes."""
+        now = time.time()
+        idle = [
+            e.name for e in list(self._entries.values())
+            if e.instance is not None and e.last_used is not None and now - e.last_used > max_idle_sec
+        ]
+        return [name for name in idle if self.unload(name)]
+
+    def start_idle_reaper(self, max_idle_sec: float = MODEL_IDLE_UNLOAD_SEC, interval: Optional[float] = None) -> None:
+        """Thread de fond appelant ``unload_idle`` périodiquement (no-op si ``max_idle_sec`` <= 0)."""
+        if max_idle_sec <= 0 or self._reaper is not None:
+            return
+        interval = interval or max(1.0, max_idle_sec / 4)
+
+        def run():
+            while not self._stop.wait(interval):
+                self.unload_idle(max_idle_sec)
+
+        self._reaper = threading.Thread(target=run, name="model-reaper", daemon=True)
+        self._reaper.start()
+
+    def stop_idle_reaper(self) -> None:
+        self._stop.set()
+        if self._reaper is not None:
+            self._reaper.join()
+        self._reaper = None
+        self._stop.clear()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        now = time.time()
+        return [
+            {
+                "name": e.name,
+                "kind": e.kind,
+                "class": type(e.instance).__name__ if e.instance is not None else None,
+                "loaded": e.instance is not None,
+                "loads": e.loads,
+                "uses": e.uses,
+                "load_seconds": e.load_seconds,
+                "memory_bytes": e.memory_bytes,
+                "rss_delta_bytes": e.rss_delta_bytes,
+                "idle_sec": round(now - e.last_used, 1) if e.last_used is not None else None,
+            }
+            for e in list(self._entries.values())
+        ]
+
+
+# ---------------------------------------------------------------------------
+# Modèles de l'application
+# ---------------------------------------------------------------------------
+
+# ``INFERENCE_BACKEND`` (torch / onnx) : cf. :mod:`pipelines.onnx_backend`
+
+def _load_embeddings():
+    from pipelines.onnx_backend import INFERENCE_BACKEND
+
+    if INFERENCE_BACKEND == "onnx":
+        from pipelines.onnx_backend import OnnxEmbeddings
+
+        return OnnxEmbeddings(EMBEDDING_MODEL)
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+
+
+def _load_reranker(model_name: str = RERANKER_MODEL):
+    from pipelines.onnx_backend import INFERENCE_BACKEND
+
+    if INFERENCE_BACKEND == "onnx":
+        from pipelines.onnx_backend import OnnxReranker
+
+        return OnnxReranker(model_name)
+    from pipelines.rerank import BGEReranker
+
+    return BGEReranker(model_name)
+
+
+registry = ModelRegistry()
+registry.register(
+    "embeddings", _load_embeddings,
+    warmup=lambda model: model.embed_query("warmup"),
+    kind="embedding",
+)
+registry.register(
+    "reranker", _load_reranker,
+    warmup=lambda model: model.rerank("warmup", [{"text": "warmup"}], top_k=1),
+    kind="reranker",
+)
+if RERANKER_LIGHT_MODEL:
+    registry.register(
+        "reranker_light", lambda: _load_reranker(RERANKER_LIGHT_MODEL),
+        warmup=lambda model: model.rerank("warmup", [{"text": "warmup"}], top_k=1),
+        kind="reranker",
+    )
+
+
+def get_embedding_model():
+    """Instance partagée de l'embedder (chargée au premier appel)."""
+    return registry.get("embeddings")
+
+
+def get_reranker():
+    """Instance partagée du reranker BGE (chargée au premier appel)."""
+    return registry.get("reranker")
@@ -0,0 +1,373 @@
+# pipelines/onnx_backend.py
+
+"""ONNX Runtime inference backend for the embedding model and the reranker.
+
+On CPU-only nodes, PyTorch inference of the MiniLM embedder and of
+``BAAI/bge-reranker-base`` dominates query latency.  This module exports both
+models to ONNX once (cached under ``ONNX_MODEL_DIR``), optionally applies
+dynamic int8 quantization, and serves them through ``onnxruntime`` sessions
+with configurable intra/inter-op threads:
+
+``OnnxEmbeddings``
+    LangChain ``Embeddings`` implementation (mean pooling, like
+    sentence-transformers), usable wherever ``HuggingFaceEmbeddings`` was.
+``OnnxReranker``
+    Same ``rerank(query, passages, top_k)`` contract as ``BGEReranker``.
+
+The backend is chosen per deployment with ``INFERENCE_BACKEND`` (``torch`` or
+``onnx``); :mod:`pipelines.model_registry` reads it when loading models.
+``parity_check()`` compares both backends on sample inputs before switching::
+
+    python -m pipelines.onnx_backend export
+    python -m pipelines.onnx_backend parity
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import shutil
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from core.logging import get_logger
+
+logger = get_logger(__name__)
+
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch").lower()
+ONNX_MODEL_DIR = os.getenv(
+    "ONNX_MODEL_DIR",
+    os.path.join(os.path.dirname(__file__), "../onnx_models"),
+)
+ONNX_QUANTIZE = os.getenv("ONNX_QUANTIZE", "1") == "1"
+# 0 = choix d'onnxruntime (tous les coeurs physiques)
+ONNX_INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", 0))
+ONNX_INTER_OP_THREADS = int(os.getenv("ONNX_INTER_OP_THREADS", 0))
+ONNX_OPSET = int(os.getenv("ONNX_OPSET", 14))
+ONNX_EMBED_BATCH_SIZE = int(os.getenv("ONNX_EMBED_BATCH_SIZE", 32))
+# Longueur maximale du reranker ; l'embedder reprend le max_seq_length de sa
+# config sentence-transformers (128 pour le MiniLM par défaut), comme le backend
+# torch, et ne retombe sur cette valeur qu'en l'absence de config
+ONNX_MAX_LENGTH = int(os.getenv("ONNX_MAX_LENGTH", 512))
+ST_CONFIG_FILE = "sentence_bert_config.json"
+
+TASKS = ("embedding", "reranker")
+
+
+def model_dir(model_name: str, base_dir: str = ONNX_MODEL_DIR) -> str:
+    return os.path.join(base_dir, re.sub(r"[^A-Za-z0-9_.-]+", "__", model_name))
+
+
+def model_path(model_name: str, quantize: bool = ONNX_QUANTIZE, base_dir: str = ONNX_MODEL_DIR) -> str:
+    return os.path.join(model_dir(model_name, base_dir), "model.int8.onnx" if quantize else "model.onnx")
+
+
+def _st_config_source(model_name: str) -> Optional[str]:
+    """Chemin de la config sentence-transformers du modèle (dossier local ou hub), ``None`` si absente."""
+    if os.path.isdir(model_name):
+        path = os.path.join(model_name, ST_CONFIG_FILE)
+        return path if os.path.exists(path) else None
+    try:
+        from huggingface_hub import hf_hub_download
+
+        return hf_hub_download(model_name, ST_CONFIG_FILE)
+    except Exception:
+        return None
+
+
+def embedding_max_length(model_name: str, base_dir: str = ONNX_MODEL_DIR) -> int:
+    """``max_seq_length`` de sentence-transformers pour ``model_name`` (sinon ``ONNX_MAX_LENGTH``)."""
+    path = os.path.join(model_dir(model_name, base_dir), ST_CONFIG_FILE)
+    if not os.path.exists(path):
+        path = _st_config_source(model_name)
+    if path:
+        with open(path, encoding="utf-8") as f:
+            max_seq_length = json.load(f).get("max_seq_length")
+        if max_seq_length:
+            return int(max_seq_length)
+    logger.warning("Pas de max_seq_length sentence-transformers pour '%s' : %d tokens", model_name, ONNX_MAX_LENGTH)
+    return ONNX_MAX_LENGTH
+
+
+def export_model(model_name: str, task: str, quantize: bool = ONNX_QUANTIZE,
+                 base_dir: str = ONNX_MODEL_DIR, force: bool = False) -> str:
+    """
+    Exporte ``model_name`` en ONNX (axes batch/séquence dynamiques) avec son
+    tokenizer, puis le quantifie en int8 si demandé. Retourne le chemin du
+    modèle ONNX ; un export déjà présent est réutilisé sauf ``force``.
+    """
+    import torch
+    from transformers import AutoModel, AutoModelForSequenceClassification, AutoTokenizer
+
+    if task not in TASKS:
+        raise ValueError(f"Tâche inconnue : {task} (attendu : {', '.join(TASKS)})")
+    out_dir = model_dir(model_name, base_dir)
+    fp32_path = os.path.join(out_dir, "model.onnx")
+    target = model_path(model_name, quantize, base_dir)
+    if os.path.exists(target) and not force:
+        return target
+    os.makedirs(out_dir, exist_ok=True)
+
+    if force or not os.path.exists(fp32_path):
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        tokenizer.save_pretrained(out_dir)
+        if task == "embedding":
+            # Gardée avec l'export : la longueur de troncature reste connue hors ligne
+            st_config = _st_config_source(model_name)
+            if st_config:
+                shutil.copy(st_config, os.path.join(out_dir, ST_CONFIG_FILE))
+        if task == "embedding":
+            base = AutoModel.from_pretrained(model_name)
+            output_name = "last_hidden_state"
+        else:
+            base = AutoModelForSequenceClassification.from_pretrained(model_name)
+            output_name = "logits"
+        base.eval()
+
+        class _Wrapper(torch.nn.Module):
+            # Sortie unique (tensor) : l'export ONNX ne sait pas tracer un ModelOutput
+            def __init__(self, model):
+                super().__init__()
+                self.model = model
+
+            def forward(self, input_ids, attention_mask):
+                return self.model(input_ids=input_ids, attention_mask=attention_mask)[0]
+
+        sample = tokenizer(["export"], ["export"] if task == "reranker" else None, return_tensors="pt")
+        dynamic = {0: "batch", 1: "sequence"}
+        t0 = time.perf_counter()
+        with torch.inference_mode():
+            torch.onnx.export(
+                _Wrapper(base),
+                (sample["input_ids"], sample["attention_mask"]),
+                fp32_path,
+                input_names=["input_ids", "attention_mask"],
+                output_names=[output_name],
+                dynamic_axes={"input_ids": dynamic, "attention_mask": dynamic, output_name: {0: "batch"}},
+                opset_version=ONNX_OPSET,
+            )
+        logger.info("Export ONNX de '%s' (%s) en %.1fs -> %s", model_name, task, time.perf_counter() - t0, fp32_path)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(fp32_path, target, weight_type=QuantType.QInt8)
+        logger.info(
+            "Quantification int8 de '%s' : %.0f Mo -> %.0f Mo", model_name,
+            os.path.getsize(fp32_path) / 2**20, os.path.getsize(target) / 2**20,
+        )
+    return target
+
+
+def create_session(path: str, intra_op_threads: int = ONNX_INTRA_OP_THREADS,
+                   inter_op_threads: int = ONNX_INTER_OP_THREADS):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if intra_op_threads:
+        options.intra_op_num_threads = intra_op_threads
+    if inter_op_threads:
+        options.inter_op_num_threads = inter_op_threads
+        options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+    return ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+class _OnnxModel:
+    def __init__(self, model_name: str, task: str, quantize: bool = ONNX_QUANTIZE,
+                 base_dir: str = ONNX_MODEL_DIR, max_length: Optional[int] = None) -> None:
+        from transformers import AutoTokenizer
+
+        self.model_name = model_name
+        self.quantize = quantize
+        path = export_model(model_name, task, quantize=quantize, base_dir=base_dir)
+        if max_length is None:
+            max_length = embedding_max_length(model_name, base_dir) if task == "embedding" else ONNX_MAX_LENGTH
+        self.max_length = max_length
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir(model_name, base_dir))
+        self.session = create_session(path)
+        self._inputs = {i.name for i in self.session.get_inputs()}
+
+    def _run(self, encoded) -> np.ndarray:
+        feeds = {k: v.astype(np.int64) for k, v in encoded.items() if k in self._inputs}
+        return self.session.run(None, feeds)[0]
+
+
+class OnnxEmbeddings(_OnnxModel, Embeddings):
+    """Embedder sentence-transformers (mean pooling) servi par onnxruntime."""
+
+    def __init__(self, model_name: str, batch_size: int = ONNX_EMBED_BATCH_SIZE, **kwargs) -> None:
+        super().__init__(model_name, "embedding", **kwargs)
+        self.batch_size = batch_size
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        out = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = list(texts[start:start + self.batch_size])
+            encoded = self.tokenizer(batch, padding=True, truncation=True,
+                                     max_length=self.max_length, return_tensors="np")
+            hidden = self._run(encoded)
+            mask = encoded["attention_mask"][..., None].astype(hidden.dtype)
+            out.append((hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None))
+        if not out:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.concatenate(out).astype(np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.encode([text])[0].tolist()
+
+
+class OnnxReranker(_OnnxModel):
+    """Cross-encoder BGE servi par onnxruntime (même contrat que ``BGEReranker``)."""
+
+    def __init__(self, model_name: str = "BAAI/bge-reranker-base", batch_size: int = 16, **kwargs) -> None:
+        super().__init__(model_name, "reranker", **kwargs)
+        self.batch_size = batch_size
+
+    def score(self, query: str, texts: Sequence[str]) -> np.ndarray:
+        return self.score_pairs([query] * len(texts), texts)
+
+    def score_pairs(self, queries: Sequence[str], texts: Sequence[str]) -> np.ndarray:
+        scores = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = list(texts[start:start + self.batch_size])
+            encoded = self.tokenizer(list(queries[start:start + self.batch_size]), batch, padding=True,
+                                     truncation=True, max_length=self.max_length, return_tensors="np")
+            scores.append(self._run(encoded)[:, 0])
+        return np.concatenate(scores) if scores else np.zeros(0, dtype=np.float32)
+
+    def rerank(self, query, passages, top_k=7):
+        scores = self.score(query, [p["text"] for p in passages])
+        for passage, score in zip(passages, scores):
+            passage["rerank_score"] = float(score)
+        passages = sorted(passages, key=lambda x: -x["rerank_score"])
+        return passages[:top_k]
+
+
+# ---------------------------------------------------------------------------
+# Contrôle de parité torch / ONNX
+# ---------------------------------------------------------------------------
+
+SAMPLE_TEXTS = [
+    "Le contrat est résilié de plein droit en cas de non-paiement à l'échéance.",
+    "La facture n° 2024-118 d'un montant de 12 500 € HT est payable à 30 jours.",
+    "The supplier shall deliver the goods within ten business days of the order.",
+    "Déclaration de sinistre : dégâts des eaux constatés le 3 mars dans les locaux.",
+    "Annual report: revenue grew 12% while operating costs remained stable.",
+    "Le rapport d'expertise conclut à la conformité de l'installation électrique.",
+    # Plus long que les 128 tokens du MiniLM : vérifie que les deux backends tronquent pareil
+    "Conditions générales de vente : le fournisseur s'engage à livrer les marchandises commandées dans un "
+    "délai de dix jours ouvrés à compter de la réception du bon de commande signé. Tout retard de livraison "
+    "supérieur à cinq jours ouvrés ouvre droit, pour l'acheteur, à une pénalité égale à un pour cent du "
+    "montant hors taxes de la commande par jour de retard, dans la limite de dix pour cent. Les factures sont "
+    "payables à trente jours fin de mois ; tout retard de paiement entraîne l'application d'intérêts au taux "
+    "légal majoré de trois points ainsi qu'une indemnité forfaitaire de quarante euros pour frais de "
+    "recouvrement. The warranty covers manufacturing defects for twenty-four months from delivery, excluding "
+    "normal wear and tear, misuse, unauthorised repairs and damage caused by external events.",
+]
+SAMPLE_QUERIES = ["Quel est le délai de paiement de la facture ?", "When must the goods be delivered?"]
+
+
+def _timed(fn, *args):
+    t0 = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - t0
+
+
+def parity_check(embedding_model: str, reranker_model: str, texts: Sequence[str] = SAMPLE_TEXTS,
+                 queries: Sequence[str] = SAMPLE_QUERIES, quantize: bool = ONNX_QUANTIZE,
+                 repeat: int = 3) -> Dict[str, Any]:
+    """
+    Compare les sorties et latences des backends torch et ONNX : similarité
+    cosinus des embeddings, écart des scores de rerank et accord sur
+    l'ordre (top-1 et ordre complet).
+    """
+    from langchain_huggingface import HuggingFaceEmbeddings
+    from pipelines.rerank import BGEReranker
+
+    def best_of(fn, *args):
+        result, best = None, float("inf")
+        for _ in range(repeat):
+            result, secs = _timed(fn, *args)
+            best = min(best, secs)
+        return result, best
+
+    report: Dict[str, Any] = {"quantize": quantize}
+
+    torch_emb = HuggingFaceEmbeddings(model_name=embedding_model)
+    onnx_emb = OnnxEmbeddings(embedding_model, quantize=quantize)
+    ref, t_ref = best_of(torch_emb.embed_documents, list(texts))
+    got, t_got = best_of(onnx_emb.embed_documents, list(texts))
+    ref, got = np.asarray(ref), np.asarray(got)
+    cos = (ref * got).sum(axis=1) / (np.linalg.norm(ref, axis=1) * np.linalg.norm(got, axis=1))
+    report["embeddings"] = {
+        "model": embedding_model,
+        "cosine_min": round(float(cos.min()), 5),
+        "cosine_mean": round(float(cos.mean()), 5),
+        "torch_sec": round(t_ref, 4),
+        "onnx_sec": round(t_got, 4),
+        "speedup": round(t_ref / t_got, 2) if t_got else None,
+    }
+
+    torch_rr = BGEReranker(reranker_model)
+    onnx_rr = OnnxReranker(reranker_model, quantize=quantize)
+    diffs, top1, same_order, t_ref, t_got = [], 0, 0, 0.0, 0.0
+    for query in queries:
+        ref, secs = best_of(torch_rr.rerank, query, [{"text": t} for t in texts], len(texts))
+        t_ref += secs
+        got, secs = best_of(onnx_rr.rerank, query, [{"text": t} for t in texts], len(texts))
+        t_got += secs
+        ref_scores = {p["text"]: p["rerank_score"] for p in ref}
+        diffs += [abs(ref_scores[p["text"]] - p["rerank_score"]) for p in got]
+        top1 += ref[0]["text"] == got[0]["text"]
+        same_order += [p["text"] for p in ref] == [p["text"] for p in got]
+    report["reranker"] = {
+        "model": reranker_model,
+        "score_max_abs_diff": round(float(max(diffs)), 5),
+        "score_mean_abs_diff": round(float(np.mean(diffs)), 5),
+        "top1_agreement": round(top1 / len(queries), 3),
+        "order_agreement": round(same_order / len(queries), 3),
+        "torch_sec": round(t_ref, 4),
+        "onnx_sec": round(t_got, 4),
+        "speedup": round(t_ref / t_got, 2) if t_got else None,
+    }
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from pipelines.model_registry import EMBEDDING_MODEL, RERANKER_MODEL
+
+    parser = argparse.ArgumentParser(description="Backend d'inférence ONNX (export, contrôle de parité)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    exp = sub.add_parser("export", help="Exporte (et quantifie) l'embedder et le reranker")
+    exp.add_argument("--force", action="store_true")
+    exp.add_argument("--no-quantize", action="store_true")
+    par = sub.add_parser("parity", help="Compare les backends torch et ONNX")
+    par.add_argument("--no-quantize", action="store_true")
+    par.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+    quantize = ONNX_QUANTIZE and not args.no_quantize
+
+    if args.command == "export":
+        for name, task in ((EMBEDDING_MODEL, "embedding"), (RERANKER_MODEL, "reranker")):
+            logger.info("-> %s", export_model(name, task, quantize=quantize, force=args.force))
+        return
+
+    report = parity_check(EMBEDDING_MODEL, RERANKER_MODEL, quantize=quantize)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    logger.info("Contrôle de parité torch / ONNX :\n%s", text)
+
+
+if __name__ == "__main__":
+    main()
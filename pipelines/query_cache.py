@@ -0,0 +1,156 @@
+# pipelines/query_cache.py
+
+"""In-process LRU/TTL cache of query embeddings.
+
+A single question used to be embedded several times: once by
+``hybrid_retrieval.semantic_search`` and twice by ``rag_chain`` (by
+``retriever.invoke`` and again inside ``RetrievalQA``).  Popular questions were
+also re-embedded for every user.  ``QueryEmbeddingCache`` keeps recent query
+vectors, keyed by model identity and normalized query text, bounded both in
+size (LRU) and in age (TTL).
+
+Query-side code does not use the cache directly: it builds its vector stores
+with :func:`get_query_embeddings`, a LangChain ``Embeddings`` whose
+``embed_query`` goes through the cache.  Document embeddings are not cached
+here (see :mod:`pipelines.embedding_cache` for the ingestion side).
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from pipelines.embedding_cache import embedding_model_key
+from pipelines.model_registry import get_embedding_model
+
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", 2048))
+# 0 = pas d'expiration
+QUERY_CACHE_TTL_SEC = float(os.getenv("QUERY_CACHE_TTL_SEC", 3600))
+
+
+def normalize_query(query: str) -> str:
+    """
+    Clé de cache d'une question : NFC, espaces de bord retirés, suites
+    d'espaces réduites. Variations que le tokenizer du modèle absorbe déjà ;
+    la casse est gardée (modèle sensible à la casse).
+    """
+    return re.sub(r" {2,}", " ", unicodedata.normalize("NFC", query)).strip()
+
+
+class QueryEmbeddingCache:
+    """Cache LRU + TTL ``(modèle, question normalisée) -> vecteur``, thread-safe."""
+
+    def __init__(self, max_size: int = QUERY_CACHE_SIZE, ttl: float = QUERY_CACHE_TTL_SEC) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[Tuple[str, str], Tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Calculs en cours : deux requêtes simultanées sur la même question
+        # n'appellent le modèle qu'une fois
+        self._inflight: Dict[Tuple[str, str], threading.Event] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _lookup(self, key: Tuple[str, str]) -> Optional[List[float]]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        stored_at, vector = item
+        if self.ttl and time.time() - stored_at > self.ttl:
+            del self._data[key]
+            self.expirations += 1
+            return None
+        self._data.move_to_end(key)
+        return vector
+
+    def get_or_compute(self, model_key: str, query: str, compute: Callable[[str], List[float]]) -> List[float]:
+        """
+        Vecteur de ``query`` ; ``compute(query)`` n'est appelé qu'en cas de
+        miss, sur le texte d'origine : le cache ne change pas les vecteurs.
+        """
+        key = (model_key, normalize_query(query))
+        while True:
+            with self._lock:
+                vector = self._lookup(key)
+                if vector is not None:
+                    self.hits += 1
+                    return vector
+                waiter = self._inflight.get(key)
+                if waiter is None:
+                    self.misses += 1
+                    done = self._inflight[key] = threading.Event()
+                    break
+            # Un autre thread calcule déjà ce vecteur : on attend son résultat
+            waiter.wait()
+        try:
+            vector = compute(query)
+            with self._lock:
+                self._data[key] = (time.time(), vector)
+                self._data.move_to_end(key)
+                while len(self._data) > self.max_size:
+                    self._data.popitem(last=False)
+                    self.evictions += 1
+            return vector
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            done.set()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "ttl_sec": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+query_cache = QueryEmbeddingCache()
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    ``Embeddings`` dont ``embed_query`` passe par :data:`query_cache`. Le
+    modèle est demandé au registre à chaque appel : ce wrapper n'empêche pas
+    le déchargement d'un modèle inactif.
+    """
+
+    def __init__(self, cache: QueryEmbeddingCache = query_cache,
+                 model_getter: Callable[[], Any] = get_embedding_model) -> None:
+        self.cache = cache
+        self.model_getter = model_getter
+
+    def embed_query(self, text: str) -> List[float]:
+        model = self.model_getter()
+        model_key = embedding_model_key(model) or type(model).__name__
+        return self.cache.get_or_compute(model_key, text, model.embed_query)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.model_getter().embed_documents(texts)
+
+
+_query_embeddings = CachedQueryEmbeddings()
+
+
+def get_query_embeddings() -> CachedQueryEmbeddings:
+    """Embeddings à utiliser côté requête (recherche sémantique, RAG)."""
+    return _query_embeddings
@@ -2,19 +2,20 @@
 
 import logging
 from core.logging import get_logger
-from qdrant_client import QdrantClient
-from langchain_qdrant import Qdrant  # Remplace l'ancien import deprecated
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_openai import OpenAI  # Remplace l'ancien import deprecated
 from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
 
 from core.config import settings
+from pipelines.query_cache import get_query_embeddings
+from pipelines.vector_store import VectorStoreRetriever, get_vector_store
 
 logger = get_logger(__name__)
 
 def get_embeddings():
-    return HuggingFaceEmbeddings(model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+    # Modèle partagé + cache des vecteurs de requête : la question n'est
+    # embeddée qu'une fois (retriever.invoke puis RetrievalQA)
+    return get_query_embeddings()
 
 def detect_intention(question: str) -> str:
     q = question.lower()
@@ -77,17 +78,15 @@ RÃ©ponse :
     tpl = templates.get(intention, templates["par_defaut"])
     return PromptTemplate(input_variables=["context", "question"], template=tpl)
 
-def answer_with_rag(question: str, top_k: int = 8, user: str = None) -> dict:
-    # --- installation du vector store Qdrant ---
+def answer_with_rag(question: str, top_k: int = 8, user: str = None, filters: dict = None) -> dict:
+    # --- retriever sur le stockage vectoriel configuré (Qdrant ou NumPy) ---
     embeddings = get_embeddings()
-    client = QdrantClient(url=settings.QDRANT_URL)
-    vectorstore = Qdrant(
-        client=client,
-        collection_name=settings.QDRANT_COLLECTION,
+    retriever = VectorStoreRetriever(
+        store=get_vector_store(settings.QDRANT_COLLECTION),
         embeddings=embeddings,
+        k=top_k,
+        filters=filters,
     )
-
-    retriever = vectorstore.as_retriever(search_kwargs={"k": top_k})
     # Selon ta version de langchain-core, tu peux utiliser invoke() (synchrone) ou ainvoke() (async)
     retrieved_docs = retriever.invoke(question)
 
@@ -1,29 +1,60 @@
 # pipelines/rerank.py
+import os
+from typing import Sequence
+
 import torch
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
 import numpy as np
 
-# TÃ©lÃ©charge le modÃ¨le au premier appel
+# Longueur maximale d'une paire (question, passage) en tokens : au-delà la
+# plus longue des deux est tronquée en premier (une question trop longue
+# ne fait pas échouer le lot)
+RERANKER_MAX_LENGTH = int(os.getenv("RERANKER_MAX_LENGTH", 512))
+RERANKER_BATCH_SIZE = int(os.getenv("RERANKER_BATCH_SIZE", 16))
+
+
+# Télécharge le modèle au premier appel
 class BGEReranker:
-    def __init__(self, model_name="BAAI/bge-reranker-base"):
+    def __init__(self, model_name="BAAI/bge-reranker-base", batch_size=RERANKER_BATCH_SIZE,
+                 max_length=RERANKER_MAX_LENGTH):
         self.tokenizer = AutoTokenizer.from_pretrained(model_name)
         self.model = AutoModelForSequenceClassification.from_pretrained(model_name)
+        self.model.eval()
+        self.batch_size = batch_size
+        self.max_length = max_length
+
+    def score(self, query: str, texts: Sequence[str]) -> np.ndarray:
+        """Scores du cross-encoder pour chaque ``(query, texte)``, dans l'ordre de ``texts``."""
+        return self.score_pairs([query] * len(texts), texts)
+
+    def score_pairs(self, queries: Sequence[str], texts: Sequence[str]) -> np.ndarray:
+        """Scores des paires ``(queries[i], texts[i])`` (questions éventuellement différentes)."""
+        if not len(texts):
+            return np.zeros(0, dtype=np.float32)
+        # Tokenisation de toutes les paires en un appel, sans padding
+        encoded = self.tokenizer(
+            list(queries), list(texts), truncation="longest_first", max_length=self.max_length,
+        )
+        features = [{key: encoded[key][i] for key in encoded.keys()} for i in range(len(texts))]
+        # Tri par longueur : chaque lot est paddé à la longueur de sa plus
+        # longue paire, pas à celle de l'ensemble
+        order = np.argsort([len(f["input_ids"]) for f in features], kind="stable")
+        scores = np.empty(len(texts), dtype=np.float32)
+        device = next(self.model.parameters()).device
+        with torch.inference_mode():
+            for start in range(0, len(order), self.batch_size):
+                idx = order[start:start + self.batch_size]
+                batch = self.tokenizer.pad([features[i] for i in idx], return_tensors="pt")
+                batch = {key: value.to(device) for key, value in batch.items()}
+                logits = self.model(**batch).logits
+                scores[idx] = logits[:, 0].float().cpu().numpy()
+        return scores
 
     def rerank(self, query, passages, top_k=7):
-        pairs = [(query, passage["text"]) for passage in passages]
-        scores = []
-        for q, p in pairs:
-            inputs = self.tokenizer(q, p, truncation=True, padding=True, return_tensors="pt")
-            with torch.no_grad():
-                logits = self.model(**inputs).logits
-            score = logits[0].item()
-            scores.append(score)
+        scores = self.score(query, [passage["text"] for passage in passages])
         # Ajoute les scores au passage
-        for i, passage in enumerate(passages):
-            passage["rerank_score"] = scores[i]
+        for passage, score in zip(passages, scores):
+            passage["rerank_score"] = float(score)
         # Trie et garde top_k
         passages = sorted(passages, key=lambda x: -x["rerank_score"])
         return passages[:top_k]
-
-
-
@@ -0,0 +1,171 @@
+# pipelines/rerank_cascade.py
+
+"""Cascade reranking with early exit.
+
+Every fused candidate used to go through ``bge-reranker-base``, even when the
+retrieval scores already made the ranking obvious.  With ``RERANK_CASCADE=1``
+the candidates go through two stages:
+
+1. a cheap ordering: the RRF score of the fusion
+   (:func:`pipelines.hybrid_retrieval.fuse_candidates`) or, when
+   ``RERANKER_LIGHT_MODEL`` names a small cross-encoder, that model's scores;
+2. the full cross-encoder, only on the first ``RERANK_CASCADE_BAND``
+   candidates of that order, in rounds: the first ``top_k`` candidates, then
+   ``RERANK_CASCADE_STEP`` more at a time.  After a round whose best new
+   score stays ``RERANK_CASCADE_MARGIN`` below the current k-th score, the
+   top_k is considered stable and the remaining candidates are cut off.
+
+Returned passages keep the ``rerank_score`` of the full cross-encoder, so
+confidence thresholds downstream are unchanged.  Both stages go through the
+micro-batching service (:mod:`pipelines.rerank_service`).  Each query reports
+its cut-off rate and an estimate of the latency saved: the service's model
+time per pair times the pairs skipped, minus the first-stage time and the
+queue waits of the rounds after the first.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.logging import get_logger
+from pipelines.model_registry import RERANKER_LIGHT_MODEL
+from pipelines.rerank_service import RerankService, get_rerank_service
+
+logger = get_logger(__name__)
+
+RERANK_CASCADE = os.getenv("RERANK_CASCADE", "0") == "1"
+# Nombre maximal de candidats soumis au cross-encoder complet
+RERANK_CASCADE_BAND = int(os.getenv("RERANK_CASCADE_BAND", 12))
+RERANK_CASCADE_STEP = int(os.getenv("RERANK_CASCADE_STEP", 4))
+# Écart (en score du cross-encoder) sous le k-ième score qui arrête la cascade
+RERANK_CASCADE_MARGIN = float(os.getenv("RERANK_CASCADE_MARGIN", 1.0))
+
+
+class CascadeReranker:
+    """Rerank en deux étages ; ``rerank`` / ``arerank`` retournent ``(passages, stats)``."""
+
+    def __init__(self, band: int = RERANK_CASCADE_BAND, step: int = RERANK_CASCADE_STEP,
+                 margin: float = RERANK_CASCADE_MARGIN, service: Optional[RerankService] = None,
+                 light_service: Optional[RerankService] = None) -> None:
+        self.band = band
+        self.step = max(1, step)
+        self.margin = margin
+        self.service = service or get_rerank_service()
+        if light_service is None and RERANKER_LIGHT_MODEL:
+            light_service = get_rerank_service("reranker_light")
+        self.light_service = light_service
+
+    @staticmethod
+    def _order(passages, first_scores) -> List[Dict[str, Any]]:
+        """Ordre du premier étage (score du petit modèle, sinon RRF, sinon score de recherche)."""
+        if first_scores is not None:
+            for passage, score in zip(passages, first_scores):
+                passage["first_stage_score"] = float(score)
+        else:
+            for passage in passages:
+                passage["first_stage_score"] = passage.get("rrf_score", passage.get("score", 0.0))
+        return sorted(passages, key=lambda p: -p["first_stage_score"])
+
+    def _rounds(self, ordered, top_k):
+        """
+        Générateur des étapes du second étage : produit les textes à scorer,
+        reçoit leurs scores ; sa valeur de retour est ``(passages, stats)``.
+        """
+        band = ordered[:max(self.band, top_k)] if top_k > 0 else []
+        pos, rounds, early_exit = 0, 0, False
+        size = top_k
+        while pos < len(band):
+            chunk = band[pos:pos + size]
+            scores = yield [p["text"] for p in chunk]
+            for passage, score in zip(chunk, scores):
+                passage["rerank_score"] = float(score)
+            pos += len(chunk)
+            rounds += 1
+            if rounds > 1 and pos < len(band):
+                kth = sorted((p["rerank_score"] for p in band[:pos]), reverse=True)[top_k - 1]
+                if max(p["rerank_score"] for p in chunk) + self.margin <= kth:
+                    early_exit = True
+                    break
+            size = self.step
+        reranked = sorted(band[:pos], key=lambda x: -x["rerank_score"])[:top_k]
+        stats = {
+            "candidates": len(ordered),
+            "band": len(band),
+            "scored": pos,
+            "rounds": rounds,
+            "early_exit": early_exit,
+        }
+        return reranked, stats
+
+    def _finish(self, stats, first_ms, full_ms) -> Dict[str, Any]:
+        skipped = stats["candidates"] - stats["scored"]
+        # Temps modèle seul : full_ms inclut l'attente de lot de chaque tour
+        per_pair = self.service.model_ms_per_pair()
+        if per_pair is None:
+            per_pair = full_ms / stats["scored"] if stats["scored"] else 0.0
+        # Attentes des tours supplémentaires (un rerank sans cascade n'en a qu'un)
+        waits = max(0.0, full_ms - per_pair * stats["scored"])
+        extra_waits = waits * (stats["rounds"] - 1) / stats["rounds"] if stats["rounds"] else 0.0
+        stats.update({
+            "cutoff_rate": round(skipped / stats["candidates"], 3) if stats["candidates"] else 0.0,
+            "first_stage_ms": round(first_ms, 1),
+            "full_ms": round(full_ms, 1),
+            # Net du coût du premier étage et des tours supplémentaires
+            "est_saved_ms": round(per_pair * skipped - first_ms - extra_waits, 1),
+        })
+        logger.info(
+            "Rerank en cascade : %d/%d candidats scorés (coupure %.0f %%, %d tours%s), ~%.0f ms économisées",
+            stats["scored"], stats["candidates"], stats["cutoff_rate"] * 100, stats["rounds"],
+            ", arrêt anticipé" if stats["early_exit"] else "", stats["est_saved_ms"],
+        )
+        return stats
+
+    def rerank(self, query, passages, top_k=7) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        t0 = time.perf_counter()
+        first_scores = None
+        if self.light_service is not None:
+            first_scores = self.light_service.score(query, [p["text"] for p in passages])
+        t1 = time.perf_counter()
+        steps = self._rounds(self._order(passages, first_scores), top_k)
+        scores = None
+        while True:
+            try:
+                texts = steps.send(scores)
+            except StopIteration as stop:
+                reranked, stats = stop.value
+                break
+            scores = self.service.score(query, texts)
+        return reranked, self._finish(stats, (t1 - t0) * 1000, (time.perf_counter() - t1) * 1000)
+
+    async def arerank(self, query, passages, top_k=7) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        t0 = time.perf_counter()
+        first_scores = None
+        if self.light_service is not None:
+            first_scores = await self.light_service.ascore(query, [p["text"] for p in passages])
+        t1 = time.perf_counter()
+        steps = self._rounds(self._order(passages, first_scores), top_k)
+        scores = None
+        while True:
+            try:
+                texts = steps.send(scores)
+            except StopIteration as stop:
+                reranked, stats = stop.value
+                break
+            scores = await self.service.ascore(query, texts)
+        return reranked, self._finish(stats, (t1 - t0) * 1000, (time.perf_counter() - t1) * 1000)
+
+
+_cascade: Optional[CascadeReranker] = None
+_cascade_lock = threading.Lock()
+
+
+def get_cascade_reranker() -> CascadeReranker:
+    """Reranker en cascade partagé du processus."""
+    global _cascade
+    with _cascade_lock:
+        if _cascade is None:
+            _cascade = CascadeReranker()
+        return _cascade
@@ -0,0 +1,261 @@
+# pipelines/rerank_service.py
+
+"""Cross-request micro-batching in front of the reranker.
+
+Every request used to call ``get_reranker().rerank`` on its own: under
+concurrent load the cross-encoder ran many small forward passes at once on the
+same cores, and throughput collapsed.  ``RerankService`` funnels all requests
+through a single worker thread:
+
+* callers enqueue their ``(query, passage)`` pairs and wait on a future
+  (:meth:`RerankService.rerank`, or :meth:`RerankService.arerank` from
+  asyncio without holding a pool thread);
+* the worker takes the oldest request, then keeps collecting until the batch
+  holds ``RERANK_BATCH_MAX_PAIRS`` pairs or ``RERANK_BATCH_WAIT_MS``
+  milliseconds have passed since that request was queued;
+* the whole batch, possibly mixing several questions, is scored by one
+  ``score_pairs`` call (length-sorted model batches, see
+  :mod:`pipelines.rerank`) and each caller's future gets its own scores;
+* if that call fails, each request of the batch is scored again on its own,
+  so one bad request does not fail the others;
+* queue wait, batch size (pairs and requests) and model time are exposed by
+  :meth:`RerankService.stats` (``/metrics``).
+
+A single request is never split across batches.  The model is fetched from the
+registry for every batch, so idle unloading keeps working.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from core.logging import get_logger
+from pipelines.model_registry import get_reranker, registry
+
+logger = get_logger(__name__)
+
+RERANK_BATCH_MAX_PAIRS = int(os.getenv("RERANK_BATCH_MAX_PAIRS", 64))
+# Attente maximale d'une requête avant le départ de son lot (millisecondes)
+RERANK_BATCH_WAIT_MS = float(os.getenv("RERANK_BATCH_WAIT_MS", 5))
+# Fenêtre des derniers lots pour les moyennes et percentiles
+_STATS_WINDOW = 1000
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+
+
+class _Pending:
+    __slots__ = ("query", "texts", "future", "enqueued_at")
+
+    def __init__(self, query: str, texts: List[str]) -> None:
+        self.query = query
+        self.texts = texts
+        self.future: Future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class RerankService:
+    """File de paires à scorer, vidée par lots par un thread dédié."""
+
+    def __init__(self, max_pairs: int = RERANK_BATCH_MAX_PAIRS, max_wait_ms: float = RERANK_BATCH_WAIT_MS,
+                 model_getter=get_reranker) -> None:
+        self.max_pairs = max(1, max_pairs)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.model_getter = model_getter
+        self._queue: "deque[_Pending]" = deque()
+        self._cond = threading.Condition()
+        self._worker: Optional[threading.Thread] = None
+        self._stopped = False
+        self._stats_lock = threading.Lock()
+        self._waits: "deque[float]" = deque(maxlen=_STATS_WINDOW)
+        self._pairs: "deque[int]" = deque(maxlen=_STATS_WINDOW)
+        self._requests: "deque[int]" = deque(maxlen=_STATS_WINDOW)
+        self._model_ms: "deque[float]" = deque(maxlen=_STATS_WINDOW)
+        self.batches = 0
+        self.errors = 0
+        self.total_requests = 0
+        self.total_pairs = 0
+
+    # -- API appelant -----------------------------------------------------
+
+    def submit(self, query: str, texts: Sequence[str]) -> Future:
+        """Met les paires en file ; le future reçoit les scores (``np.ndarray``, ordre de ``texts``)."""
+        pending = _Pending(query, list(texts))
+        if not pending.texts:
+            pending.future.set_result(np.zeros(0, dtype=np.float32))
+            return pending.future
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("Service de rerank arrêté")
+            self._ensure_worker()
+            self._queue.append(pending)
+            self._cond.notify()
+        return pending.future
+
+    def score(self, query: str, texts: Sequence[str]) -> np.ndarray:
+        return self.submit(query, texts).result()
+
+    async def ascore(self, query: str, texts: Sequence[str]) -> np.ndarray:
+        return await asyncio.wrap_future(self.submit(query, texts))
+
+    @staticmethod
+    def _apply(passages, scores, top_k):
+        for passage, score in zip(passages, scores):
+            passage["rerank_score"] = float(score)
+        return sorted(passages, key=lambda x: -x["rerank_score"])[:top_k]
+
+    def rerank(self, query, passages, top_k=7):
+        """Même contrat que ``BGEReranker.rerank`` (passages annotés de ``rerank_score``)."""
+        return self._apply(passages, self.score(query, [p["text"] for p in passages]), top_k)
+
+    async def arerank(self, query, passages, top_k=7):
+        return self._apply(passages, await self.ascore(query, [p["text"] for p in passages]), top_k)
+
+    # -- Worker -----------------------------------------------------------
+
+    def _ensure_worker(self) -> None:
+        # Appelé sous self._cond
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="rerank-batcher", daemon=True)
+            self._worker.start()
+
+    def _next_batch(self) -> Optional[List[_Pending]]:
+        """Attend une requête puis complète le lot jusqu'à la taille ou l'échéance."""
+        with self._cond:
+            while not self._queue and not self._stopped:
+                self._cond.wait()
+            if not self._queue:
+                return None
+            batch = [self._queue.popleft()]
+            nb_pairs = len(batch[0].texts)
+            deadline = batch[0].enqueued_at + self.max_wait
+            while nb_pairs < self.max_pairs:
+                if self._queue:
+                    if nb_pairs + len(self._queue[0].texts) > self.max_pairs:
+                        break
+                    pending = self._queue.popleft()
+                    batch.append(pending)
+                    nb_pairs += len(pending.texts)
+                    continue
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0 or self._stopped:
+                    break
+                self._cond.wait(remaining)
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            batch = [p for p in batch if p.future.set_running_or_notify_cancel()]
+            if batch:
+                self._process(batch)
+
+    def _process(self, batch: List[_Pending]) -> None:
+        started = time.perf_counter()
+        queries = [p.query for p in batch for _ in p.texts]
+        texts = [t for p in batch for t in p.texts]
+        try:
+            scores = self.model_getter().score_pairs(queries, texts)
+        except Exception as e:
+            logger.error("Rerank par lot en échec (%d requêtes, %d paires) : %s", len(batch), len(texts), e)
+            with self._stats_lock:
+                self.errors += 1
+            if len(batch) > 1:
+                self._process_each(batch)
+            else:
+                batch[0].future.set_exception(e)
+            return
+        model_ms = (time.perf_counter() - started) * 1000
+        offset = 0
+        for pending in batch:
+            pending.future.set_result(scores[offset:offset + len(pending.texts)])
+            offset += len(pending.texts)
+        with self._stats_lock:
+            self.batches += 1
+            self.total_requests += len(batch)
+            self.total_pairs += len(texts)
+            self._pairs.append(len(texts))
+            self._requests.append(len(batch))
+            self._model_ms.append(model_ms)
+            self._waits.extend((started - p.enqueued_at) * 1000 for p in batch)
+        logger.debug("Lot de rerank : %d requêtes, %d paires, %.1f ms", len(batch), len(texts), model_ms)
+
+    def _process_each(self, batch: List[_Pending]) -> None:
+        """Après l'échec d'un lot : chaque requête est rescorée seule, seule la fautive échoue."""
+        for pending in batch:
+            try:
+                scores = self.model_getter().score_pairs([pending.query] * len(pending.texts), pending.texts)
+            except Exception as e:
+                logger.error("Rerank en échec (%d paires) : %s", len(pending.texts), e)
+                pending.future.set_exception(e)
+            else:
+                pending.future.set_result(scores)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Arrête le worker après avoir traité les requêtes déjà en file."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+            worker = self._worker
+        if worker is not None:
+            worker.join(timeout)
+
+    def model_ms_per_pair(self) -> Optional[float]:
+        """Temps modèle moyen par paire sur les derniers lots (file d'attente exclue)."""
+        with self._stats_lock:
+            pairs = sum(self._pairs)
+            return sum(self._model_ms) / pairs if pairs else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            waits, pairs = list(self._waits), list(self._pairs)
+            requests, model_ms = list(self._requests), list(self._model_ms)
+            stats = {
+                "batches": self.batches,
+                "errors": self.errors,
+                "requests": self.total_requests,
+                "pairs": self.total_pairs,
+            }
+        with self._cond:
+            stats["queued_requests"] = len(self._queue)
+        stats.update({
+            "max_pairs": self.max_pairs,
+            "max_wait_ms": self.max_wait * 1000,
+            "avg_batch_pairs": round(sum(pairs) / len(pairs), 2) if pairs else None,
+            "avg_batch_requests": round(sum(requests) / len(requests), 2) if requests else None,
+            "queue_wait_p50_ms": _percentile(waits, 0.50),
+            "queue_wait_p95_ms": _percentile(waits, 0.95),
+            "model_avg_ms": round(sum(model_ms) / len(model_ms), 3) if model_ms else None,
+        })
+        return stats
+
+
+_services: Dict[str, RerankService] = {}
+_services_lock = threading.Lock()
+
+
+def get_rerank_service(model: str = "reranker") -> RerankService:
+    """
+    Service de rerank partagé du processus pour le modèle ``model`` du
+    registre (worker démarré à la première requête).
+    """
+    with _services_lock:
+        if model not in _services:
+            getter = get_reranker if model == "reranker" else functools.partial(registry.get, model)
+            _services[model] = RerankService(model_getter=getter)
+        return _services[model]
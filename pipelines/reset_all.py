@@ -18,7 +18,10 @@ except Exception as e:
     logger.error("⚠️ Impossible de supprimer la collection Qdrant : %s", e)
 
 # === 2. RESET WHOOSH ===
-WHOOSH_INDEX_DIR = os.path.join(os.path.dirname(__file__), "../whoosh_index")
+WHOOSH_INDEX_DIR = os.getenv(
+    "WHOOSH_INDEX_DIR",
+    os.path.join(os.path.dirname(__file__), "../whoosh_index"),
+)
 whoosh_dir = os.path.abspath(WHOOSH_INDEX_DIR)
 
 if os.path.isdir(whoosh_dir):
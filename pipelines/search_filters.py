@@ -0,0 +1,162 @@
+# pipelines/search_filters.py
+
+"""Structured metadata filters for retrieval.
+
+Users often know which file or document type a question is about; a filter
+such as ``{"ext": "pdf", "filename": ["a.pdf", "b.pdf"]}`` restricts the
+search to the matching chunks instead of the whole collection.
+
+A filter is a ``dict`` ``field -> condition`` over the chunk metadata written
+at ingestion (see :mod:`pipelines.vectorize`), all conditions being ANDed:
+
+* a scalar: exact match;
+* a list: match any of the values;
+* for integer fields, ``{"gte": ..., "lte": ...}`` (``gt`` / ``lt`` too).
+
+Only the fields of :data:`FILTER_FIELDS` are accepted.  Each of them is backed
+by a Qdrant payload index (:func:`pipelines.vectorize.ensure_payload_indexes`),
+a SQLite index in the NumPy store and a stored Whoosh field, so a filtered
+query only scores the matching subset.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Tuple
+
+# champ de métadonnée -> type d'index (keyword / integer / bool)
+FILTER_FIELDS: Dict[str, str] = {
+    "doc_id": "keyword",
+    "filename": "keyword",
+    "ext": "keyword",
+    "block_type": "keyword",
+    "sheet": "keyword",
+    "page": "integer",
+    "chunk_index": "integer",
+    "ocr": "bool",
+}
+RANGE_OPS = ("gt", "gte", "lt", "lte")
+_SQL_OPS = {"gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+
+
+def _check_value(field: str, kind: str, value: Any) -> Any:
+    if kind == "bool":
+        if not isinstance(value, bool):
+            raise ValueError(f"Filtre '{field}' : booléen attendu ({value!r})")
+    elif kind == "integer":
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise ValueError(f"Filtre '{field}' : entier attendu ({value!r})")
+    elif not isinstance(value, str):
+        value = str(value)
+    if kind == "keyword" and field == "ext":
+        value = value.lower().lstrip(".")
+    return value
+
+
+def normalize_filters(filters: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Valide ``filters`` et le met sous forme canonique (scalaire, liste ou
+    ``{"gte", ...}``). Lève ``ValueError`` sur un champ ou une valeur invalide.
+    """
+    if not filters:
+        return {}
+    normalized: Dict[str, Any] = {}
+    for field, condition in filters.items():
+        kind = FILTER_FIELDS.get(field)
+        if kind is None:
+            raise ValueError(f"Champ de filtre inconnu : {field} (autorisés : {', '.join(FILTER_FIELDS)})")
+        if isinstance(condition, dict):
+            if kind != "integer" or not condition or set(condition) - set(RANGE_OPS):
+                raise ValueError(f"Filtre '{field}' : intervalle invalide ({condition!r})")
+            normalized[field] = {op: _check_value(field, kind, v) for op, v in condition.items()}
+        elif isinstance(condition, (list, tuple, set)):
+            values = [_check_value(field, kind, v) for v in condition]
+            if not values:
+                raise ValueError(f"Filtre '{field}' : liste vide")
+            normalized[field] = values[0] if len(values) == 1 else values
+        else:
+            normalized[field] = _check_value(field, kind, condition)
+    return normalized
+
+
+def to_qdrant_filter(filters: Dict[str, Any]):
+    """Filtre Qdrant équivalent (``None`` sans condition)."""
+    if not filters:
+        return None
+    from qdrant_client.models import FieldCondition, Filter, MatchAny, MatchValue, Range
+
+    must, must_not = [], []
+    for field, condition in filters.items():
+        key = f"metadata.{field}"
+        if isinstance(condition, dict):
+            must.append(FieldCondition(key=key, range=Range(**condition)))
+        elif isinstance(condition, list):
+            must.append(FieldCondition(key=key, match=MatchAny(any=condition)))
+        elif condition is False:
+            # ``ocr`` n'est écrit que pour les pages OCRisées : "faux" = absent ou false
+            must_not.append(FieldCondition(key=key, match=MatchValue(value=True)))
+        else:
+            must.append(FieldCondition(key=key, match=MatchValue(value=condition)))
+    return Filter(must=must or None, must_not=must_not or None)
+
+
+def sql_column(field: str, columns: Optional[Dict[str, str]] = None) -> str:
+    """Expression SQL d'un champ : colonne dédiée si fournie, sinon ``json_extract`` du payload."""
+    if columns and field in columns:
+        return columns[field]
+    return f"json_extract(payload, '$.metadata.{field}')"
+
+
+def to_sql_where(filters: Dict[str, Any], columns: Optional[Dict[str, str]] = None) -> Tuple[str, List[Any]]:
+    """
+    Clause ``WHERE`` SQLite (table avec une colonne JSON ``payload``) d'un
+    filtre normalisé ; les noms de champs, validés, ne viennent jamais de
+    l'utilisateur tels quels.
+    """
+    clauses, params = [], []
+    for field, condition in filters.items():
+        column = sql_column(field, columns)
+        if isinstance(condition, dict):
+            for op, value in condition.items():
+                clauses.append(f"{column} {_SQL_OPS[op]} ?")
+                params.append(value)
+        elif isinstance(condition, list):
+            clauses.append(f"{column} IN ({','.join('?' * len(condition))})")
+            params.extend(condition)
+        elif FILTER_FIELDS[field] == "bool":
+            # ``ocr`` absent = faux
+            clauses.append(f"COALESCE({column}, 0) = ?")
+            params.append(int(condition))
+        else:
+            clauses.append(f"{column} = ?")
+            params.append(condition)
+    return " AND ".join(clauses), params
+
+
+def to_whoosh_query(filters: Dict[str, Any]):
+    """Requête Whoosh équivalente sur les champs stockés (``None`` sans condition)."""
+    if not filters:
+        return None
+    from whoosh import query as wq
+
+    clauses = []
+    for field, condition in filters.items():
+        kind = FILTER_FIELDS[field]
+        if isinstance(condition, dict):
+            low = condition.get("gte", condition.get("gt"))
+            high = condition.get("lte", condition.get("lt"))
+            clauses.append(wq.NumericRange(
+                field, low, high, startexcl="gt" in condition, endexcl="lt" in condition,
+            ))
+        elif isinstance(condition, list):
+            clauses.append(wq.Or([_whoosh_term(field, kind, v) for v in condition]))
+        else:
+            clauses.append(_whoosh_term(field, kind, condition))
+    return wq.And(clauses)
+
+
+def _whoosh_term(field: str, kind: str, value: Any):
+    from whoosh import query as wq
+
+    if kind == "integer":
+        return wq.NumericRange(field, value, value)
+    return wq.Term(field, value)
@@ -0,0 +1,454 @@
+# pipelines/vector_store.py
+
+"""Backends de stockage des vecteurs.
+
+Le code d'ingestion et de recherche parlait directement à un serveur Qdrant.
+Ce module introduit une petite interface ``VectorStore`` et deux
+implémentations :
+
+``QdrantStore``
+    Une collection Qdrant (serveur, ou mode local/embarqué via ``QDRANT_PATH``).
+
+``NumpyStore``
+    Recherche exacte dans le processus : vecteurs normalisés (L2) dans une
+    matrice ``float32`` memmappée, payloads et index ``id de point -> ligne``
+    dans SQLite ; une requête est un produit matrice-vecteur suivi d'un top-k
+    par ``argpartition``. Pour les petits déploiements, les tests sans
+    serveur, et comme référence de latence face à Qdrant.
+
+Les deux backends acceptent les filtres de métadonnées de
+:mod:`pipelines.search_filters` ; seuls les points retenus sont scorés. Un
+store peut porter un :class:`pipelines.keyword_index.KeywordIndex`, mis à jour
+après chaque écriture de vecteurs avec les mêmes IDs de point (c'est le cas du
+store partagé de la collection par défaut, cf. ``KEYWORD_INDEX_ON_INGEST``).
+
+Les points sont les chunks produits par :mod:`pipelines.vectorize`
+(``{"page_content", "metadata"}``) et gardent les mêmes IDs déterministes dans
+les deux backends. Le backend est choisi par ``VECTOR_STORE_BACKEND``
+(``qdrant`` ou ``numpy``) ; :func:`get_vector_store` renvoie l'instance
+partagée du processus.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+
+from core.logging import get_logger
+from pipelines.vectorize import (
+    EMBEDDING_SIZE,
+    QDRANT_COLLECTION,
+    QDRANT_LOCAL,
+    chunk_id,
+    delete_stale_chunks,
+    ensure_qdrant_collection,
+    get_qdrant_client,
+    set_deferred_indexing,
+    upsert_chunks,
+    wait_for_indexing,
+    write_barrier,
+)
+from pipelines.search_filters import FILTER_FIELDS, normalize_filters, sql_column, to_qdrant_filter, to_sql_where
+
+logger = get_logger(__name__)
+
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "qdrant").lower()
+NUMPY_STORE_PATH = os.getenv(
+    "NUMPY_STORE_PATH",
+    os.path.join(os.path.dirname(__file__), "../numpy_store"),
+)
+# Index Whoosh tenu à jour à l'ingestion (collection par défaut uniquement)
+KEYWORD_INDEX_ON_INGEST = os.getenv("KEYWORD_INDEX_ON_INGEST", "1") == "1"
+
+
+class VectorStore(ABC):
+    """Interface abstraite des backends de stockage des vecteurs de chunks."""
+
+    collection_name: str
+    # KeywordIndex mis à jour après chaque écriture (None = pas d'index mots-clés)
+    keyword_index = None
+    # Écritures simultanées possibles (BulkLoader parallèle)
+    concurrent_writes = True
+
+    @abstractmethod
+    def ensure_collection(self, dim: int = EMBEDDING_SIZE) -> None:
+        """Crée la collection si elle n'existe pas encore."""
+
+    def upsert(self, chunks: List[Dict[str, Any]], vectors: Sequence[Sequence[float]], wait: bool = True) -> int:
+        """
+        Insère ou écrase des chunks (même ID = même point) ; renvoie le nombre
+        écrit. L'index mots-clés éventuel est mis à jour une fois l'écriture
+        des vecteurs réussie : un échec y fait échouer toute l'écriture, qui
+        est idempotente et peut être rejouée. Les IDs de point sont calculés
+        une seule fois : un chunk sans ``doc_id`` a le même ID aléatoire dans
+        les deux index.
+        """
+        ids = [chunk_id(chunk) for chunk in chunks]
+        written = self._upsert(chunks, vectors, ids, wait)
+        if self.keyword_index is not None:
+            self.keyword_index.upsert(chunks, ids)
+        return written
+
+    def delete_stale(self, doc_id: str, nb_chunks: int, wait: bool = True) -> None:
+        """Supprime les chunks de ``doc_id`` dont le ``chunk_index`` est >= ``nb_chunks``."""
+        self._delete_stale(doc_id, nb_chunks, wait)
+        if self.keyword_index is not None:
+            self.keyword_index.delete_stale(doc_id, nb_chunks)
+
+    @abstractmethod
+    def _upsert(self, chunks: List[Dict[str, Any]], vectors: Sequence[Sequence[float]],
+                ids: List[str], wait: bool) -> int:
+        """Écriture côté backend de :meth:`upsert`, avec l'ID de point de chaque chunk."""
+
+    @abstractmethod
+    def _delete_stale(self, doc_id: str, nb_chunks: int, wait: bool) -> None:
+        """Suppression côté backend de :meth:`delete_stale`."""
+
+    @abstractmethod
+    def search(self, vector: Sequence[float], top_k: int = 10,
+               filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Chunks les plus proches (cosinus), du meilleur au moins bon, sous la
+        forme ``{"id", "text", "metadata", "score"}`` ; restreints aux chunks
+        retenus par ``filters`` le cas échéant.
+        """
+
+    @abstractmethod
+    def scroll(self, limit: int = 256, offset: Any = None) -> Tuple[List[Dict[str, Any]], Any]:
+        """Une page de points ``{"id", "payload"}`` et l'offset de la suivante (``None`` à la fin)."""
+
+    @abstractmethod
+    def count(self) -> int:
+        """Nombre de points de la collection."""
+
+    def barrier(self) -> None:
+        """Rend la main une fois toutes les écritures précédentes appliquées (sans effet pour un backend synchrone)."""
+
+    def set_deferred_indexing(self, enabled: bool) -> None:
+        """Suspend/reprend la construction d'index pendant un backfill (sans effet sans index ANN)."""
+
+    def wait_for_indexing(self, timeout: float = 600) -> bool:
+        return True
+
+    def close(self) -> None:
+        pass
+
+
+class QdrantStore(VectorStore):
+    """Collection Qdrant (serveur ou mode local)."""
+
+    def __init__(self, client=None, collection_name: str = QDRANT_COLLECTION, local: Optional[bool] = None) -> None:
+        self.client = client or get_qdrant_client()
+        self.collection_name = collection_name
+        # ``local`` : client passé en mode local/embarqué (défaut : ``QDRANT_PATH``)
+        self.concurrent_writes = not (QDRANT_LOCAL if local is None else local)
+
+    def ensure_collection(self, dim: int = EMBEDDING_SIZE, **options) -> None:
+        ensure_qdrant_collection(self.client, self.collection_name, dim, **options)
+
+    def _upsert(self, chunks, vectors, ids, wait):
+        return upsert_chunks(self.client, chunks, vectors, self.collection_name, wait=wait, ids=ids)
+
+    def _delete_stale(self, doc_id, nb_chunks, wait):
+        delete_stale_chunks(self.client, doc_id, nb_chunks, self.collection_name, wait=wait)
+
+    def search(self, vector, top_k=10, filters=None):
+        hits = self.client.query_points(
+            collection_name=self.collection_name, query=list(vector), limit=top_k, with_payload=True,
+            query_filter=to_qdrant_filter(normalize_filters(filters)),
+        ).points
+        return [
+            {
+                "id": str(hit.id),
+                "text": (hit.payload or {}).get("page_content", ""),
+                "metadata": (hit.payload or {}).get("metadata", {}),
+                "score": float(hit.score),
+            }
+            for hit in hits
+        ]
+
+    def scroll(self, limit=256, offset=None):
+        points, next_offset = self.client.scroll(
+            collection_name=self.collection_name, limit=limit, offset=offset,
+            with_payload=True, with_vectors=False,
+        )
+        return [{"id": str(p.id), "payload": p.payload or {}} for p in points], next_offset
+
+    def count(self):
+        return self.client.count(collection_name=self.collection_name, exact=True).count
+
+    def barrier(self):
+        write_barrier(self.client, self.collection_name)
+
+    def set_deferred_indexing(self, enabled):
+        set_deferred_indexing(self.client, enabled, self.collection_name)
+
+    def wait_for_indexing(self, timeout=600):
+        return wait_for_indexing(self.client, self.collection_name, timeout=timeout)
+
+    def close(self):
+        self.client.close()
+
+
+class NumpyStore(VectorStore):
+    """
+    Recherche exacte en mémoire : matrice ``float32`` memmappée
+    (``<collection>.f32``, vecteurs normalisés) + index SQLite
+    ``id -> (row, payload)``. Les lignes libérées par une suppression sont
+    réutilisées. Thread-safe ; un seul processus écrivain à la fois.
+    """
+
+    def __init__(self, path: str = NUMPY_STORE_PATH, collection_name: str = QDRANT_COLLECTION) -> None:
+        self.path = path
+        self.collection_name = collection_name
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.RLock()
+        self._matrix: Optional[np.memmap] = None
+        self._dim: Optional[int] = None
+        self._alive = np.zeros(0, dtype=bool)
+        self._size = 0
+        self._free: List[int] = []
+        self._conn = sqlite3.connect(os.path.join(path, f"{collection_name}.db"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS points (
+                id TEXT PRIMARY KEY,
+                row INTEGER NOT NULL,
+                doc_id TEXT,
+                chunk_index INTEGER,
+                payload TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS points_doc ON points (doc_id, chunk_index)")
+        # Index d'expression sur les champs filtrables (cf. pipelines.search_filters)
+        for field in FILTER_FIELDS:
+            if field not in _POINT_COLUMNS:
+                self._conn.execute(f"CREATE INDEX IF NOT EXISTS points_{field} ON points ({sql_column(field)})")
+        self._conn.commit()
+        dim = self._conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+        if dim is not None:
+            self._open(dim[0])
+
+    @property
+    def _data_path(self) -> str:
+        return os.path.join(self.path, f"{self.collection_name}.f32")
+
+    def _open(self, dim: int) -> None:
+        self._dim = dim
+        if not os.path.exists(self._data_path):
+            open(self._data_path, "wb").close()
+        capacity = os.path.getsize(self._data_path) // (dim * 4)
+        self._matrix = np.memmap(self._data_path, dtype=np.float32, mode="r+", shape=(capacity, dim)) if capacity else None
+        rows = [r for (r,) in self._conn.execute("SELECT row FROM points")]
+        size = max(rows) + 1 if rows else 0
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._alive[rows] = True
+        self._size = size
+        self._free = [r for r in range(size) if not self._alive[r]]
+
+    def _grow(self, needed: int) -> None:
+        capacity = self._matrix.shape[0] if self._matrix is not None else 0
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2, 1024)
+        if self._matrix is not None:
+            self._matrix.flush()
+            self._matrix = None
+        with open(self._data_path, "r+b") as f:
+            f.truncate(new_capacity * self._dim * 4)
+        self._matrix = np.memmap(self._data_path, dtype=np.float32, mode="r+", shape=(new_capacity, self._dim))
+        alive = np.zeros(new_capacity, dtype=bool)
+        alive[:capacity] = self._alive
+        self._alive = alive
+
+    def ensure_collection(self, dim: int = EMBEDDING_SIZE, **options) -> None:
+        with self._lock:
+            if self._dim is None:
+                self._conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('dim', ?)", (dim,))
+                self._conn.commit()
+                self._open(dim)
+            elif self._dim != dim:
+                raise ValueError(f"Dimension {dim} incohérente avec la collection '{self.collection_name}' ({self._dim})")
+
+    def _upsert(self, chunks, vectors, ids, wait):
+        if not chunks:
+            return 0
+        data = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(data, axis=1, keepdims=True)
+        data = data / np.where(norms == 0, 1, norms)
+        with self._lock:
+            if self._dim is None:
+                self.ensure_collection(data.shape[1])
+            rows, records, batch_rows = [], [], {}
+            for pid, chunk in zip(ids, chunks):
+                existing = self._conn.execute("SELECT row FROM points WHERE id = ?", (pid,)).fetchone()
+                if pid in batch_rows:
+                    row = batch_rows[pid]
+                elif existing is not None:
+                    row = existing[0]
+                elif self._free:
+                    row = self._free.pop()
+                else:
+                    row = self._size
+                    self._size += 1
+                batch_rows[pid] = row
+                rows.append(row)
+                meta = chunk["metadata"]
+                records.append((
+                    pid, row, meta.get("doc_id"), meta.get("chunk_index"),
+                    json.dumps({"page_content": chunk["page_content"], "metadata": meta}, ensure_ascii=False, default=str),
+                ))
+            self._grow(self._size)
+            self._matrix[rows] = data
+            self._alive[rows] = True
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO points (id, row, doc_id, chunk_index, payload) VALUES (?, ?, ?, ?, ?)", records
+            )
+            self._conn.commit()
+            if wait:
+                self._matrix.flush()
+        return len(chunks)
+
+    def _delete_stale(self, doc_id, nb_chunks, wait):
+        with self._lock:
+            rows = [r for (r,) in self._conn.execute(
+                "SELECT row FROM points WHERE doc_id = ? AND chunk_index >= ?", (doc_id, nb_chunks)
+            )]
+            if not rows:
+                return
+            self._conn.execute("DELETE FROM points WHERE doc_id = ? AND chunk_index >= ?", (doc_id, nb_chunks))
+            self._conn.commit()
+            self._alive[rows] = False
+            self._free.extend(rows)
+
+    def search(self, vector, top_k=10, filters=None):
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        filters = normalize_filters(filters)
+        with self._lock:
+            if self._matrix is None or not self._size:
+                return []
+            if filters:
+                # Seules les lignes retenues par le filtre SQL sont scorées
+                where, params = to_sql_where(filters, _POINT_COLUMNS)
+                candidates = np.fromiter(
+                    (r for (r,) in self._conn.execute(f"SELECT row FROM points WHERE {where}", params)),
+                    dtype=np.int64,
+                )
+                scores = self._matrix[candidates] @ query if len(candidates) else np.zeros(0, np.float32)
+                available = len(candidates)
+            else:
+                candidates = None
+                scores = self._matrix[:self._size] @ query
+                scores[~self._alive[:self._size]] = -np.inf
+                available = int(self._alive[:self._size].sum())
+            k = min(top_k, available)
+            if k <= 0:
+                return []
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            top = candidates[best] if candidates is not None else best
+            by_row = {
+                row: (pid, payload) for pid, row, payload in self._conn.execute(
+                    f"SELECT id, row, payload FROM points WHERE row IN ({','.join('?' * len(top))})",
+                    [int(r) for r in top],
+                )
+            }
+        results = []
+        for row, pos in zip(top, best):
+            pid, payload = by_row[int(row)]
+            payload = json.loads(payload)
+            results.append({
+                "id": pid,
+                "text": payload.get("page_content", ""),
+                "metadata": payload.get("metadata", {}),
+                "score": float(scores[pos]),
+            })
+        return results
+
+    def scroll(self, limit=256, offset=None):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, payload FROM points WHERE id > ? ORDER BY id LIMIT ?", (offset or "", limit + 1)
+            ).fetchall()
+        points = [{"id": pid, "payload": json.loads(payload)} for pid, payload in rows[:limit]]
+        return points, (rows[limit - 1][0] if len(rows) > limit else None)
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM points").fetchone()[0]
+
+    def barrier(self):
+        with self._lock:
+            if self._matrix is not None:
+                self._matrix.flush()
+
+    def close(self):
+        self.barrier()
+
+
+# Champs portés par une colonne dédiée de la table ``points``
+_POINT_COLUMNS = {"doc_id": "doc_id", "chunk_index": "chunk_index"}
+
+
+class VectorStoreRetriever(BaseRetriever):
+    """Retriever LangChain au-dessus d'un :class:`VectorStore` (pour ``RetrievalQA``)."""
+
+    store: Any
+    embeddings: Embeddings
+    k: int = 8
+    filters: Optional[Dict[str, Any]] = None
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        hits = self.store.search(self.embeddings.embed_query(query), top_k=self.k, filters=self.filters)
+        return [Document(page_content=h["text"], metadata=h["metadata"]) for h in hits]
+
+
+def create_vector_store(backend: str = VECTOR_STORE_BACKEND, collection_name: str = QDRANT_COLLECTION) -> VectorStore:
+    if backend == "numpy":
+        return NumpyStore(NUMPY_STORE_PATH, collection_name)
+    if backend == "qdrant":
+        return QdrantStore(collection_name=collection_name)
+    raise ValueError(f"Backend de stockage vectoriel inconnu : {backend}")
+
+
+_STORES: Dict[Tuple[int, str], VectorStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_vector_store(collection_name: str = QDRANT_COLLECTION) -> VectorStore:
+    """
+    Instance partagée du processus pour ``collection_name`` (backend
+    ``VECTOR_STORE_BACKEND``). Celle de la collection par défaut alimente
+    l'index Whoosh si ``KEYWORD_INDEX_ON_INGEST``.
+    """
+    key = (os.getpid(), collection_name)
+    with _STORES_LOCK:
+        if key not in _STORES:
+            store = create_vector_store(collection_name=collection_name)
+            if KEYWORD_INDEX_ON_INGEST and collection_name == QDRANT_COLLECTION:
+                from pipelines.keyword_index import get_keyword_index
+
+                keyword_index = get_keyword_index()
+                if keyword_index.is_outdated():
+                    # Schéma des champs filtrables changé : reconstruction depuis la collection
+                    logger.warning("Index Whoosh au schéma obsolète : reconstruction depuis '%s'", collection_name)
+                    keyword_index.rebuild(store)
+                store.keyword_index = keyword_index
+            _STORES[key] = store
+        return _STORES[key]
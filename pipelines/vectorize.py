@@ -1,75 +1,400 @@
 # pipelines/vectorize.py
 
 import os
+import time
+import uuid
 import logging
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Qdrant as QdrantVectorStore
+from concurrent.futures import ThreadPoolExecutor
 from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams
+from qdrant_client.http.models import (
+    CollectionStatus,
+    Distance,
+    FieldCondition,
+    Filter,
+    FilterSelector,
+    HnswConfigDiff,
+    MatchValue,
+    OptimizersConfigDiff,
+    PayloadSchemaType,
+    PointIdsList,
+    PointStruct,
+    Range,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    VectorParams,
+)
+
+from pipelines.chunking import get_chunker
+from pipelines.embedding_cache import embedding_model_key, get_embedding_cache, round_vectors
+from pipelines.model_registry import EMBEDDING_MODEL, get_embedding_model
+from pipelines.search_filters import FILTER_FIELDS
 
 # --- CONFIG ---
-QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
-QDRANT_COLLECTION = "docs"
-EMBEDDING_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+def _setting(name: str, default: str) -> str:
+    """
+    Valeur de ``core.config.settings`` (variables d'environnement et ``.env``),
+    comme la recherche ; variable d'environnement seule si les settings ne se
+    chargent pas (ex. ingestion sans ``OPENAI_API_KEY``).
+    """
+    try:
+        from core.config import settings
+    except Exception:
+        return os.getenv(name, default)
+    return getattr(settings, name, None) or os.getenv(name, default)
+
+QDRANT_URL = _setting("QDRANT_URL", "http://localhost:6333")
+# Mode local/embarqué (sans serveur) : dossier de stockage, ou ":memory:"
+QDRANT_PATH = os.getenv("QDRANT_PATH")
+# Le mode local sérialise les écritures derrière un verrou du process
+QDRANT_LOCAL = bool(QDRANT_PATH)
+QDRANT_COLLECTION = _setting("QDRANT_COLLECTION", "docs")
 EMBEDDING_SIZE = 384
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 64))
+# Création de collection : graphe HNSW, stockage sur disque, quantification
+QDRANT_HNSW_M = int(os.getenv("QDRANT_HNSW_M", 16))
+QDRANT_HNSW_EF_CONSTRUCT = int(os.getenv("QDRANT_HNSW_EF_CONSTRUCT", 100))
+QDRANT_ON_DISK_VECTORS = os.getenv("QDRANT_ON_DISK_VECTORS", "0") == "1"
+QDRANT_ON_DISK_PAYLOAD = os.getenv("QDRANT_ON_DISK_PAYLOAD", "0") == "1"
+# "int8" = quantification scalaire (vecteurs quantifiés gardés en RAM), "" = aucune
+QDRANT_QUANTIZATION = os.getenv("QDRANT_QUANTIZATION", "").lower()
+# Seuil (en Ko) au-delà duquel Qdrant construit l'index HNSW d'un segment ;
+# 0 = indexation différée (backfill)
+QDRANT_INDEXING_THRESHOLD = int(os.getenv("QDRANT_INDEXING_THRESHOLD", 20000))
+# Chargement en masse : points par requête et requêtes simultanées
+QDRANT_UPSERT_BATCH = int(os.getenv("QDRANT_UPSERT_BATCH", 256))
+QDRANT_UPSERT_PARALLEL = int(os.getenv("QDRANT_UPSERT_PARALLEL", 4))
+# Namespace des IDs de points : uuid5(namespace, "<doc_id>#<chunk_index>")
+CHUNK_ID_NAMESPACE = uuid.UUID("6f1c1c1e-5b1a-4c53-9a3e-2d7f0b8e4a21")
 
 # --- UTILS ---
 def get_embeddings():
-    return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+    """Embedder partagé du processus (cf. :mod:`pipelines.model_registry`)."""
+    return get_embedding_model()
 
-def ensure_qdrant_collection(client, collection_name=QDRANT_COLLECTION, embedding_size=EMBEDDING_SIZE):
+def ensure_qdrant_collection(client, collection_name=QDRANT_COLLECTION, embedding_size=EMBEDDING_SIZE,
+                             hnsw_m=QDRANT_HNSW_M, ef_construct=QDRANT_HNSW_EF_CONSTRUCT,
+                             on_disk=QDRANT_ON_DISK_VECTORS, on_disk_payload=QDRANT_ON_DISK_PAYLOAD,
+                             quantization=QDRANT_QUANTIZATION, deferred_indexing=False):
+    """
+    Crée la collection si besoin. ``on_disk`` / ``on_disk_payload`` gardent
+    vecteurs et payloads sur disque (mmap), ``quantization="int8"`` ajoute une
+    copie quantifiée des vecteurs en RAM (recherche rapide, RAM divisée par
+    ~4), ``deferred_indexing`` crée la collection sans construction HNSW
+    (à réactiver avec :func:`set_deferred_indexing` après le backfill).
+    Ces options sont sans effet sur une collection existante ; les index de
+    payload (cf. :func:`ensure_payload_indexes`) sont créés dans tous les cas.
+    """
     try:
         exists = any(col.name == collection_name for col in client.get_collections().collections)
         if not exists:
             logging.info(f"CrÃ©ation de la collection Qdrant '{collection_name}' (size={embedding_size})")
+            quantization_config = None
+            if quantization == "int8":
+                quantization_config = ScalarQuantization(
+                    scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True)
+                )
+            elif quantization:
+                raise ValueError(f"Quantification non supportée : {quantization}")
             client.create_collection(
                 collection_name=collection_name,
-                vectors_config=VectorParams(size=embedding_size, distance=Distance.COSINE)
+                vectors_config=VectorParams(size=embedding_size, distance=Distance.COSINE, on_disk=on_disk),
+                hnsw_config=HnswConfigDiff(m=hnsw_m, ef_construct=ef_construct),
+                on_disk_payload=on_disk_payload,
+                quantization_config=quantization_config,
+                optimizers_config=OptimizersConfigDiff(
+                    indexing_threshold=0 if deferred_indexing else QDRANT_INDEXING_THRESHOLD
+                ),
             )
+        ensure_payload_indexes(client, collection_name)
     except Exception as e:
         logging.error(f"Erreur Qdrant collection : {e}")
         raise
 
-def store_text_in_qdrant(text: str, metadata: dict = {}) -> int:
-    """
-    DÃ©coupe le texte, embed chaque chunk, indexe dans Qdrant avec metadata.
-    Retourne le nombre de chunks ajoutÃ©s.
-    """
-    if not text or not text.strip():
-        raise ValueError("Texte vide, rien Ã  indexer.")
-    splitter = RecursiveCharacterTextSplitter(chunk_size=400, chunk_overlap=50)
-    chunks = splitter.split_text(text)
-    if not chunks:
-        raise ValueError("DÃ©coupage impossible ou texte trop court.")
-    
-    # Ajoute l'index de chunk Ã  chaque meta
-    docs = []
-    for idx, chunk in enumerate(chunks):
-        meta_chunk = metadata.copy()
-        meta_chunk["chunk_index"] = idx
-        docs.append({"page_content": chunk, "metadata": meta_chunk})
-    
-    # Conversion pour LangChain
-    from langchain.schema import Document
-    langchain_docs = [Document(page_content=d["page_content"], metadata=d["metadata"]) for d in docs]
-    
-    # Embeddings & Qdrant
-    embeddings = get_embeddings()
-    client = QdrantClient(QDRANT_URL)
-    ensure_qdrant_collection(client)
-    try:
-        vectorstore = QdrantVectorStore(
-            client=client,
-            collection_name=QDRANT_COLLECTION,
-            embeddings=embeddings,
+_PAYLOAD_SCHEMAS = {
+    "keyword": PayloadSchemaType.KEYWORD,
+    "integer": PayloadSchemaType.INTEGER,
+    "bool": PayloadSchemaType.BOOL,
+}
+
+def ensure_payload_indexes(client, collection_name=QDRANT_COLLECTION) -> None:
+    """
+    Index de payload sur les champs filtrables (cf.
+    :data:`pipelines.search_filters.FILTER_FIELDS`) : une recherche filtrée
+    ne parcourt que les points correspondants. Idempotent.
+    """
+    existing = client.get_collection(collection_name).payload_schema or {}
+    for field, kind in FILTER_FIELDS.items():
+        key = f"metadata.{field}"
+        if key not in existing:
+            client.create_payload_index(
+                collection_name=collection_name, field_name=key, field_schema=_PAYLOAD_SCHEMAS[kind], wait=True,
+            )
+
+def get_qdrant_client():
+    if QDRANT_PATH == ":memory:":
+        return QdrantClient(location=":memory:")
+    if QDRANT_PATH:
+        return QdrantClient(path=QDRANT_PATH)
+    return QdrantClient(QDRANT_URL)
+
+def set_deferred_indexing(client, enabled: bool, collection_name=QDRANT_COLLECTION) -> None:
+    """
+    Suspend (``enabled=True``) ou rétablit la construction de l'index HNSW.
+    Pendant un backfill, les points sont seulement écrits ; l'index est
+    construit une fois, à la réactivation.
+    """
+    client.update_collection(
+        collection_name=collection_name,
+        optimizers_config=OptimizersConfigDiff(indexing_threshold=0 if enabled else QDRANT_INDEXING_THRESHOLD),
+    )
+
+def wait_for_indexing(client, collection_name=QDRANT_COLLECTION, timeout: float = 600, interval: float = 1.0) -> bool:
+    """Attend que la collection repasse au vert (optimisations terminées). ``False`` si timeout."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if client.get_collection(collection_name).status == CollectionStatus.GREEN:
+            return True
+        time.sleep(interval)
+    return False
+
+# ID jamais attribué (uuid5 / uuid4) : sa suppression ne touche aucun point
+_BARRIER_POINT_ID = "00000000-0000-0000-0000-000000000000"
+
+def write_barrier(client, collection_name=QDRANT_COLLECTION) -> None:
+    """
+    Barrière de cohérence : les mises à jour d'une collection sont appliquées
+    dans l'ordre, une opération ``wait=True`` (ici une suppression sans effet)
+    ne rend la main qu'une fois toutes les écritures précédentes appliquées.
+    """
+    client.delete(
+        collection_name=collection_name,
+        points_selector=PointIdsList(points=[_BARRIER_POINT_ID]),
+        wait=True,
+    )
+
+def chunk_point_id(doc_id: str, chunk_index: int) -> str:
+    """ID de point déterministe : réindexer un document écrase ses chunks au lieu de les dupliquer."""
+    return str(uuid.uuid5(CHUNK_ID_NAMESPACE, f"{doc_id}#{chunk_index}"))
+
+def chunk_pages(pages, metadata: dict = {}, doc_id: str = None):
+    """
+    Découpe un flux de pages ``(texte, meta_page)`` (cf.
+    ``core.file_parser.iter_document_pages``) et produit les chunks au fil de
+    l'eau ``{"page_content", "metadata"}``. Un chunk ne chevauche jamais deux
+    pages ; ``chunk_index`` est continu sur tout le document. Les blocs de
+    tableur (``block_type == "table"``) sont coupés entre deux rangées, en-tête
+    répété dans chaque chunk.
+
+    Les chunks sont dimensionnés en tokens du modèle d'embedding (cf.
+    :mod:`pipelines.chunking`) ; ``char_start`` / ``char_end`` situent chaque
+    chunk dans le texte de sa page, ``nb_tokens`` donne sa taille.
+    """
+    chunker = get_chunker()
+    idx = 0
+    for text, page_meta in pages:
+        if page_meta.get("block_type") == "table":
+            pieces = chunker.split_table(text)
+        else:
+            pieces = chunker.split(text)
+        for chunk, char_start, char_end, nb_tokens in pieces:
+            meta_chunk = {**metadata, **page_meta}
+            meta_chunk["chunk_index"] = idx
+            meta_chunk.update(char_start=char_start, char_end=char_end, nb_tokens=nb_tokens)
+            if doc_id is not None:
+                meta_chunk["doc_id"] = doc_id
+            yield {"page_content": chunk, "metadata": meta_chunk}
+            idx += 1
+
+def chunk_text(text: str, metadata: dict = {}, doc_id: str = None) -> list:
+    """
+    Découpe le texte en chunks et renvoie ``[{"page_content", "metadata"}]``,
+    chaque metadata portant son ``chunk_index`` (et ``doc_id`` si fourni).
+    """
+    return list(chunk_pages([(text, {})], metadata, doc_id=doc_id))
+
+def embed_texts(texts: list, embeddings=None) -> list:
+    """
+    Vecteurs de ``texts`` : les textes déjà vus (même modèle, même contenu)
+    sont lus dans le cache d'embeddings, les autres passent par le modèle en
+    un seul appel puis sont ajoutés au cache.
+    """
+    embeddings = embeddings or get_embeddings()
+    cache = get_embedding_cache()
+    model_key = embedding_model_key(embeddings) if cache is not None else None
+    if model_key is None:
+        return embeddings.embed_documents(texts)
+    vectors = cache.get_many(model_key, texts)
+    missing = [i for i, v in enumerate(vectors) if v is None]
+    if missing:
+        # Arrondis comme au relire : un texte a le même vecteur, en cache ou non
+        computed = round_vectors(embeddings.embed_documents([texts[i] for i in missing]))
+        cache.put_many(model_key, [texts[i] for i in missing], computed)
+        for i, vector in zip(missing, computed):
+            vectors[i] = vector
+    return [list(map(float, v)) for v in vectors]
+
+def embed_chunks(chunks: list, embeddings=None) -> list:
+    """Calcule les vecteurs d'une liste de chunks (cache d'embeddings d'abord, puis un seul appel au modèle)."""
+    return embed_texts([c["page_content"] for c in chunks], embeddings)
+
+def chunk_id(chunk: dict) -> str:
+    """ID de point d'un chunk : déterministe s'il porte un ``doc_id`` (upsert idempotent), aléatoire sinon."""
+    meta = chunk["metadata"]
+    if meta.get("doc_id") is not None:
+        return chunk_point_id(meta["doc_id"], meta["chunk_index"])
+    return str(uuid.uuid4())
+
+def upsert_chunks(client, chunks: list, vectors: list, collection_name=QDRANT_COLLECTION, wait=True,
+                  ids: list = None) -> int:
+    """
+    Écrit des chunks déjà vectorisés dans Qdrant. Le payload reprend le format
+    LangChain (``page_content`` / ``metadata``) pour rester lisible par les
+    retrievers existants. Les chunks portant un ``doc_id`` reçoivent un ID
+    déterministe (upsert idempotent) ; ``ids`` impose les IDs de point.
+    """
+    if ids is None:
+        ids = [chunk_id(chunk) for chunk in chunks]
+    points = [
+        PointStruct(
+            id=pid,
+            vector=list(vector),
+            payload={"page_content": chunk["page_content"], "metadata": chunk["metadata"]},
         )
-        vectorstore.add_documents(langchain_docs)
-        logging.info(f"{len(langchain_docs)} chunks ajoutÃ©s Ã  la collection '{QDRANT_COLLECTION}'.")
-        return len(langchain_docs)
-    except Exception as e:
-        logging.error(f"Erreur ajout dans Qdrant : {e}")
-        raise
+        for pid, chunk, vector in zip(ids, chunks, vectors)
+    ]
+    client.upsert(collection_name=collection_name, points=points, wait=wait)
+    return len(points)
+
+class BulkLoader:
+    """
+    Chargement en masse de chunks déjà vectorisés : découpage en requêtes de
+    ``batch_size`` points, ``parallel`` requêtes simultanées en ``wait=False``
+    (acquittées dès l'écriture dans le WAL), puis barrière de cohérence à la
+    fermeture. ``add`` bloque quand ``2 * parallel`` requêtes sont en vol.
+    Une seule requête à la fois si le store n'accepte pas les écritures
+    concurrentes (Qdrant en mode local, ``QDRANT_PATH``).
+
+    Fonctionne sur tout :class:`~pipelines.vector_store.VectorStore` ::
+
+        with BulkLoader(get_vector_store()) as loader:
+            loader.add(chunks, vectors)
+    """
+
+    def __init__(self, store, batch_size: int = QDRANT_UPSERT_BATCH,
+                 parallel: int = QDRANT_UPSERT_PARALLEL, wait: bool = False) -> None:
+        self.store = store
+        self.batch_size = batch_size
+        # Le mode local ne supporte pas les écritures concurrentes
+        self.parallel = max(1, parallel) if getattr(store, "concurrent_writes", True) else 1
+        self.wait = wait
+        self.points = 0
+        self.requests = 0
+        self._executor = ThreadPoolExecutor(max_workers=self.parallel, thread_name_prefix="qdrant-upsert")
+        self._inflight = []
+
+    def add(self, chunks: list, vectors: list) -> int:
+        for start in range(0, len(chunks), self.batch_size):
+            while len(self._inflight) >= 2 * self.parallel:
+                self._inflight.pop(0).result()
+            self._inflight.append(self._executor.submit(
+                self.store.upsert, chunks[start:start + self.batch_size],
+                vectors[start:start + self.batch_size], wait=self.wait,
+            ))
+            self.requests += 1
+        self.points += len(chunks)
+        return len(chunks)
+
+    def flush(self) -> None:
+        """Attend l'acquittement de toutes les requêtes, puis la barrière de cohérence."""
+        inflight, self._inflight = self._inflight, []
+        for fut in inflight:
+            fut.result()
+        if not self.wait and self.requests:
+            self.store.barrier()
 
+    def close(self) -> None:
+        try:
+            self.flush()
+        finally:
+            self._executor.shutdown(wait=True)
 
+    def __enter__(self):
+        return self
 
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._executor.shutdown(wait=True)
+
+def delete_stale_chunks(client, doc_id: str, nb_chunks: int, collection_name=QDRANT_COLLECTION, wait=True) -> None:
+    """
+    Supprime les chunks d'une version précédente du document au-delà de
+    ``nb_chunks`` (les autres ont été écrasés par l'upsert à ID déterministe).
+    """
+    client.delete(
+        collection_name=collection_name,
+        points_selector=FilterSelector(
+            filter=Filter(must=[
+                FieldCondition(key="metadata.doc_id", match=MatchValue(value=doc_id)),
+                FieldCondition(key="metadata.chunk_index", range=Range(gte=nb_chunks)),
+            ])
+        ),
+        wait=wait,
+    )
+
+def store_document_in_qdrant(path: str, metadata: dict = {}, doc_id: str = None, batch_size: int = EMBED_BATCH_SIZE,
+                             filename: str = None, progress=None) -> int:
+    """
+    Indexe un fichier en flux : parse ``path`` page par page, découpe,
+    vectorise et écrit par lots de ``batch_size`` chunks. Le pic mémoire est
+    borné par une page et un lot, quelle que soit la taille du document.
+    Retourne le nombre de chunks indexés.
+
+    ``progress(stage, pages, nb_pages, chunks)`` est appelé à chaque page
+    parsée et à chaque lot (``stage`` : parsing / embedding / indexing).
+    """
+    from core.file_parser import iter_document_pages
+    from pipelines.vector_store import get_vector_store
+
+    doc_id = doc_id or metadata.get("source") or path
+    store = get_vector_store()
+    store.ensure_collection()
+    embeddings = get_embeddings()
+    notify = progress or (lambda *args: None)
+    state = {"pages": 0, "nb_pages": None}
+
+    def pages():
+        for text, page_meta in iter_document_pages(path, filename=filename):
+            state["pages"] += 1
+            state["nb_pages"] = page_meta.get("nb_pages")
+            notify("parsing", state["pages"], state["nb_pages"], total)
+            yield text, page_meta
+
+    def flush(batch):
+        notify("embedding", state["pages"], state["nb_pages"], total)
+        vectors = embed_chunks(batch, embeddings)
+        notify("indexing", state["pages"], state["nb_pages"], total)
+        # Écriture asynchrone : l'embedding du lot suivant recouvre l'upsert
+        return loader.add(batch, vectors)
+
+    total = 0
+    batch = []
+    try:
+        with BulkLoader(store) as loader:
+            for chunk in chunk_pages(pages(), metadata, doc_id=doc_id):
+                batch.append(chunk)
+                if len(batch) >= batch_size:
+                    total += flush(batch)
+                    batch = []
+            if batch:
+                total += flush(batch)
+        if not total:
+            raise ValueError("Texte vide ou extraction impossible.")
+        store.delete_stale(doc_id, total)
+    except Exception as e:
+        logging.error(f"Erreur indexation de {path} : {e}")
+        raise
+    logging.info(f"{total} chunks indexés depuis '{path}' dans '{QDRANT_COLLECTION}'.")
+    return total
@@ -1,17 +1,33 @@
 import os
+import json
 import logging
+from core.file_parser import available_cpus
 from core.logging import get_logger
-from core.file_parser import extract_text_and_metadata
-from pipelines.vectorize import store_text_in_qdrant  # Adapté à ta brique vectorisation
+from pipelines.ingestion_pipeline import IngestionPipeline
+from pipelines.ingest_manifest import IngestManifest, key_path, normalize_path
 import time
 
 # Config
 INPUT_DIR = "to_index"    # Dossier où tu mets les fichiers à indexer (personnalisable)
 LOG_FILE = "logs/batch_index.log"
-SUCCESS_LOG = "logs/batch_success.csv"
-ERROR_LOG = "logs/batch_errors.csv"
+REPORT_FILE = "logs/batch_report.json"
 SUPPORTED_EXT = {"pdf", "docx", "doc", "txt", "xlsx", "xls", "png", "jpg", "jpeg"}
 
+# Workers par stage (surchargeables par variables d'environnement)
+PARSE_WORKERS = int(os.getenv("INGEST_PARSE_WORKERS", max(1, (os.cpu_count() or 2) - 1)))
+CHUNK_WORKERS = int(os.getenv("INGEST_CHUNK_WORKERS", 1))
+EMBED_WORKERS = int(os.getenv("INGEST_EMBED_WORKERS", 1))
+UPSERT_WORKERS = int(os.getenv("INGEST_UPSERT_WORKERS", 2))
+EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", 256))
+QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", 64))
+# Workers OCR par fichier (pool imbriqué dans chaque worker de parsing) :
+# plafonnés aux coeurs laissés libres par le pool de parsing
+OCR_WORKERS_PER_FILE = int(os.getenv("INGEST_OCR_WORKERS", max(1, available_cpus() // PARSE_WORKERS)))
+# Upserts non bloquants (barrière de cohérence en fin de run)
+UPSERT_WAIT = os.getenv("INGEST_UPSERT_WAIT", "0") == "1"
+# Backfill : index HNSW construit une seule fois, après le chargement
+DEFER_INDEXING = os.getenv("INGEST_DEFER_INDEXING", "0") == "1"
+
 os.makedirs("logs", exist_ok=True)
 
 logger = get_logger(__name__)
@@ -19,51 +35,98 @@ file_handler = logging.FileHandler(LOG_FILE)
 file_handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s'))
 logger.addHandler(file_handler)
 
-def process_file(path):
+def is_candidate(path):
+    """Comme le watcher : les fichiers déjà indexés et archivés par lui sont exclus."""
     filename = os.path.basename(path)
-    with open(path, "rb") as f:
-        content = f.read()
-    text, meta = extract_text_and_metadata(filename, content)
-    if not text or not text.strip():
-        raise ValueError("Texte vide ou extraction impossible.")
-    nb_chunks = store_text_in_qdrant(text, metadata=meta)
-    return nb_chunks, meta
-
-def main():
-    total, success, failed = 0, 0, 0
-    results = []
-    errors = []
+    if "INDEXED_" in filename or "/processed/" in path.replace("\\", "/"):
+        return False
+    return filename.split(".")[-1].lower() in SUPPORTED_EXT
 
-    for root, dirs, files in os.walk(INPUT_DIR):
+def iter_files(input_dir=INPUT_DIR):
+    for root, dirs, files in os.walk(input_dir):
+        # Archive du hotfolder (to_index/processed/INDEXED_*)
+        dirs[:] = [d for d in dirs if d != "processed"]
         for file in files:
-            ext = file.split(".")[-1].lower()
-            if ext not in SUPPORTED_EXT:
-                continue
             path = os.path.join(root, file)
-            total += 1
-            try:
-                logger.info("Indexation de : %s", path)
-                nb_chunks, meta = process_file(path)
-                with open(SUCCESS_LOG, "a", encoding="utf-8") as sl:
-                    sl.write(f"{file},{meta['ext']},{nb_chunks}\n")
-                logger.info("SUCCESS: %s (%s) -> %d chunks.", file, meta['ext'], nb_chunks)
-                success += 1
-                results.append((file, meta['ext'], nb_chunks))
-            except Exception as e:
-                with open(ERROR_LOG, "a", encoding="utf-8") as el:
-                    el.write(f"{file},{ext},ERROR,\"{str(e)}\"\n")
-                logger.error("FAIL: %s (%s) : %s", file, ext, e)
-                failed += 1
-                errors.append((file, ext, str(e)))
+            if is_candidate(path):
+                yield path
+
+def iter_files_resume_first(manifest, input_dir=INPUT_DIR):
+    """
+    Reprise : les fichiers du dossier restés ``pending`` / ``error`` au run
+    précédent passent en premier, puis le reste du dossier.
+    """
+    prefix = normalize_path(input_dir).rstrip("/") + "/"
+    resumed = []
+    for key in manifest.unfinished():
+        if not key.startswith(prefix) or not is_candidate(key):
+            continue
+        path = key_path(key)
+        if not os.path.isfile(path):
+            logger.warning("Reprise impossible, fichier disparu : %s", key)
+            continue
+        resumed.append(key)
+        yield path
+    if resumed:
+        logger.info("Reprise de %d fichier(s) interrompu(s) au run précédent", len(resumed))
+    resumed = set(resumed)
+    for path in iter_files(input_dir):
+        if normalize_path(path) not in resumed:
+            yield path
+
+def main():
+    manifest = IngestManifest()
+    pipeline = IngestionPipeline(
+        parse_workers=PARSE_WORKERS,
+        chunk_workers=CHUNK_WORKERS,
+        embed_workers=EMBED_WORKERS,
+        upsert_workers=UPSERT_WORKERS,
+        embed_batch_size=EMBED_BATCH_SIZE,
+        queue_size=QUEUE_SIZE,
+        ocr_workers=OCR_WORKERS_PER_FILE,
+        manifest=manifest,
+        upsert_wait=UPSERT_WAIT,
+        defer_indexing=DEFER_INDEXING,
+    )
+    report = pipeline.run(iter_files_resume_first(manifest))
+
+    with open(REPORT_FILE, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
 
     # Rapport final
-    logger.info("\nIndexation terminée : %d/%d fichiers OK, %d erreurs.", success, total, failed)
-    logger.info("Voir : %s, %s, %s", LOG_FILE, SUCCESS_LOG, ERROR_LOG)
-    if failed:
-        logger.info("Fichiers en erreur : %s", [e[0] for e in errors])
+    logger.info(
+        "\nIndexation terminée : %d fichiers, %d inchangés (ignorés), %d erreurs, %d chunks en %.1f s (%.2f docs/s).",
+        report["files"], report["files_skipped"], report["files_failed"], report["chunks_indexed"],
+        report["elapsed_sec"], report["docs_per_sec"],
+    )
+    for stage in report["stages"]:
+        logger.info(
+            "  %-7s workers=%d items=%d chunks=%d errors=%d busy=%.1fs wall=%.1fs "
+            "-> %.2f items/s, %.2f chunks/s (utilisation %.0f%%)",
+            stage["stage"], stage["workers"], stage["items"], stage["chunks"], stage["errors"],
+            stage["busy_sec"], stage["wall_sec"], stage["items_per_sec"], stage["chunks_per_sec"],
+            stage["utilization"] * 100,
+        )
+    if report.get("ocr_cache"):
+        logger.info(
+            "Cache OCR : %d hits / %d misses (taux %.0f%%), %d entrées, %d évictions",
+            report["ocr_cache"]["hits"], report["ocr_cache"]["misses"], report["ocr_cache"]["hit_rate"] * 100,
+            report["ocr_cache"]["entries"], report["ocr_cache"]["evictions"],
+        )
+    if report.get("embedding_cache"):
+        logger.info(
+            "Cache d'embeddings : %d hits / %d misses (taux %.0f%%), %d vecteurs (%.1f Mo), %d évictions",
+            report["embedding_cache"]["hits"], report["embedding_cache"]["misses"],
+            report["embedding_cache"]["hit_rate"] * 100, report["embedding_cache"]["entries"],
+            report["embedding_cache"]["bytes"] / 2**20, report["embedding_cache"]["evictions"],
+        )
+    logger.info("Voir : %s, %s", LOG_FILE, REPORT_FILE)
+    if report["errors"]:
+        logger.info("Fichiers en erreur : %s", sorted({e["file"] for e in report["errors"]}))
     else:
         logger.info("Aucune erreur.")
     # Possibilité d’envoyer un rapport par email/n8n ici
+    return report
 
 if __name__ == "__main__":
     t0 = time.time()
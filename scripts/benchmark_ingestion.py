@@ -0,0 +1,522 @@
+"""
+Banc d'essai de l'ingestion : génération d'un corpus synthétique et mesure du
+débit parse → chunk → embed → upsert contre un Qdrant local (embarqué).
+
+    # Corpus de 200 documents (txt, docx, xlsx, PDF texte, PDF scanné)
+    python -m scripts.benchmark_ingestion generate --out bench_corpus --docs 200
+
+    # Mesure (embedder factice par défaut : isole parsing/chunking/Qdrant)
+    python -m scripts.benchmark_ingestion run --corpus bench_corpus --output logs/bench.json
+    python -m scripts.benchmark_ingestion run --corpus bench_corpus --embedder model --mode pipeline
+
+    # Référence sans serveur : stockage NumPy en mémoire (recherche exacte)
+    python -m scripts.benchmark_ingestion run --corpus bench_corpus --store numpy
+
+    # Comparaison de deux runs
+    python -m scripts.benchmark_ingestion compare logs/bench_old.json logs/bench.json
+
+Le rapport JSON contient docs/s, chunks/s, les percentiles p50/p90/p99 de
+latence par stage et de recherche, et le pic de RSS (processus + workers).
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import hashlib
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+
+import numpy as np
+import psutil
+from qdrant_client import QdrantClient
+
+from core.logging import get_logger
+from core.file_parser import iter_document_pages
+from core.ocr_cache import get_ocr_cache
+from pipelines.embedding_cache import get_embedding_cache
+from pipelines.ingestion_pipeline import IngestionPipeline
+from pipelines.vector_store import NumpyStore, QdrantStore
+from pipelines.vectorize import EMBED_BATCH_SIZE, EMBEDDING_SIZE, chunk_pages, embed_chunks, get_embeddings
+
+logger = get_logger(__name__)
+
+FORMATS = ["txt", "docx", "xlsx", "pdf", "scan"]
+SUPPORTED_EXT = {"pdf", "docx", "doc", "txt", "xlsx", "xls", "png", "jpg", "jpeg"}
+
+WORDS = (
+    "contrat facture client fournisseur montant paiement échéance livraison commande "
+    "article clause résiliation durée garantie assurance sinistre déclaration expertise "
+    "rapport analyse projet budget réunion décision validation signature annexe "
+    "document référence période trimestre exercice bilan compte résultat charge produit "
+    "service prestation tarif remise pénalité délai conformité audit contrôle risque"
+).split()
+
+
+# ---------------------------------------------------------------------------
+# Génération du corpus synthétique
+# ---------------------------------------------------------------------------
+
+def _sentence(rng):
+    words = rng.choices(WORDS, k=rng.randint(8, 20))
+    return " ".join(words).capitalize() + "."
+
+
+def _paragraphs(rng, nb, sentences=(3, 8)):
+    return [" ".join(_sentence(rng) for _ in range(rng.randint(*sentences))) for _ in range(nb)]
+
+
+def _ascii(text):
+    # Police PDF standard (Helvetica) sans table d'encodage : on reste en ASCII
+    return text.encode("ascii", "ignore").decode("ascii")
+
+
+def _wrap(text, width):
+    lines, line = [], ""
+    for word in text.split():
+        if line and len(line) + len(word) + 1 > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    if line:
+        lines.append(line)
+    return lines
+
+
+def write_txt(path, rng, pages):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n\n".join(_paragraphs(rng, pages * 6)))
+
+
+def write_docx(path, rng, pages):
+    import docx
+
+    doc = docx.Document()
+    for para in _paragraphs(rng, pages * 6):
+        doc.add_paragraph(para)
+    doc.save(path)
+
+
+def write_xlsx(path, rng, pages):
+    import openpyxl
+
+    wb = openpyxl.Workbook(write_only=True)
+    for sheet_idx in range(max(1, pages // 5)):
+        ws = wb.create_sheet(f"Feuille{sheet_idx + 1}")
+        ws.append(["Date", "Référence", "Client", "Libellé", "Montant HT", "TVA", "Montant TTC"])
+        for row in range(pages * 200):
+            ht = round(rng.uniform(10, 5000), 2)
+            ws.append([
+                f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                f"FA-{sheet_idx}-{row:06d}",
+                f"Client {rng.randint(1, 500)}",
+                " ".join(rng.choices(WORDS, k=4)),
+                ht,
+                round(ht * 0.2, 2),
+                round(ht * 1.2, 2),
+            ])
+    wb.save(path)
+
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path, rng, pages):
+    """PDF texte minimal (une couche texte par page), écrit à la main."""
+    contents = []
+    for _ in range(pages):
+        lines = []
+        for para in _paragraphs(rng, 5):
+            lines.extend(_wrap(_ascii(para), 90))
+            lines.append("")
+        ops = ["BT", "/F1 10 Tf", "12 TL", "50 800 Td"]
+        ops += [f"({_pdf_escape(line)}) '" for line in lines[:64]]
+        ops.append("ET")
+        contents.append("\n".join(ops).encode("latin-1"))
+
+    nb = len(contents)
+    # 1 catalogue, 2 arbre des pages, 3 police, puis (page, contenu) par page
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        ("<< /Type /Pages /Kids [%s] /Count %d >>" % (
+            " ".join(f"{4 + 2 * i} 0 R" for i in range(nb)), nb)).encode("latin-1"),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i, stream in enumerate(contents):
+        objects.append((
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            "/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (5 + 2 * i)
+        ).encode("latin-1"))
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for num, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % num + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def write_scan(path, rng, pages):
+    """PDF « scanné » : pages rendues en image, sans couche texte (passe par l'OCR)."""
+    from PIL import Image, ImageDraw, ImageFont
+
+    font = ImageFont.load_default()
+    images = []
+    for _ in range(pages):
+        img = Image.new("L", (1240, 1754), color=255)  # A4 à 150 dpi
+        draw = ImageDraw.Draw(img)
+        y = 80
+        for para in _paragraphs(rng, 4):
+            for line in _wrap(_ascii(para), 110):
+                draw.text((80, y), line, fill=0, font=font)
+                y += 18
+            y += 18
+        images.append(img)
+    images[0].save(path, "PDF", resolution=150, save_all=True, append_images=images[1:])
+
+
+WRITERS = {
+    "txt": ("txt", write_txt),
+    "docx": ("docx", write_docx),
+    "xlsx": ("xlsx", write_xlsx),
+    "pdf": ("pdf", write_pdf),
+    "scan": ("pdf", write_scan),
+}
+
+
+def generate_corpus(out_dir, docs=100, formats=FORMATS, pages=5, seed=42):
+    """Écrit ``docs`` documents répartis en tourniquet sur ``formats``. Retourne les chemins."""
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for i in range(docs):
+        fmt = formats[i % len(formats)]
+        ext, writer = WRITERS[fmt]
+        path = os.path.join(out_dir, f"bench_{i:05d}_{fmt}.{ext}")
+        writer(path, rng, max(1, int(rng.uniform(0.5, 1.5) * pages)))
+        paths.append(path)
+    logger.info("Corpus synthétique : %d documents dans %s (%s)", len(paths), out_dir, ", ".join(formats))
+    return paths
+
+
+# ---------------------------------------------------------------------------
+# Mesure
+# ---------------------------------------------------------------------------
+
+class HashEmbeddings:
+    """
+    Embedder factice et déterministe (vecteurs pseudo-aléatoires dérivés du
+    hash du texte) : isole le coût parsing/chunking/Qdrant de l'inférence.
+    """
+
+    def __init__(self, size=EMBEDDING_SIZE):
+        self.size = size
+
+    def _vector(self, text):
+        seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+        vec = np.random.default_rng(seed).standard_normal(self.size).astype(np.float32)
+        return (vec / np.linalg.norm(vec)).tolist()
+
+    def embed_documents(self, texts):
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+class PeakRSS:
+    """Échantillonne la RSS du processus et de ses enfants (pools de parsing/OCR)."""
+
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        proc = psutil.Process()
+        total = proc.memory_info().rss
+        for child in proc.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                pass
+        self.peak = max(self.peak, total)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._sample()
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+
+def percentiles(values):
+    if not values:
+        return {"count": 0, "mean": 0.0, "p50": 0.0, "p90": 0.0, "p99": 0.0, "max": 0.0}
+    arr = np.asarray(values, dtype=np.float64)
+    p50, p90, p99 = np.percentile(arr, [50, 90, 99])
+    return {
+        "count": len(values),
+        "mean": round(float(arr.mean()), 4),
+        "p50": round(float(p50), 4),
+        "p90": round(float(p90), 4),
+        "p99": round(float(p99), 4),
+        "max": round(float(arr.max()), 4),
+    }
+
+
+def iter_files(corpus_dir):
+    for root, dirs, files in os.walk(corpus_dir):
+        for file in sorted(files):
+            if file.split(".")[-1].lower() in SUPPORTED_EXT:
+                yield os.path.join(root, file)
+
+
+def run_sequential(paths, embeddings, store, batch_size=EMBED_BATCH_SIZE):
+    """
+    Un document à la fois, chaque stage chronométré séparément : latences
+    par document (parse, chunk) et par lot (embed, upsert).
+    """
+    latencies = {"parse": [], "chunk": [], "embed": [], "upsert": []}
+    docs, chunks_total, errors = 0, 0, []
+    for path in paths:
+        try:
+            t0 = time.perf_counter()
+            pages = [(text, meta) for text, meta in iter_document_pages(path) if text.strip()]
+            latencies["parse"].append(time.perf_counter() - t0)
+
+            t0 = time.perf_counter()
+            chunks = list(chunk_pages(pages, doc_id=path))
+            latencies["chunk"].append(time.perf_counter() - t0)
+
+            for start in range(0, len(chunks), batch_size):
+                batch = chunks[start:start + batch_size]
+                t0 = time.perf_counter()
+                vectors = embed_chunks(batch, embeddings)
+                latencies["embed"].append(time.perf_counter() - t0)
+                t0 = time.perf_counter()
+                store.upsert(batch, vectors)
+                latencies["upsert"].append(time.perf_counter() - t0)
+        except Exception as e:
+            logger.error("FAIL %s : %s", path, e)
+            errors.append({"file": path, "error": str(e)})
+            continue
+        docs += 1
+        chunks_total += len(chunks)
+    return {
+        "docs": docs,
+        "chunks": chunks_total,
+        "errors": errors,
+        "latency_sec": {stage: percentiles(values) for stage, values in latencies.items()},
+    }
+
+
+def run_pipeline(paths, embeddings, store, args):
+    pipeline = IngestionPipeline(
+        parse_workers=args.parse_workers,
+        # Le client Qdrant local n'est pas prévu pour des écritures concurrentes
+        upsert_workers=1,
+        embed_batch_size=args.batch_size,
+        embeddings=embeddings,
+        store=store,
+    )
+    report = pipeline.run(paths)
+    return {
+        "docs": report["files"] - report["files_failed"],
+        "chunks": report["chunks_indexed"],
+        "errors": report["errors"],
+        "stages": report["stages"],
+    }
+
+
+def run_queries(store, embeddings, nb_queries, top_k=10, seed=7):
+    """Latence de recherche top-k sur des questions synthétiques (embedding exclu)."""
+    rng = random.Random(seed)
+    vectors = embeddings.embed_documents([_sentence(rng) for _ in range(nb_queries)])
+    latencies = []
+    for vector in vectors:
+        t0 = time.perf_counter()
+        store.search(vector, top_k=top_k)
+        latencies.append(time.perf_counter() - t0)
+    return percentiles(latencies)
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return None
+
+
+def run_benchmark(args):
+    paths = list(iter_files(args.corpus))
+    if not paths:
+        raise SystemExit(f"Aucun document dans {args.corpus} (voir la commande 'generate').")
+    if args.clear_ocr_cache and get_ocr_cache() is not None:
+        get_ocr_cache().clear()
+
+    embeddings = HashEmbeddings() if args.embedder == "hash" else get_embeddings()
+    store_dir = args.store_path or tempfile.mkdtemp(prefix=f"bench_{args.store}_")
+    if args.store == "numpy":
+        store = NumpyStore(store_dir, args.collection)
+    else:
+        store = QdrantStore(QdrantClient(path=store_dir), args.collection, local=True)
+    store.ensure_collection()
+
+    try:
+        with PeakRSS() as rss:
+            t0 = time.perf_counter()
+            if args.mode == "pipeline":
+                result = run_pipeline(paths, embeddings, store, args)
+            else:
+                result = run_sequential(paths, embeddings, store, args.batch_size)
+            elapsed = time.perf_counter() - t0
+        search = run_queries(store, embeddings, args.queries) if args.queries else None
+    finally:
+        store.close()
+        if not args.store_path:
+            shutil.rmtree(store_dir, ignore_errors=True)
+
+    by_format = {}
+    for path in paths:
+        name, ext = os.path.splitext(os.path.basename(path))
+        fmt = name.rsplit("_", 1)[-1] if name.startswith("bench_") else ext.lstrip(".").lower()
+        by_format[fmt] = by_format.get(fmt, 0) + 1
+    ocr_cache = get_ocr_cache()
+    embedding_cache = get_embedding_cache()
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_revision": _git_revision(),
+        "host": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "config": {
+            "corpus": os.path.abspath(args.corpus),
+            "mode": args.mode,
+            "embedder": args.embedder,
+            "store": args.store,
+            "batch_size": args.batch_size,
+            "parse_workers": args.parse_workers if args.mode == "pipeline" else 1,
+            "files": len(paths),
+            "files_by_format": by_format,
+        },
+        "elapsed_sec": round(elapsed, 3),
+        "docs": result["docs"],
+        "chunks": result["chunks"],
+        "docs_per_sec": round(result["docs"] / elapsed, 2) if elapsed else 0.0,
+        "chunks_per_sec": round(result["chunks"] / elapsed, 2) if elapsed else 0.0,
+        "peak_rss_mb": round(rss.peak / (1024 * 1024), 1),
+        "latency_sec": result.get("latency_sec"),
+        "search_latency_sec": search,
+        "stages": result.get("stages"),
+        "ocr_cache": ocr_cache.stats() if ocr_cache is not None else None,
+        "embedding_cache": embedding_cache.stats() if embedding_cache is not None else None,
+        "errors": result["errors"],
+    }
+
+
+def compare_reports(old, new):
+    """Ratio nouveau / ancien des métriques principales (débit : > 1 = mieux)."""
+    rows = []
+    for key in ("docs_per_sec", "chunks_per_sec", "peak_rss_mb", "elapsed_sec"):
+        rows.append((key, old.get(key), new.get(key)))
+    for stage, stats in (new.get("latency_sec") or {}).items():
+        old_stats = (old.get("latency_sec") or {}).get(stage, {})
+        for pct in ("p50", "p90", "p99"):
+            rows.append((f"{stage}.{pct}", old_stats.get(pct), stats.get(pct)))
+    if new.get("search_latency_sec"):
+        old_search = old.get("search_latency_sec") or {}
+        for pct in ("p50", "p90", "p99"):
+            rows.append((f"search.{pct}", old_search.get(pct), new["search_latency_sec"].get(pct)))
+    return [
+        {"metric": key, "old": a, "new": b, "ratio": round(b / a, 3) if a and b is not None else None}
+        for key, a, b in rows
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Banc d'essai de l'ingestion")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    gen = sub.add_parser("generate", help="Génère un corpus synthétique")
+    gen.add_argument("--out", default="bench_corpus")
+    gen.add_argument("--docs", type=int, default=100)
+    gen.add_argument("--formats", default=",".join(FORMATS), help=f"Parmi : {', '.join(FORMATS)}")
+    gen.add_argument("--pages", type=int, default=5, help="Taille moyenne d'un document (pages)")
+    gen.add_argument("--seed", type=int, default=42)
+
+    run = sub.add_parser("run", help="Mesure l'ingestion d'un corpus")
+    run.add_argument("--corpus", default="bench_corpus")
+    run.add_argument("--mode", choices=["sequential", "pipeline"], default="sequential")
+    run.add_argument("--embedder", choices=["hash", "model"], default="hash")
+    run.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE)
+    run.add_argument("--parse-workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    run.add_argument("--collection", default="bench")
+    run.add_argument("--store", choices=["qdrant", "numpy"], default="qdrant",
+                     help="Qdrant local (embarqué) ou NumpyStore (recherche exacte en mémoire)")
+    run.add_argument("--store-path", default=None, help="Dossier de stockage (temporaire par défaut)")
+    run.add_argument("--queries", type=int, default=100, help="Recherches chronométrées après chargement (0 = aucune)")
+    run.add_argument("--clear-ocr-cache", action="store_true", help="Vide le cache OCR avant la mesure")
+    run.add_argument("--output", default="logs/benchmark_ingestion.json")
+
+    cmp_ = sub.add_parser("compare", help="Compare deux rapports JSON")
+    cmp_.add_argument("old")
+    cmp_.add_argument("new")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        formats = [f.strip() for f in args.formats.split(",") if f.strip()]
+        unknown = set(formats) - set(FORMATS)
+        if unknown:
+            parser.error(f"Formats inconnus : {', '.join(sorted(unknown))}")
+        generate_corpus(args.out, args.docs, formats, args.pages, args.seed)
+        return
+
+    if args.command == "compare":
+        with open(args.old, encoding="utf-8") as f:
+            old = json.load(f)
+        with open(args.new, encoding="utf-8") as f:
+            new = json.load(f)
+        json.dump(compare_reports(old, new), sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return
+
+    report = run_benchmark(args)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    logger.info(
+        "%d docs, %d chunks en %.1f s : %.2f docs/s, %.2f chunks/s, pic RSS %.0f Mo (%d erreurs) -> %s",
+        report["docs"], report["chunks"], report["elapsed_sec"], report["docs_per_sec"],
+        report["chunks_per_sec"], report["peak_rss_mb"], len(report["errors"]), args.output,
+    )
+    for stage, stats in (report["latency_sec"] or {}).items():
+        logger.info("  %-7s p50=%.4fs p90=%.4fs p99=%.4fs (n=%d)", stage, stats["p50"], stats["p90"], stats["p99"], stats["count"])
+    if report["search_latency_sec"]:
+        stats = report["search_latency_sec"]
+        logger.info("  %-7s p50=%.4fs p90=%.4fs p99=%.4fs (n=%d)", "search", stats["p50"], stats["p90"], stats["p99"], stats["count"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+Banc d'essai de la recherche mots-clés : Whoosh contre le moteur BM25 NumPy
+(:mod:`pipelines.bm25`) sur le même corpus de chunks.
+
+    # Corpus synthétique (vocabulaire de Zipf, phrases françaises)
+    python -m scripts.benchmark_keyword --chunks 50000 --queries 500
+
+    # Chunks réels de la collection (stockage vectoriel configuré)
+    python -m scripts.benchmark_keyword --from-store --queries 500
+
+Les deux index sont construits dans un dossier temporaire. Le rapport JSON
+donne le temps de construction, la taille sur disque, les percentiles de
+latence des deux services (``WhooshSearcher`` / ``BM25Searcher``, index gardés
+ouverts) et le recouvrement de leurs top-k.
+"""
+
+import os
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+from core.logging import get_logger
+from pipelines.bm25 import build_from_points, iter_store_points
+from pipelines.keyword_index import KeywordIndex
+from pipelines.keyword_search import BM25Searcher, WhooshSearcher
+
+logger = get_logger(__name__)
+
+BASE_WORDS = (
+    "contrat facture client fournisseur montant paiement échéance livraison commande "
+    "article clause résiliation durée garantie assurance sinistre déclaration expertise "
+    "rapport analyse projet budget réunion décision validation signature annexe "
+    "document référence période trimestre exercice bilan compte résultat charge produit "
+    "service prestation tarif remise pénalité délai conformité audit contrôle risque"
+).split()
+FILLERS = "le la les de des du un une et en pour par sur dans avec au aux que qui est sont".split()
+
+
+class _ListStore:
+    """Points en mémoire exposant ``scroll`` (pour ``KeywordIndex.rebuild``)."""
+
+    def __init__(self, points):
+        self.points = points
+
+    def scroll(self, limit=256, offset=None):
+        start = offset or 0
+        end = start + limit
+        return self.points[start:end], (end if end < len(self.points) else None)
+
+
+def synthetic_points(nb_chunks, vocab_size=20000, words_per_chunk=(40, 90), seed=42):
+    """Chunks synthétiques : mots métier + vocabulaire rare à distribution de Zipf."""
+    rng = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyzéè"
+    rare = ["".join(rng.choices(letters, k=rng.randint(4, 10))) for _ in range(vocab_size)]
+    cum_weights = list(np.cumsum([1.0 / (rank + 1) for rank in range(vocab_size)]))
+    extensions = ["pdf", "docx", "txt", "xlsx"]
+    points = []
+    for idx in range(nb_chunks):
+        n = rng.randint(*words_per_chunk)
+        words = rng.choices(rare, cum_weights=cum_weights, k=n)
+        for pos in range(n):
+            draw = rng.random()
+            if draw < 0.3:
+                words[pos] = rng.choice(FILLERS)
+            elif draw < 0.6:
+                words[pos] = rng.choice(BASE_WORDS)
+        doc = idx // 20
+        ext = extensions[doc % len(extensions)]
+        points.append({
+            "id": f"{idx:08d}",
+            "payload": {
+                "page_content": " ".join(words).capitalize() + ".",
+                "metadata": {"doc_id": f"doc{doc}", "filename": f"doc{doc}.{ext}", "ext": ext, "chunk_index": idx % 20},
+            },
+        })
+    return points
+
+
+def sample_queries(points, nb_queries, seed=7):
+    """Requêtes de 2 à 4 mots tirés d'un même chunk (au moins un résultat attendu)."""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(nb_queries):
+        words = [w for w in points[rng.randrange(len(points))]["payload"]["page_content"].rstrip(".").split()
+                 if w.lower() not in FILLERS]
+        if words:
+            queries.append(" ".join(rng.sample(words, min(len(words), rng.randint(2, 4)))).lower())
+    return queries
+
+
+def percentiles(values):
+    if not values:
+        return {"count": 0, "mean": 0.0, "p50": 0.0, "p90": 0.0, "p99": 0.0, "max": 0.0}
+    arr = np.asarray(values, dtype=np.float64)
+    p50, p90, p99 = np.percentile(arr, [50, 90, 99])
+    return {
+        "count": len(values),
+        "mean": round(float(arr.mean()), 4),
+        "p50": round(float(p50), 4),
+        "p90": round(float(p90), 4),
+        "p99": round(float(p99), 4),
+        "max": round(float(arr.max()), 4),
+    }
+
+
+def dir_size(path):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def time_queries(searcher, queries, top_k, warmup=10):
+    for query in queries[:warmup]:
+        searcher.search(query, top_k=top_k)
+    latencies, hits = [], []
+    for query in queries:
+        t0 = time.perf_counter()
+        results = searcher.search(query, top_k=top_k)
+        latencies.append(time.perf_counter() - t0)
+        hits.append([r["id"] for r in results])
+    return percentiles(latencies), hits
+
+
+def run_benchmark(args):
+    if args.from_store:
+        from pipelines.vector_store import get_vector_store
+
+        points = list(iter_store_points(get_vector_store()))
+    else:
+        points = synthetic_points(args.chunks, seed=args.seed)
+    if not points:
+        raise SystemExit("Corpus vide.")
+    queries = sample_queries(points, args.queries)
+
+    work_dir = tempfile.mkdtemp(prefix="bench_keyword_")
+    try:
+        whoosh_dir = os.path.join(work_dir, "whoosh")
+        bm25_dir = os.path.join(work_dir, "bm25")
+
+        t0 = time.perf_counter()
+        KeywordIndex(whoosh_dir).rebuild(_ListStore(points))
+        whoosh_build = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        meta = build_from_points(points, bm25_dir)
+        bm25_build = time.perf_counter() - t0
+
+        whoosh_latency, whoosh_hits = time_queries(WhooshSearcher(whoosh_dir), queries, args.top_k)
+        bm25_latency, bm25_hits = time_queries(BM25Searcher(bm25_dir), queries, args.top_k)
+        overlaps = [
+            len(set(a) & set(b)) / len(b) for a, b in zip(whoosh_hits, bm25_hits) if b
+        ]
+        report = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "config": {
+                "source": "store" if args.from_store else "synthetic",
+                "chunks": len(points),
+                "queries": len(queries),
+                "top_k": args.top_k,
+            },
+            "whoosh": {
+                "build_sec": round(whoosh_build, 3),
+                "disk_mb": round(dir_size(whoosh_dir) / 2**20, 2),
+                "latency_sec": whoosh_latency,
+                "empty_results": sum(1 for h in whoosh_hits if not h),
+            },
+            "bm25": {
+                "build_sec": round(bm25_build, 3),
+                "disk_mb": round(dir_size(bm25_dir) / 2**20, 2),
+                "latency_sec": bm25_latency,
+                "empty_results": sum(1 for h in bm25_hits if not h),
+                "terms": meta["n_terms"],
+                "postings": meta["n_postings"],
+            },
+            # Whoosh : ET implicite entre les mots ; BM25 : OU classé
+            "topk_overlap": round(float(np.mean(overlaps)), 4) if overlaps else None,
+            "speedup_p50": round(whoosh_latency["p50"] / bm25_latency["p50"], 2) if bm25_latency["p50"] else None,
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Banc d'essai Whoosh vs BM25 NumPy")
+    parser.add_argument("--chunks", type=int, default=20000, help="Taille du corpus synthétique")
+    parser.add_argument("--from-store", action="store_true", help="Utilise les chunks de la collection")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="logs/benchmark_keyword.json")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    for engine in ("whoosh", "bm25"):
+        stats = report[engine]
+        lat = stats["latency_sec"]
+        logger.info(
+            "%-6s build=%.1fs disque=%.1f Mo p50=%.4fs p90=%.4fs p99=%.4fs",
+            engine, stats["build_sec"], stats["disk_mb"], lat["p50"], lat["p90"], lat["p99"],
+        )
+    logger.info("Accélération p50 : x%s, recouvrement top-%d : %s -> %s",
+                report["speedup_p50"], args.top_k, report["topk_overlap"], args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,34 @@
 import sys
 import os
+import json
 import time
 import logging
+import threading
+from collections import OrderedDict, deque
 from core.logging import get_logger
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-from core.file_parser import extract_text_and_metadata
-from pipelines.vectorize import store_text_in_qdrant
+from core.file_parser import iter_document_pages
+from pipelines.vector_store import get_vector_store
+from pipelines.vectorize import EMBED_BATCH_SIZE, chunk_pages, embed_chunks, get_embeddings
+from pipelines.ingest_manifest import IngestManifest, normalize_path
 
 WATCH_DIR = "to_index"
 PROCESSED_DIR = os.path.join(WATCH_DIR, "processed")
 LOG_FILE = "logs/hotfolder_watcher.log"
+STATUS_FILE = os.getenv("HOTFOLDER_STATUS_FILE", "logs/hotfolder_status.json")
 SUPPORTED_EXT = {"pdf", "docx", "doc", "txt", "xlsx", "xls", "png", "jpg", "jpeg"}
 
+# Nombre de workers qui vident la file, et nombre max de fichiers retirés de
+# la file en une fois par un worker (chunks regroupés en lots communs)
+WORKERS = int(os.getenv("HOTFOLDER_WORKERS", 2))
+BATCH_FILES = int(os.getenv("HOTFOLDER_BATCH_FILES", 16))
+# Un fichier est considéré complet quand taille et mtime n'ont pas bougé
+# pendant STABLE_CHECKS relevés espacés de POLL_INTERVAL secondes
+POLL_INTERVAL = float(os.getenv("HOTFOLDER_POLL_INTERVAL", 1.0))
+STABLE_CHECKS = int(os.getenv("HOTFOLDER_STABLE_CHECKS", 2))
+METRICS_INTERVAL = float(os.getenv("HOTFOLDER_METRICS_INTERVAL", 30))
+
 os.makedirs("logs", exist_ok=True)
 os.makedirs(WATCH_DIR, exist_ok=True)
 os.makedirs(PROCESSED_DIR, exist_ok=True)
@@ -23,6 +39,8 @@ file_handler = logging.FileHandler(LOG_FILE, encoding='utf-8')
 file_handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s'))
 logger.addHandler(file_handler)
 
+manifest = IngestManifest()
+
 def safe_move(src, dst):
     base, ext = os.path.splitext(dst)
     counter = 1
@@ -31,59 +49,305 @@ def safe_move(src, dst):
         counter += 1
     os.rename(src, dst)
 
-def process_file(path):
+def is_candidate(path):
     filename = os.path.basename(path)
     if "INDEXED_" in filename or "/processed/" in path.replace("\\", "/"):
-        logger.info("Ignoré (déjà traité) : %s", path)
-        return
+        return False
+    return filename.split(".")[-1].lower() in SUPPORTED_EXT
 
-    try:
-        with open(path, "rb") as f:
-            content = f.read()
-        text, meta = extract_text_and_metadata(filename, content)
-        if not text or not text.strip():
-            raise ValueError("Texte vide ou extraction impossible.")
-        nb_chunks = store_text_in_qdrant(text, metadata=meta)
-        logger.info("✅ %s (%s) importé (%d chunks)", filename, meta['ext'], nb_chunks)
-
-        new_filename = f"INDEXED_{filename}"
-        new_path = os.path.join(PROCESSED_DIR, new_filename)
-        safe_move(path, new_path)
-        logger.info("Déplacé et renommé : %s", new_path)
-
-    except Exception as e:
-        logger.error("Erreur import %s : %s", path, e)
 
-class WatcherHandler(FileSystemEventHandler):
-    def on_moved(self, event):
-        self.on_created(event)
+class WorkQueue:
+    """
+    File de travail dédupliquée : un chemin n'y figure qu'une fois, quel que
+    soit le nombre d'événements watchdog reçus. Un fichier ne passe en "prêt"
+    qu'une fois sa taille et son mtime stables (copie terminée).
+    """
 
-    def on_created(self, event):
-        if event.is_directory:
+    def __init__(self, stable_checks=STABLE_CHECKS):
+        self.stable_checks = stable_checks
+        self._pending = OrderedDict()  # path -> {"first_seen", "sig", "stable"}
+        self._ready = deque()          # (path, first_seen)
+        self._ready_paths = set()
+        self._in_progress = {}         # path -> first_seen
+        self._cond = threading.Condition()
+        self._lags = deque(maxlen=200)
+        self.processed = 0
+        self.failed = 0
+
+    def add(self, path):
+        with self._cond:
+            if path in self._pending or path in self._in_progress or path in self._ready_paths:
+                return
+            self._pending[path] = {"first_seen": time.time(), "sig": None, "stable": 0}
+
+    def poll(self):
+        """Relève taille/mtime des fichiers en attente et libère ceux qui sont stables."""
+        with self._cond:
+            items = list(self._pending.items())
+        ready = []
+        for path, state in items:
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                with self._cond:
+                    self._pending.pop(path, None)
+                continue
+            except OSError as e:
+                # Fichier encore verrouillé / en cours de copie : nouvel essai au prochain relevé
+                logger.debug("Relevé impossible pour %s : %s", path, e)
+                state["sig"], state["stable"] = None, 0
+                continue
+            sig = (st.st_size, st.st_mtime)
+            if sig == state["sig"]:
+                state["stable"] += 1
+            else:
+                state["sig"], state["stable"] = sig, 0
+            if state["stable"] >= self.stable_checks:
+                ready.append((path, state["first_seen"]))
+        if ready:
+            with self._cond:
+                for path, first_seen in ready:
+                    self._pending.pop(path, None)
+                    self._ready.append((path, first_seen))
+                    self._ready_paths.add(path)
+                self._cond.notify_all()
+
+    def take(self, max_items, timeout=1.0):
+        """Retire jusqu'à ``max_items`` fichiers prêts (liste vide si timeout)."""
+        with self._cond:
+            if not self._ready:
+                self._cond.wait(timeout)
+            batch = []
+            while self._ready and len(batch) < max_items:
+                path, first_seen = self._ready.popleft()
+                self._ready_paths.discard(path)
+                self._in_progress[path] = first_seen
+                batch.append(path)
+            return batch
+
+    def done(self, path, ok=True):
+        with self._cond:
+            first_seen = self._in_progress.pop(path, None)
+            if ok:
+                self.processed += 1
+            else:
+                self.failed += 1
+        if first_seen is not None:
+            self._lags.append(time.time() - first_seen)
+
+    def metrics(self):
+        now = time.time()
+        with self._cond:
+            waiting = [s["first_seen"] for s in self._pending.values()]
+            waiting += [first_seen for _, first_seen in self._ready]
+            waiting += list(self._in_progress.values())
+            lags = list(self._lags)
+            return {
+                "timestamp": now,
+                "pending_stabilization": len(self._pending),
+                "ready": len(self._ready),
+                "in_progress": len(self._in_progress),
+                "queue_depth": len(waiting),
+                "oldest_waiting_sec": round(now - min(waiting), 2) if waiting else 0.0,
+                "processed": self.processed,
+                "failed": self.failed,
+                "avg_lag_sec": round(sum(lags) / len(lags), 2) if lags else 0.0,
+                "max_lag_sec": round(max(lags), 2) if lags else 0.0,
+            }
+
+
+work_queue = WorkQueue()
+
+
+def archive(path):
+    new_path = os.path.join(PROCESSED_DIR, f"INDEXED_{os.path.basename(path)}")
+    safe_move(path, new_path)
+    logger.info("Déplacé et renommé : %s", new_path)
+
+
+def process_batch(paths, embeddings, store):
+    """
+    Traite ensemble les fichiers retirés de la file : leurs chunks sont
+    regroupés en lots de ``EMBED_BATCH_SIZE`` (un appel d'embedding et un
+    upsert par lot, même pour une rafale de petits fichiers) et la mémoire
+    reste bornée par un lot. Chaque fichier garde son décompte de chunks :
+    dès que tous les siens sont écrits, il est finalisé (chunks obsolètes,
+    manifeste, archivage). Une erreur n'affecte que le fichier concerné ; un
+    lot en échec est réécrit fichier par fichier pour isoler le fautif.
+    """
+    files = {}   # path -> {"doc_id", "digest", "nb_chunks", "unwritten", "parsed", "closed"}
+    batch = []   # (path, chunk)
+
+    def fail(path, exc):
+        state = files[path]
+        if state["closed"]:
+            return
+        state["closed"] = True
+        batch[:] = [(p, c) for p, c in batch if p != path]
+        if state["digest"]:
+            manifest.mark_error(state["doc_id"], state["digest"], str(exc))
+        logger.error("Erreur import %s : %s", path, exc)
+        work_queue.done(path, ok=False)
+
+    def finish(path):
+        state = files[path]
+        if state["closed"] or not state["parsed"] or state["unwritten"]:
             return
-        filename = os.path.basename(event.src_path)
-        if "INDEXED_" in filename or "/processed/" in event.src_path.replace("\\", "/"):
+        try:
+            if not state["nb_chunks"]:
+                raise ValueError("Texte vide ou extraction impossible.")
+            store.delete_stale(state["doc_id"], state["nb_chunks"])
+            manifest.mark_done(state["doc_id"], state["digest"], state["nb_chunks"])
+            logger.info("✅ %s importé (%d chunks)", os.path.basename(path), state["nb_chunks"])
+            archive(path)
+        except Exception as e:
+            fail(path, e)
             return
-        ext = filename.split(".")[-1].lower()
-        if ext not in SUPPORTED_EXT:
-            logger.info("Ignoré (format non supporté) : %s", event.src_path)
+        state["closed"] = True
+        work_queue.done(path)
+
+    def write(entries):
+        chunks = [chunk for _, chunk in entries]
+        store.upsert(chunks, embed_chunks(chunks, embeddings))
+
+    def flush():
+        entries = batch[:]
+        batch.clear()
+        if not entries:
             return
+        owners = list(dict.fromkeys(path for path, _ in entries))
+        try:
+            write(entries)
+            written = entries
+        except Exception as e:
+            if len(owners) == 1:
+                fail(owners[0], e)
+                return
+            logger.warning("Lot de %d chunks (%d fichiers) en échec, reprise fichier par fichier : %s",
+                           len(entries), len(owners), e)
+            written = []
+            for path in owners:
+                own = [entry for entry in entries if entry[0] == path]
+                try:
+                    write(own)
+                    written += own
+                except Exception as e_file:
+                    fail(path, e_file)
+        for path, _ in written:
+            files[path]["unwritten"] -= 1
+        for path in owners:
+            finish(path)
+
+    for path in paths:
+        state = files[path] = {
+            "doc_id": normalize_path(path), "digest": None, "nb_chunks": 0,
+            "unwritten": 0, "parsed": False, "closed": False,
+        }
         try:
-            logger.info("Détection nouveau fichier : %s", event.src_path)
-            time.sleep(1.0)
-            process_file(event.src_path)
+            unchanged, state["digest"] = manifest.check_file(path, state["doc_id"])
+            if unchanged:
+                logger.info("Inchangé depuis la dernière indexation, ignoré : %s", path)
+                archive(path)
+                state["closed"] = True
+                work_queue.done(path)
+                continue
+            manifest.mark_pending(state["doc_id"], state["digest"])
+            for chunk in chunk_pages(iter_document_pages(path), doc_id=state["doc_id"]):
+                batch.append((path, chunk))
+                state["nb_chunks"] += 1
+                state["unwritten"] += 1
+                if len(batch) >= EMBED_BATCH_SIZE:
+                    flush()
+                    if state["closed"]:
+                        break
         except Exception as e:
-            logger.error("Erreur process_file sur %s : %s", event.src_path, e)
+            fail(path, e)
+            continue
+        state["parsed"] = True
+        finish(path)
+    flush()
+    for path in paths:
+        finish(path)
+
+
+def worker_loop(stop_event, embeddings, store):
+    while not stop_event.is_set():
+        paths = work_queue.take(BATCH_FILES)
+        if paths:
+            process_batch(paths, embeddings, store)
+
+
+def write_status(metrics):
+    tmp = STATUS_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(metrics, f)
+    os.replace(tmp, STATUS_FILE)
+
+
+class WatcherHandler(FileSystemEventHandler):
+    """Ne fait qu'alimenter la file : aucun traitement dans le thread watchdog."""
+
+    def _enqueue(self, path):
+        if not is_candidate(path):
+            return
+        logger.info("Détection nouveau fichier : %s", path)
+        work_queue.add(path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self._enqueue(event.dest_path)
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self._enqueue(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self._enqueue(event.src_path)
 
 if __name__ == "__main__":
+    store = get_vector_store()
+    store.ensure_collection()
+    embeddings = get_embeddings()
+
+    stop_event = threading.Event()
+    workers = [
+        threading.Thread(target=worker_loop, args=(stop_event, embeddings, store), daemon=True)
+        for _ in range(WORKERS)
+    ]
+    for w in workers:
+        w.start()
+
+    # Fichiers déposés pendant que le watcher était arrêté
+    for root, dirs, files in os.walk(WATCH_DIR):
+        for file in files:
+            path = os.path.join(root, file)
+            if is_candidate(path):
+                work_queue.add(path)
+
     observer = Observer()
     event_handler = WatcherHandler()
     observer.schedule(event_handler, WATCH_DIR, recursive=True)
-    logger.info("👋  Watcher actif sur : %s\nDéposez des fichiers, ils seront indexés, renommés et déplacés dans /processed/ automatiquement !", os.path.abspath(WATCH_DIR))
+    logger.info("👋  Watcher actif sur : %s (%d workers)\nDéposez des fichiers, ils seront indexés, renommés et déplacés dans /processed/ automatiquement !", os.path.abspath(WATCH_DIR), WORKERS)
     observer.start()
+    last_metrics = 0.0
     try:
         while True:
-            time.sleep(1)
+            time.sleep(POLL_INTERVAL)
+            work_queue.poll()
+            metrics = work_queue.metrics()
+            write_status(metrics)
+            if time.time() - last_metrics >= METRICS_INTERVAL:
+                logger.info(
+                    "File : %d en attente (%d en copie, %d prêts, %d en cours), plus ancien %.1fs, lag moyen %.1fs, %d OK / %d KO",
+                    metrics["queue_depth"], metrics["pending_stabilization"], metrics["ready"],
+                    metrics["in_progress"], metrics["oldest_waiting_sec"], metrics["avg_lag_sec"],
+                    metrics["processed"], metrics["failed"],
+                )
+                last_metrics = time.time()
     except KeyboardInterrupt:
         observer.stop()
+        stop_event.set()
     observer.join()
+    for w in workers:
+        w.join()
@@ -1,51 +1,52 @@
 # scripts/ingest.py
 import sys
 import logging
+from core.config import settings
 from core.logging import get_logger
-from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams
-from langchain_community.vectorstores import Qdrant
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.schema import Document
+from pipelines.ingest_manifest import IngestManifest, text_hash
+from pipelines.model_registry import get_embedding_model
+from pipelines.vector_store import get_vector_store
+from pipelines.vectorize import BulkLoader, chunk_text, embed_chunks
 
 logger = get_logger(__name__)
 
-# Configuration Qdrantâ€‰â€“â€‰vous pouvez aussi importer core.config.settings
-QDRANT_URL = "http://localhost:6333"
-COLLECTION = "docs"
+COLLECTION = settings.QDRANT_COLLECTION
 EMBEDDING_SIZE = 384
 
 def get_embeddings():
-    return HuggingFaceEmbeddings(
-        model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
-    )
+    return get_embedding_model()
 
-def ingest_text(text: str, metadata: dict = {}):
-    # Split & vectorise
-    splitter = RecursiveCharacterTextSplitter(chunk_size=400, chunk_overlap=50)
-    chunks = splitter.split_text(text)
-    docs = [
-        Document(page_content=chunk, metadata={**metadata, "chunk_id": idx})
-        for idx, chunk in enumerate(chunks)
-    ]
+def ingest_text(text: str, metadata: dict = {}, manifest: IngestManifest = None):
+    """
+    Indexe ``text`` de façon incrémentale : la collection n'est plus recréée,
+    les chunks reçoivent des IDs déterministes et un texte inchangé (même
+    hash que lors du dernier passage) est ignoré.
+    """
+    digest = text_hash(text)
+    doc_id = metadata.get("source") or digest
+    if manifest is not None and manifest.is_unchanged(doc_id, digest):
+        logger.info("'%s' inchangé, rien à réindexer.", doc_id)
+        return 0
 
-    # (Re)création manuelle de la collection
-    client = QdrantClient(url=QDRANT_URL)
-    # Supprime si existe
-    existing = [col.name for col in client.get_collections().collections]
-    if COLLECTION in existing:
-        client.delete_collection(collection_name=COLLECTION)
-    # Crée à  nouveau
-    client.create_collection(
-        collection_name=COLLECTION,
-        vectors_config=VectorParams(size=EMBEDDING_SIZE, distance=Distance.COSINE)
-    )
+    # Split (chunker partagé, en tokens du modèle) & vectorise
+    docs = chunk_text(text, metadata, doc_id=doc_id)
+    for doc in docs:
+        doc["metadata"]["chunk_id"] = doc["metadata"]["chunk_index"]
 
-    # Ajouter les docs
-    vectorstore = Qdrant(client=client, collection_name=COLLECTION, embeddings=get_embeddings())
-    vectorstore.add_documents(docs)
+    store = get_vector_store(COLLECTION)
+    store.ensure_collection(EMBEDDING_SIZE)
+    if manifest is not None:
+        manifest.mark_pending(doc_id, digest)
+
+    # Ajouter/écraser les docs (IDs déterministes), puis retirer les chunks en
+    # trop de l'ancienne version
+    with BulkLoader(store) as loader:
+        loader.add(docs, embed_chunks(docs, get_embeddings()))
+    store.delete_stale(doc_id, len(docs))
+    if manifest is not None:
+        manifest.mark_done(doc_id, digest, len(docs))
     logger.info("Ingested %d chunks into '%s'.", len(docs), COLLECTION)
+    return len(docs)
 
 if __name__ == "__main__":
     if len(sys.argv) != 2:
@@ -59,7 +60,7 @@ if __name__ == "__main__":
         logger.error("Error reading %s: %s", path, e)
         sys.exit(1)
 
-    ingest_text(raw, {"source": path})
+    ingest_text(raw, {"source": path}, manifest=IngestManifest())
 
 
 
@@ -0,0 +1,26 @@
+import os
+import tempfile
+
+import pytest
+
+# core.config exige une clé OpenAI ; aucun test n'appelle l'API
+os.environ.setdefault("OPENAI_API_KEY", "test")
+# Manifeste par défaut (ouvert à l'import des scripts) hors de l'arbre source
+os.environ.setdefault("INGEST_MANIFEST_PATH", os.path.join(tempfile.mkdtemp(prefix="tests_"), "manifest.db"))
+
+
+def make_chunk(doc_id, chunk_index, text, **metadata):
+    return {"page_content": text, "metadata": {"doc_id": doc_id, "chunk_index": chunk_index, **metadata}}
+
+
+@pytest.fixture
+def chunks():
+    """Quatre chunks de deux documents, avec les champs filtrables usuels."""
+    return [
+        make_chunk("a", 0, "résiliation du contrat de bail", filename="bail.pdf", ext="pdf", page=1),
+        make_chunk("a", 1, "montant du loyer et des charges", filename="bail.pdf", ext="pdf", page=2, ocr=True),
+        make_chunk("b", 0, "facture de maintenance annuelle", filename="factures.xlsx", ext="xlsx",
+                   block_type="table", sheet="2024"),
+        make_chunk("b", 1, "facture de résiliation anticipée", filename="factures.xlsx", ext="xlsx",
+                   block_type="table", sheet="2025"),
+    ]
@@ -0,0 +1,41 @@
+from pipelines.bm25 import BM25Builder, BM25Index
+
+
+def _build(tmp_path, docs):
+    index_dir = str(tmp_path / "bm25")
+    builder = BM25Builder(index_dir)
+    for point_id, text, metadata in docs:
+        builder.add(point_id, text, metadata)
+    builder.finish()
+    return BM25Index(index_dir)
+
+
+def test_query_matches_english_stem_of_english_chunk(tmp_path):
+    # Passage indexé en anglais (« terminated » -> « termin »), requête sans
+    # mot vide (détection de langue indécise, racinisation française par défaut)
+    index = _build(tmp_path, [
+        ("en", "The contract was terminated by the supplier for breach.", {"doc_id": "a"}),
+        ("fr", "Le fournisseur a livré la marchandise en retard.", {"doc_id": "b"}),
+    ])
+    hits = index.search("terminated")
+    index.close()
+    assert [h["id"] for h in hits] == ["en"]
+
+
+def test_searcher_closes_replaced_index(tmp_path):
+    from pipelines.keyword_search import BM25Searcher
+
+    index_dir = str(tmp_path / "bm25")
+    builder = BM25Builder(index_dir)
+    builder.add("1", "contrat résilié", {})
+    builder.finish()
+    searcher = BM25Searcher(index_dir, refresh_interval=0)
+    assert [h["id"] for h in searcher.search("contrat")] == ["1"]
+    old = searcher._index
+
+    builder = BM25Builder(index_dir)
+    builder.add("2", "facture impayée", {})
+    builder.finish()
+    assert [h["id"] for h in searcher.search("facture")] == ["2"]
+    assert searcher._index is not old
+    assert old.indptr is None
@@ -0,0 +1,57 @@
+from pipelines.chunking import TokenChunker, _RegexTokenizer
+
+
+def chunker(max_tokens=22, overlap_tokens=4):
+    # Tokenizer regex : un token par mot ou ponctuation, 2 tokens spéciaux
+    return TokenChunker(max_tokens=max_tokens, overlap_tokens=overlap_tokens, tokenizer=_RegexTokenizer())
+
+
+def test_offsets_point_into_source_text():
+    text = "Premier paragraphe assez court.\n\n" + " ".join(f"mot{i}" for i in range(60)) + ".\nFin du texte."
+    chunks = chunker().split(text)
+    assert len(chunks) > 2
+    for chunk in chunks:
+        assert text[chunk.char_start:chunk.char_end] == chunk.text
+    assert chunks[0].char_start == 0 and chunks[-1].char_end == len(text)
+
+
+def test_chunks_respect_token_limit_and_overlap():
+    c = chunker(max_tokens=22, overlap_tokens=4)
+    text = " ".join(f"mot{i}" for i in range(100))
+    chunks = c.split(text)
+    assert all(chunk.nb_tokens <= 20 for chunk in chunks)
+    assert all(c.count_tokens(chunk.text) == chunk.nb_tokens for chunk in chunks)
+    # Recouvrement de 4 mots entre chunks consécutifs d'un même paragraphe
+    for prev, nxt in zip(chunks, chunks[1:]):
+        assert prev.text.split()[-4:] == nxt.text.split()[:4]
+
+
+def test_cut_prefers_paragraph_boundary():
+    first = " ".join(["alpha"] * 14)
+    text = first + "\n\n" + " ".join(["beta"] * 14)
+    chunks = chunker(overlap_tokens=0).split(text)
+    assert chunks[0].text == first
+    assert chunks[1].text.startswith("beta")
+
+
+def test_table_header_repeated_in_every_chunk():
+    header = "nom | ville | montant"
+    rows = [f"client{i} | Lyon | {i}00" for i in range(12)]
+    text = "\n".join([header] + rows)
+    c = chunker()
+    chunks = c.split_table(text)
+    assert len(chunks) > 1
+    seen = []
+    for chunk in chunks:
+        lines = chunk.text.split("\n")
+        assert lines[0] == header
+        assert chunk.nb_tokens <= c.max_tokens
+        # Les offsets couvrent les rangées du chunk (sans l'en-tête répété)
+        assert text[chunk.char_start:chunk.char_end] == "\n".join(lines[1:])
+        seen += lines[1:]
+    assert seen == rows
+
+
+def test_small_table_is_a_single_chunk():
+    text = "a | b\n1 | 2"
+    assert chunker().split_table(text) == [(text, 0, len(text), 6)]
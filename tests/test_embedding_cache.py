@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+
+from pipelines import vectorize
+from pipelines.embedding_cache import EmbeddingCache, round_vectors
+
+
+class FakeEmbeddings:
+    model_name = "fake-model"
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[len(t) / 3.0, 1 / 7, -0.1234567] for t in texts]
+
+
+def test_round_trip_and_dedup(tmp_path):
+    cache = EmbeddingCache(str(tmp_path))
+    vectors = round_vectors([[0.1, 0.2, 0.3], [1 / 3, 2 / 3, 1.0]])
+    cache.put_many("m", ["a", "b", "a"], [vectors[0], vectors[1], vectors[0]])
+    got = cache.get_many("m", ["b", "x", "a"])
+    assert got[1] is None
+    np.testing.assert_array_equal(got[0], vectors[1])
+    np.testing.assert_array_equal(got[2], vectors[0])
+    stats = cache.stats()
+    assert (stats["entries"], stats["bytes"], stats["hits"], stats["misses"]) == (2, 12, 2, 1)
+
+
+def test_hit_and_miss_return_same_vector(tmp_path, monkeypatch):
+    cache = EmbeddingCache(str(tmp_path))
+    monkeypatch.setattr(vectorize, "get_embedding_cache", lambda: cache)
+    embeddings = FakeEmbeddings()
+    miss = vectorize.embed_texts(["clause type"], embeddings)
+    hit = vectorize.embed_texts(["clause type"], embeddings)
+    assert len(embeddings.calls) == 1
+    assert miss == hit
+
+
+def test_cap_evicts_oldest_and_reuses_rows(tmp_path):
+    # 3 dimensions float16 = 6 octets par vecteur, plafond de 10 vecteurs
+    cache = EmbeddingCache(str(tmp_path), max_bytes=60)
+    for n in range(30):
+        cache.put_many("m", [f"t{n}"], [[n, n, n]])
+    stats = cache.stats()
+    assert stats["bytes"] <= 60 and stats["evictions"] > 0
+    assert cache.get_many("m", ["t0"]) == [None]
+    texts = [f"t{n}" for n in range(30)]
+    kept = [(n, v) for n, v in enumerate(cache.get_many("m", texts)) if v is not None]
+    assert len(kept) == stats["entries"] and kept[-1][0] == 29
+    for n, vector in kept:
+        np.testing.assert_array_equal(vector, [n, n, n])
+    # Lignes libérées réutilisées : le fichier ne dépasse pas le plafond
+    assert os.path.getsize(cache._data_path("m")) <= 66
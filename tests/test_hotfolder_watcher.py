@@ -0,0 +1,95 @@
+import importlib
+import math
+
+import pytest
+
+from pipelines.ingest_manifest import IngestManifest, normalize_path
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(len(texts))
+        return [[1.0, 0.0, 0.0, 0.0] for _ in texts]
+
+
+class FakeStore:
+    def __init__(self, poison="BOOM"):
+        self.poison = poison
+        self.upserts = []
+        self.stale = {}
+
+    def upsert(self, chunks, vectors, wait=True):
+        if any(self.poison in c["page_content"] for c in chunks):
+            raise RuntimeError("écriture refusée")
+        self.upserts.append([c["metadata"]["doc_id"] for c in chunks])
+        return len(chunks)
+
+    def delete_stale(self, doc_id, nb_chunks, wait=True):
+        self.stale[doc_id] = nb_chunks
+
+
+@pytest.fixture
+def watcher(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    module = importlib.import_module("scripts.hotfolder_watcher")
+    manifest = IngestManifest(str(tmp_path / "manifest.db"))
+    monkeypatch.setattr(module, "manifest", manifest)
+    monkeypatch.setattr(module, "work_queue", module.WorkQueue())
+    monkeypatch.setattr(module, "PROCESSED_DIR", str(tmp_path / "processed"))
+    monkeypatch.setattr(module, "EMBED_BATCH_SIZE", 4)
+    (tmp_path / "processed").mkdir()
+    (tmp_path / "in").mkdir()
+    yield module
+    manifest.close()
+
+
+def drop(tmp_path, name, text):
+    path = tmp_path / "in" / name
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def test_small_files_share_embed_and_upsert_calls(watcher, tmp_path):
+    paths = [drop(tmp_path, f"f{i}.txt", f"note numéro {i}") for i in range(6)]
+    embeddings, store = FakeEmbeddings(), FakeStore()
+    watcher.process_batch(paths, embeddings, store)
+
+    # Un chunk par fichier : 6 chunks en lots de 4
+    assert embeddings.calls == [4, 2]
+    assert len(store.upserts) == 2
+    assert store.stale == {normalize_path(p): 1 for p in paths}
+    assert watcher.work_queue.processed == 6 and watcher.work_queue.failed == 0
+    assert sorted(p.name for p in (tmp_path / "processed").iterdir()) == [f"INDEXED_f{i}.txt" for i in range(6)]
+    assert all(watcher.manifest.get(normalize_path(p))["status"] == "done" for p in paths)
+
+
+def test_failure_only_marks_the_faulty_file(watcher, tmp_path):
+    good = [drop(tmp_path, f"ok{i}.txt", f"contenu correct {i}") for i in range(3)]
+    bad = drop(tmp_path, "bad.txt", "contenu BOOM refusé")
+    empty = drop(tmp_path, "vide.txt", "")
+    embeddings, store = FakeEmbeddings(), FakeStore()
+    watcher.process_batch([good[0], bad, empty, good[1], good[2]], embeddings, store)
+
+    assert watcher.work_queue.processed == 3 and watcher.work_queue.failed == 2
+    assert watcher.manifest.get(normalize_path(bad))["status"] == "error"
+    assert watcher.manifest.get(normalize_path(empty))["status"] == "error"
+    assert sorted(store.stale) == sorted(normalize_path(p) for p in good)
+    # Les chunks des bons fichiers du lot en échec ont été réécrits
+    written = [doc_id for call in store.upserts for doc_id in call]
+    assert sorted(written) == sorted(normalize_path(p) for p in good)
+    assert (tmp_path / "in" / "bad.txt").exists()
+
+
+def test_large_file_is_written_in_bounded_batches(watcher, tmp_path):
+    text = "\n\n".join(" ".join(["mot"] * 200) for _ in range(5))
+    path = drop(tmp_path, "long.txt", text)
+    embeddings, store = FakeEmbeddings(), FakeStore()
+    watcher.process_batch([path], embeddings, store)
+
+    nb_chunks = store.stale[normalize_path(path)]
+    assert nb_chunks > 4
+    assert embeddings.calls == [4] * (nb_chunks // 4) + ([nb_chunks % 4] if nb_chunks % 4 else [])
+    assert len(store.upserts) == math.ceil(nb_chunks / 4)
@@ -0,0 +1,137 @@
+import pytest
+
+from pipelines.hybrid_retrieval import fuse_candidates
+
+
+def hit(pid, text, source, score=1.0):
+    return {"id": pid, "text": text, "metadata": {}, "score": score, "source": source}
+
+
+def test_rrf_scores_and_order():
+    semantic = [hit("1", "un", "semantic"), hit("2", "deux", "semantic")]
+    keyword = [hit("2", "deux", "keyword"), hit("3", "trois", "keyword")]
+    candidates, stats = fuse_candidates([semantic, keyword], budget=10, k=60)
+    assert [c["id"] for c in candidates] == ["2", "1", "3"]
+    assert candidates[0]["rrf_score"] == pytest.approx(1 / 62 + 1 / 61)
+    assert candidates[0]["sources"] == ["semantic", "keyword"]
+    assert stats == {"inputs": 4, "duplicates": 1, "pruned": 0, "candidates": 3}
+
+
+def test_dedup_by_content_across_ids():
+    # Même chunk sous deux IDs (casse et espaces différents) : une seule entrée
+    semantic = [hit("1", "Résiliation  du bail", "semantic")]
+    keyword = [hit("9", "résiliation du bail", "keyword"), hit("3", "autre", "keyword")]
+    candidates, stats = fuse_candidates([semantic, keyword], budget=10, k=60)
+    assert [c["id"] for c in candidates] == ["1", "3"]
+    assert candidates[0]["sources"] == ["semantic", "keyword"]
+    assert stats["duplicates"] == 1
+
+
+def test_budget_prunes_lowest_ranks():
+    results = [hit(str(i), f"texte {i}", "semantic") for i in range(5)]
+    candidates, stats = fuse_candidates([results], budget=2, k=60)
+    assert [c["id"] for c in candidates] == ["0", "1"]
+    assert stats["pruned"] == 3 and stats["candidates"] == 2
+
+
+class FakeRerankService:
+    async def arerank(self, query, candidates, top_k=5):
+        return candidates[:top_k]
+
+
+@pytest.fixture
+def hybrid(monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from pipelines import hybrid_retrieval
+
+    executor = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(hybrid_retrieval, "_executor", executor)
+    monkeypatch.setattr(hybrid_retrieval, "_orphans", 0)
+    monkeypatch.setattr(hybrid_retrieval, "RERANK_CASCADE", False)
+    monkeypatch.setattr(hybrid_retrieval, "get_rerank_service", FakeRerankService)
+    monkeypatch.setattr(hybrid_retrieval, "get_embedding_model", lambda: None)
+    monkeypatch.setattr(hybrid_retrieval, "HYBRID_SEMANTIC_TIMEOUT_SEC", 1.0)
+    monkeypatch.setattr(hybrid_retrieval, "HYBRID_KEYWORD_TIMEOUT_SEC", 0.1)
+    monkeypatch.setattr(
+        hybrid_retrieval, "semantic_search", lambda query, top_k, filters: [hit("1", "un", "semantic")]
+    )
+    yield hybrid_retrieval
+    executor.shutdown(wait=True)
+
+
+def slow_keyword(event):
+    def search(query, top_k, filters):
+        event.wait(5)
+        return [hit("2", "deux", "keyword")]
+    return search
+
+
+def test_ahybrid_search_partial_on_timeout(hybrid, monkeypatch):
+    import asyncio
+    import threading
+
+    release = threading.Event()
+    monkeypatch.setattr(hybrid, "keyword_search", slow_keyword(release))
+    try:
+        results, timings = asyncio.run(hybrid.ahybrid_search("q", top_k=5, partial=True))
+    finally:
+        release.set()
+    assert [r["id"] for r in results] == ["1"]
+    assert timings["keyword"]["status"] == "timeout"
+    assert timings["semantic"]["status"] == "ok"
+    assert timings["partial"] is True
+
+
+def test_ahybrid_search_strict_mode_raises(hybrid, monkeypatch):
+    import asyncio
+    import threading
+
+    release = threading.Event()
+    monkeypatch.setattr(hybrid, "keyword_search", slow_keyword(release))
+    try:
+        with pytest.raises(RuntimeError, match="keyword"):
+            asyncio.run(hybrid.ahybrid_search("q", top_k=5, partial=False))
+    finally:
+        release.set()
+
+
+def test_queue_wait_does_not_count_toward_timeout(hybrid, monkeypatch):
+    import asyncio
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    # Un seul thread, occupé 0,3 s (> délai de 0,1 s) avant les deux recherches
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(hybrid, "_executor", executor)
+    executor.submit(time.sleep, 0.3)
+    monkeypatch.setattr(hybrid, "keyword_search", lambda query, top_k, filters: [hit("2", "deux", "keyword")])
+    _, timings = asyncio.run(hybrid.ahybrid_search("q", top_k=5))
+    assert timings["keyword"]["status"] == "ok"
+    assert timings["keyword"]["queue_ms"] >= 250
+    assert timings["partial"] is False
+
+
+def test_timed_out_legs_are_bounded(hybrid, monkeypatch):
+    import asyncio
+    import threading
+    import time
+
+    monkeypatch.setattr(hybrid, "HYBRID_MAX_ORPHAN_LEGS", 1)
+    release = threading.Event()
+    monkeypatch.setattr(hybrid, "keyword_search", slow_keyword(release))
+    try:
+        _, first = asyncio.run(hybrid.ahybrid_search("q", top_k=5))
+        # La recherche hors délai occupe encore un thread : la suivante est refusée
+        _, second = asyncio.run(hybrid._run_leg("mots-clés", 0.1, hybrid.keyword_search, "q", top_k=5, filters=None))
+    finally:
+        release.set()
+    assert first["keyword"]["status"] == "timeout"
+    assert second["status"] == "saturated"
+
+    deadline = time.time() + 5
+    while hybrid._orphans and time.time() < deadline:
+        time.sleep(0.01)
+    assert hybrid._orphans == 0
+    _, third = asyncio.run(hybrid.ahybrid_search("q", top_k=5))
+    assert third["keyword"]["status"] == "ok"
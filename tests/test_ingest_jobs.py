@@ -0,0 +1,34 @@
+import time
+
+from pipelines import ingest_jobs
+from pipelines.ingest_manifest import IngestManifest
+
+
+def wait(manager, job_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = manager.get(job_id)
+        if job["finished_at"] is not None:
+            return job
+        time.sleep(0.01)
+    raise AssertionError("job non terminé")
+
+
+def test_upload_is_keyed_on_name_and_replaced(tmp_path, monkeypatch):
+    indexed = []
+    monkeypatch.setattr(
+        ingest_jobs, "store_document_in_qdrant",
+        lambda path, doc_id, filename, progress: indexed.append((doc_id, open(path).read())) or 1,
+    )
+    manager = ingest_jobs.JobManager(workers=1, manifest=IngestManifest(str(tmp_path / "manifest.db")))
+
+    def upload(text, **extra):
+        path = tmp_path / f"{len(indexed)}_{time.time_ns()}.txt"
+        path.write_text(text)
+        return wait(manager, manager.submit([{"path": str(path), "filename": "rapport.txt", **extra}]))
+
+    assert upload("v1")["files"][0]["doc_id"] == "uploads/rapport.txt"
+    assert upload("v1")["files"][0]["status"] == "skipped"
+    assert upload("v2")["files"][0]["status"] == "done"
+    assert upload("v2", doc_id="client-42")["files"][0]["doc_id"] == "client-42"
+    assert indexed == [("uploads/rapport.txt", "v1"), ("uploads/rapport.txt", "v2"), ("client-42", "v2")]
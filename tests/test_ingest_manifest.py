@@ -0,0 +1,81 @@
+import os
+
+import pytest
+
+from pipelines import ingest_manifest
+from pipelines.ingest_manifest import IngestManifest, key_path, normalize_path
+
+
+@pytest.fixture
+def root(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest_manifest, "INGEST_ROOT", str(tmp_path))
+    (tmp_path / "to_index").mkdir()
+    return tmp_path
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    manifest = IngestManifest(str(tmp_path / "manifest.db"))
+    yield manifest
+    manifest.close()
+
+
+def test_key_does_not_depend_on_working_directory(root, monkeypatch):
+    path = root / "to_index" / "a.txt"
+    monkeypatch.chdir(root)
+    key = normalize_path("to_index/a.txt")
+    monkeypatch.chdir(root / "to_index")
+    assert normalize_path("a.txt") == key == "to_index/a.txt"
+    assert key_path(key) == str(path)
+
+
+def test_key_outside_root_is_absolute(root, tmp_path_factory):
+    other = tmp_path_factory.mktemp("ailleurs") / "b.txt"
+    assert normalize_path(str(other)) == str(other).replace("\\", "/")
+
+
+def test_unchanged_file_is_skipped(root, manifest):
+    path = root / "to_index" / "a.txt"
+    path.write_text("version 1")
+    key = normalize_path(str(path))
+    unchanged, digest = manifest.check_file(str(path), key)
+    assert not unchanged
+    st = os.stat(path)
+    manifest.mark_pending(key, digest, st.st_size, st.st_mtime)
+    manifest.mark_done(key, digest, 3)
+    assert manifest.check_file(str(path), key) == (True, digest)
+
+    # Touché sans changement de contenu : toujours ignoré
+    os.utime(path, (st.st_atime + 10, st.st_mtime + 10))
+    assert manifest.check_file(str(path), key) == (True, digest)
+
+    path.write_text("version 2")
+    unchanged, new_digest = manifest.check_file(str(path), key)
+    assert not unchanged and new_digest != digest
+
+
+def test_resume_lists_pending_and_failed(root, manifest):
+    manifest.mark_pending("to_index/a.txt", "h1")
+    manifest.mark_pending("to_index/b.txt", "h2")
+    manifest.mark_done("to_index/b.txt", "h2", 1)
+    manifest.mark_error("to_index/c.txt", "h3", "boom")
+    assert sorted(manifest.unfinished()) == ["to_index/a.txt", "to_index/c.txt"]
+    # Le nombre de chunks de la dernière version réussie est conservé
+    manifest.mark_pending("to_index/b.txt", "h4")
+    assert manifest.get("to_index/b.txt")["nb_chunks"] == 1
+
+
+def test_batch_resumes_unfinished_first_and_skips_archive(root, manifest, monkeypatch):
+    monkeypatch.chdir(root)
+    batch = pytest.importorskip("scripts.batch_index_folder")
+    for name in ("a.txt", "b.txt", "c.txt"):
+        (root / "to_index" / name).write_text(name)
+    (root / "to_index" / "processed").mkdir()
+    (root / "to_index" / "processed" / "INDEXED_old.txt").write_text("déjà indexé")
+    manifest.mark_error("to_index/c.txt", "h", "boom")
+    manifest.mark_pending("to_index/gone.txt", "h")
+
+    paths = list(batch.iter_files_resume_first(manifest, "to_index"))
+    keys = [normalize_path(p) for p in paths]
+    assert keys[0] == "to_index/c.txt"
+    assert sorted(keys) == ["to_index/a.txt", "to_index/b.txt", "to_index/c.txt"]
@@ -0,0 +1,58 @@
+import os
+
+import pytest
+from whoosh.fields import ID, TEXT, Schema
+from whoosh.index import create_in
+
+from pipelines.keyword_index import KeywordIndex
+from pipelines.vector_store import NumpyStore
+from tests.conftest import make_chunk
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = NumpyStore(str(tmp_path / "numpy"))
+    store.ensure_collection(4)
+    store.keyword_index = KeywordIndex(str(tmp_path / "whoosh"))
+    yield store
+    store.close()
+
+
+def _keyword_ids(index):
+    with index.ix.searcher() as searcher:
+        return sorted(doc["id"] for doc in searcher.documents())
+
+
+def test_keyword_index_shares_point_ids(store):
+    # Sans doc_id : ID aléatoire, identique dans les deux index
+    store.upsert([{"page_content": "note libre", "metadata": {}}], [[1, 0, 0, 0]])
+    (point,), _ = store.scroll()
+    assert _keyword_ids(store.keyword_index) == [point["id"]]
+
+
+def test_delete_stale_follows_vector_store(store):
+    store.upsert([make_chunk("a", i, f"passage {i}") for i in range(3)], [[1, 0, 0, 0]] * 3)
+    store.delete_stale("a", 1)
+    points, _ = store.scroll()
+    assert _keyword_ids(store.keyword_index) == sorted(p["id"] for p in points)
+    assert len(points) == 1
+
+
+def test_outdated_schema_is_not_wiped(tmp_path, store):
+    index_dir = str(tmp_path / "old")
+    os.makedirs(index_dir)
+    # Index d'avant les champs filtrables
+    ix = create_in(index_dir, Schema(id=ID(stored=True, unique=True), content=TEXT(stored=True)))
+    writer = ix.writer()
+    writer.add_document(id="x", content="ancien")
+    writer.commit()
+
+    index = KeywordIndex(index_dir)
+    assert index.is_outdated()
+    with pytest.raises(RuntimeError):
+        index.upsert([make_chunk("a", 0, "nouveau")], ["y"])
+
+    store.upsert([make_chunk("a", 0, "nouveau")], [[1, 0, 0, 0]])
+    assert index.rebuild(store) == 1
+    assert not index.is_outdated()
+    assert _keyword_ids(index) == [store.scroll()[0][0]["id"]]
@@ -0,0 +1,34 @@
+from core.ocr_cache import OCRCache
+
+
+def test_lookups_do_not_write(tmp_path):
+    cache = OCRCache(str(tmp_path / "ocr.db"))
+    cache.put("a", "texte")
+    changes = cache._conn.total_changes
+    assert cache.get("a") == "texte"
+    assert cache.get("b") is None
+    assert cache._conn.total_changes == changes
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+
+
+def test_bytes_counter_follows_replacements(tmp_path):
+    cache = OCRCache(str(tmp_path / "ocr.db"))
+    cache.put("a", "x" * 10)
+    cache.put("b", "é" * 5)
+    cache.put("a", "x" * 4)
+    assert cache.stats()["bytes"] == 14
+    # Compteur repris tel quel par une autre connexion (autre processus)
+    assert OCRCache(str(tmp_path / "ocr.db")).stats()["bytes"] == 14
+
+
+def test_eviction_keeps_recently_read_entries(tmp_path):
+    cache = OCRCache(str(tmp_path / "ocr.db"), max_bytes=30)
+    cache.put("old", "o" * 10)
+    cache.put("read", "r" * 10)
+    assert cache.get("old") == "o" * 10
+    cache.put("new", "n" * 15)
+    assert cache.get("read") is None
+    assert cache.get("old") == "o" * 10
+    stats = cache.stats()
+    assert stats["evictions"] == 1 and stats["bytes"] == 25
@@ -0,0 +1,99 @@
+import threading
+
+from pipelines import query_cache as qc
+from pipelines.query_cache import CachedQueryEmbeddings, QueryEmbeddingCache
+
+
+def test_hit_on_normalized_query():
+    cache = QueryEmbeddingCache()
+    calls = []
+    compute = lambda q: calls.append(q) or [1.0, 2.0]
+    assert cache.get_or_compute("m", "  durée   du bail ", compute) == [1.0, 2.0]
+    assert cache.get_or_compute("m", "durée du bail", compute) == [1.0, 2.0]
+    # Autre modèle : autre clé
+    cache.get_or_compute("autre", "durée du bail", compute)
+    assert calls == ["  durée   du bail ", "durée du bail"]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (1, 2, 2)
+
+
+def test_ttl_expiration(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(qc.time, "time", lambda: now[0])
+    cache = QueryEmbeddingCache(ttl=60)
+    calls = []
+    compute = lambda q: calls.append(q) or [len(calls)]
+    assert cache.get_or_compute("m", "q", compute) == [1]
+    now[0] += 59
+    assert cache.get_or_compute("m", "q", compute) == [1]
+    now[0] += 2
+    assert cache.get_or_compute("m", "q", compute) == [2]
+    assert cache.stats()["expirations"] == 1
+
+
+def test_lru_eviction():
+    cache = QueryEmbeddingCache(max_size=2)
+    for q in ("a", "b", "a", "c"):
+        cache.get_or_compute("m", q, lambda q: [ord(q)])
+    assert cache.stats()["evictions"] == 1
+    calls = []
+    cache.get_or_compute("m", "a", lambda q: calls.append(q) or [0])
+    cache.get_or_compute("m", "b", lambda q: calls.append(q) or [0])
+    assert calls == ["b"]
+
+
+def test_concurrent_misses_are_coalesced():
+    cache = QueryEmbeddingCache()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute(q):
+        calls.append(q)
+        started.set()
+        release.wait(5)
+        return [42.0]
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("m", "q", compute)))
+               for _ in range(8)]
+    threads[0].start()
+    started.wait(5)
+    for t in threads[1:]:
+        t.start()
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert calls == ["q"]
+    assert results == [[42.0]] * 8
+    stats = cache.stats()
+    assert (stats["misses"], stats["hits"]) == (1, 7)
+
+
+def test_failed_compute_releases_waiters():
+    cache = QueryEmbeddingCache()
+
+    def boom(q):
+        raise RuntimeError("modèle indisponible")
+
+    try:
+        cache.get_or_compute("m", "q", boom)
+    except RuntimeError:
+        pass
+    assert cache.get_or_compute("m", "q", lambda q: [1.0]) == [1.0]
+
+
+def test_cached_query_embeddings_uses_model_key():
+    class Model:
+        model_name = "fake"
+
+        def __init__(self):
+            self.calls = 0
+
+        def embed_query(self, text):
+            self.calls += 1
+            return [0.5]
+
+    model = Model()
+    embeddings = CachedQueryEmbeddings(QueryEmbeddingCache(), model_getter=lambda: model)
+    assert embeddings.embed_query("q") == embeddings.embed_query("q ") == [0.5]
+    assert model.calls == 1
@@ -0,0 +1,54 @@
+import numpy as np
+
+from pipelines.rerank_cascade import CascadeReranker
+
+
+class FakeService:
+    """Scores fixés par texte, appels enregistrés (un appel = un tour)."""
+
+    def __init__(self, scores):
+        self.scores = scores
+        self.calls = []
+
+    def score(self, query, texts):
+        self.calls.append(list(texts))
+        return np.array([self.scores[t] for t in texts], dtype=np.float32)
+
+    def model_ms_per_pair(self):
+        return 1.0
+
+
+def passages(n):
+    return [{"text": f"p{i}", "rrf_score": 1.0 / (i + 1)} for i in range(n)]
+
+
+def test_early_exit_when_new_round_stays_below_kth():
+    scores = {f"p{i}": 10.0 - i for i in range(20)}
+    service = FakeService(scores)
+    cascade = CascadeReranker(band=12, step=2, margin=1.0, service=service, light_service=None)
+    reranked, stats = cascade.rerank("q", passages(20), top_k=3)
+    # Tour 1 : p0..p2 ; tour 2 : p3, p4 (meilleur 7 <= k-ième 8 - 1) -> arrêt
+    assert service.calls == [["p0", "p1", "p2"], ["p3", "p4"]]
+    assert stats["early_exit"] and stats["rounds"] == 2 and stats["scored"] == 5
+    assert stats["cutoff_rate"] == 0.75
+    assert [p["text"] for p in reranked] == ["p0", "p1", "p2"]
+    assert all("rerank_score" in p for p in reranked)
+
+
+def test_no_early_exit_scores_whole_band():
+    # Les meilleurs passages arrivent tard dans l'ordre du premier étage
+    scores = {f"p{i}": float(i) for i in range(20)}
+    service = FakeService(scores)
+    cascade = CascadeReranker(band=8, step=2, margin=1.0, service=service, light_service=None)
+    reranked, stats = cascade.rerank("q", passages(20), top_k=3)
+    assert not stats["early_exit"] and stats["scored"] == 8
+    assert [p["text"] for p in reranked] == ["p7", "p6", "p5"]
+
+
+def test_estimate_counts_extra_round_waits():
+    service = FakeService({f"p{i}": 10.0 - i for i in range(20)})
+    cascade = CascadeReranker(band=12, step=2, margin=1.0, service=service, light_service=None)
+    stats = {"candidates": 20, "band": 12, "scored": 5, "rounds": 2, "early_exit": True}
+    # 5 ms de modèle + 2 x 10 ms d'attente de lot : le second tour coûte 10 ms
+    stats = cascade._finish(stats, first_ms=0.0, full_ms=25.0)
+    assert stats["est_saved_ms"] == 15 * 1.0 - 10.0
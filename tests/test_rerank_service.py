@@ -0,0 +1,100 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from pipelines.rerank_service import RerankService
+
+
+class FakeReranker:
+    """Score = longueur du passage ; échoue sur un passage "BOOM"."""
+
+    def __init__(self, gate=None):
+        self.calls = []
+        self.gate = gate
+        self.entered = threading.Event()
+
+    def score_pairs(self, queries, texts):
+        self.entered.set()
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.calls.append(list(zip(queries, texts)))
+        if "BOOM" in texts:
+            raise RuntimeError("paire invalide")
+        return np.array([len(t) for t in texts], dtype=np.float32)
+
+
+@pytest.fixture
+def service():
+    services = []
+
+    def make(model, **kwargs):
+        s = RerankService(model_getter=lambda: model, **kwargs)
+        services.append(s)
+        return s
+
+    yield make
+    for s in services:
+        s.stop(timeout=5)
+
+
+def test_concurrent_requests_share_one_batch(service):
+    gate = threading.Event()
+    model = FakeReranker(gate)
+    rerank = service(model, max_pairs=64, max_wait_ms=0)
+    # Le premier lot bloque le modèle : les requêtes suivantes s'accumulent en file
+    first = rerank.submit("q0", ["a"])
+    model.entered.wait(5)
+    futures = [rerank.submit(f"q{i}", ["xx", "yyy"]) for i in range(1, 5)]
+    gate.set()
+    assert list(first.result(5)) == [1]
+    for f in futures:
+        assert list(f.result(5)) == [2, 3]
+    assert len(model.calls) == 2
+    # Le second lot mélange les questions, chaque appelant reçoit ses scores
+    assert [q for q, _ in model.calls[1]] == ["q1", "q1", "q2", "q2", "q3", "q3", "q4", "q4"]
+    stats = rerank.stats()
+    assert stats["batches"] == 2 and stats["requests"] == 5 and stats["pairs"] == 9
+
+
+def test_batch_respects_max_pairs(service):
+    gate = threading.Event()
+    model = FakeReranker(gate)
+    rerank = service(model, max_pairs=4, max_wait_ms=0)
+    blocker = rerank.submit("q", ["a"])
+    model.entered.wait(5)
+    futures = [rerank.submit("q", ["bb", "cc"]) for _ in range(3)]
+    gate.set()
+    blocker.result(5)
+    for f in futures:
+        f.result(5)
+    # Jamais plus de 4 paires par lot, une requête n'est pas coupée
+    assert [len(call) for call in model.calls] == [1, 4, 2]
+
+
+def test_failure_only_fails_the_faulty_request(service):
+    gate = threading.Event()
+    model = FakeReranker(gate)
+    rerank = service(model, max_wait_ms=0)
+    blocker = rerank.submit("q", ["a"])
+    model.entered.wait(5)
+    good = rerank.submit("q", ["bien", "ok"])
+    bad = rerank.submit("q", ["BOOM"])
+    other = rerank.submit("q", ["encore"])
+    gate.set()
+    blocker.result(5)
+    assert list(good.result(5)) == [4, 2]
+    assert list(other.result(5)) == [6]
+    with pytest.raises(RuntimeError, match="paire invalide"):
+        bad.result(5)
+    assert rerank.stats()["errors"] == 1
+
+
+def test_arerank_sorts_and_annotates(service):
+    rerank = service(FakeReranker(), max_wait_ms=0)
+    passages = [{"text": "court"}, {"text": "nettement plus long"}, {"text": "moyen."}]
+    ranked = asyncio.run(rerank.arerank("q", passages, top_k=2))
+    assert [p["text"] for p in ranked] == ["nettement plus long", "moyen."]
+    assert ranked[0]["rerank_score"] == 19.0
+    assert list(rerank.score("q", [])) == []
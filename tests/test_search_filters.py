@@ -0,0 +1,75 @@
+import sqlite3
+
+import pytest
+from qdrant_client.models import MatchAny, MatchValue, Range
+
+from pipelines.keyword_index import KeywordIndex
+from pipelines.keyword_search import WhooshSearcher
+from pipelines.search_filters import normalize_filters, to_qdrant_filter, to_sql_where
+
+
+def test_normalize_filters_canonical_forms():
+    assert normalize_filters(None) == {}
+    assert normalize_filters({"ext": ".PDF", "filename": ["a.pdf"], "page": {"gte": 2}}) == {
+        "ext": "pdf", "filename": "a.pdf", "page": {"gte": 2},
+    }
+
+
+@pytest.mark.parametrize("filters", [
+    {"unknown": "x"},
+    {"page": "2"},
+    {"ocr": "yes"},
+    {"ext": {"gte": 1}},
+    {"filename": []},
+])
+def test_normalize_filters_rejects_invalid(filters):
+    with pytest.raises(ValueError):
+        normalize_filters(filters)
+
+
+def test_to_qdrant_filter():
+    assert to_qdrant_filter({}) is None
+    flt = to_qdrant_filter(normalize_filters({"ext": "pdf", "doc_id": ["a", "b"], "page": {"gte": 2}, "ocr": False}))
+    must = {c.key: c for c in flt.must}
+    assert must["metadata.ext"].match == MatchValue(value="pdf")
+    assert must["metadata.doc_id"].match == MatchAny(any=["a", "b"])
+    assert must["metadata.page"].range == Range(gte=2)
+    # ocr=False : absent ou faux
+    assert [c.key for c in flt.must_not] == ["metadata.ocr"]
+
+
+def test_to_sql_where(chunks):
+    import json
+
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE points (id TEXT, doc_id TEXT, payload TEXT)")
+    conn.executemany(
+        "INSERT INTO points VALUES (?, ?, ?)",
+        [(f"{c['metadata']['doc_id']}{c['metadata']['chunk_index']}", c["metadata"]["doc_id"], json.dumps(c))
+         for c in chunks],
+    )
+
+    def ids(filters):
+        where, params = to_sql_where(normalize_filters(filters), {"doc_id": "doc_id"})
+        return sorted(r for (r,) in conn.execute(f"SELECT id FROM points WHERE {where}", params))
+
+    assert ids({"doc_id": "a"}) == ["a0", "a1"]
+    assert ids({"ext": ["xlsx"], "sheet": "2025"}) == ["b1"]
+    assert ids({"page": {"gt": 1}}) == ["a1"]
+    assert ids({"ocr": True}) == ["a1"]
+    assert ids({"ocr": False}) == ["a0", "b0", "b1"]
+
+
+def test_to_whoosh_query(tmp_path, chunks):
+    index = KeywordIndex(str(tmp_path / "whoosh"))
+    index.upsert(chunks, [f"{c['metadata']['doc_id']}{c['metadata']['chunk_index']}" for c in chunks])
+    searcher = WhooshSearcher(str(tmp_path / "whoosh"), refresh_interval=0)
+
+    def ids(query, filters):
+        return sorted(h["id"] for h in searcher.search(query, filters=filters))
+
+    assert ids("résiliation", None) == ["a0", "b1"]
+    assert ids("résiliation", {"ext": "pdf"}) == ["a0"]
+    assert ids("facture", {"sheet": ["2024", "2023"]}) == ["b0"]
+    assert ids("loyer OR contrat", {"page": {"gte": 2}}) == ["a1"]
+    assert ids("loyer OR contrat", {"ocr": False}) == ["a0"]
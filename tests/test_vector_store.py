@@ -0,0 +1,51 @@
+import pytest
+from qdrant_client import QdrantClient
+
+from pipelines.vector_store import NumpyStore, QdrantStore
+from pipelines.vectorize import chunk_point_id
+from tests.conftest import make_chunk
+
+# Un axe par chunk (cf. fixture ``chunks``) : la requête [1, 0.5, 0, 0] classe a0 puis a1
+VECTORS = [[1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 1, 0], [0, 0, 0, 1]]
+
+
+@pytest.fixture(params=["numpy", "qdrant"])
+def store(request, tmp_path):
+    if request.param == "numpy":
+        store = NumpyStore(str(tmp_path / "numpy"))
+    else:
+        store = QdrantStore(QdrantClient(location=":memory:"), local=True)
+    store.ensure_collection(4)
+    yield store
+    store.close()
+
+
+def test_search_ranks_by_cosine(store, chunks):
+    store.upsert(chunks, VECTORS)
+    hits = store.search([1, 0.5, 0, 0], top_k=2)
+    assert [h["id"] for h in hits] == [chunk_point_id("a", 0), chunk_point_id("a", 1)]
+    assert hits[0]["score"] == pytest.approx(1 / 1.25 ** 0.5, rel=1e-5)
+    assert hits[0]["text"] == "résiliation du contrat de bail"
+    assert hits[0]["metadata"]["filename"] == "bail.pdf"
+
+
+def test_search_applies_filters(store, chunks):
+    store.upsert(chunks, VECTORS)
+    query = [1, 1, 1, 1]
+
+    def ids(filters):
+        return sorted(h["id"] for h in store.search(query, top_k=10, filters=filters))
+
+    assert ids({"ext": "xlsx"}) == sorted([chunk_point_id("b", 0), chunk_point_id("b", 1)])
+    assert ids({"page": {"gte": 2}}) == [chunk_point_id("a", 1)]
+    assert ids({"ocr": False, "doc_id": "a"}) == [chunk_point_id("a", 0)]
+    assert ids({"sheet": ["2025", "2030"]}) == [chunk_point_id("b", 1)]
+
+
+def test_upsert_overwrites_and_delete_stale(store, chunks):
+    store.upsert(chunks, VECTORS)
+    store.upsert([make_chunk("a", 0, "nouvelle version")], [[0, 0, 0, 1]])
+    store.delete_stale("a", 1)
+    assert store.count() == 3
+    hits = store.search([0, 0, 0, 1], top_k=2)
+    assert {h["text"] for h in hits} == {"nouvelle version", "facture de résiliation anticipée"}